@@ -0,0 +1,327 @@
+import heapq
+import json
+import os
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, date, timedelta
+from collections import Counter
+from functools import lru_cache
+from operator import itemgetter
+from Almacenamiento import escribir_atomico
+
+np = None  # NumPy se importa recién cuando hay un cálculo grande (ver usar_numpy)
+
+PERIODOS = ('dia', 'semana', 'mes', 'año')
+MINIMO_COLUMNAR = 5000  # A partir de cuántos registros conviene calcular con NumPy
+VERSION = 2  # Cambia cuando cambia lo que se guarda en los archivos .agregados
+
+def sumar(contador, clave, valor):
+    contador[clave] += valor
+    if valor < 0 and abs(contador[clave]) < 1e-9:
+        del contador[clave]  # Al eliminar registros no se dejan claves en cero
+
+@lru_cache(maxsize=None)
+def claves_periodo(fecha_str):
+    """Interpreta la fecha una sola vez y devuelve sus claves de día, semana, mes y año."""
+    fecha = datetime.strptime(fecha_str, '%Y-%m-%d')
+    return (fecha.date(), fecha.strftime('%Y-%U'), fecha.strftime('%Y-%m'), fecha.year)
+
+class Agregados:
+    """Totales por día, semana, mes y año de una colección (ventas, pagos o envíos), calculados en una sola pasada."""
+    def __init__(self, tipo, registros=()):
+        self.tipo = tipo
+        self.totales = {periodo: Counter() for periodo in PERIODOS}
+        self.productos = Counter()  # Solo para ventas: nombre del producto -> cantidad vendida
+        self.clientes = Counter()  # Solo para ventas: cédula/RIF -> número de compras
+        # Los mismos contadores de ventas separados por día, para consultar rangos de fechas
+        self.productos_por_dia = {}
+        self.clientes_por_dia = {}
+        self.dias = []  # Días con ventas, ordenados
+        for registro in registros:
+            self.agregar(registro)
+
+    def valor(self, registro):
+        if self.tipo == 'ventas':
+            return registro['totales']['total']
+        if self.tipo == 'pagos':
+            return registro['monto']
+        return 1  # Los envíos se cuentan
+
+    def agregar(self, registro, signo=1):
+        """Suma el registro a los totales; con signo=-1 lo descuenta (al eliminarlo)."""
+        valor = signo * self.valor(registro)
+        for periodo, clave in zip(PERIODOS, claves_periodo(registro['fecha'])):
+            sumar(self.totales[periodo], clave, valor)
+        if self.tipo == 'ventas':
+            dia = claves_periodo(registro['fecha'])[0]
+            productos_dia, clientes_dia = self.contadores_dia(dia)
+            for producto, cantidad in registro['productos']:
+                sumar(self.productos, producto, signo * cantidad)
+                sumar(productos_dia, producto, signo * cantidad)
+            sumar(self.clientes, registro['cliente']['cedula_rif'], signo)
+            sumar(clientes_dia, registro['cliente']['cedula_rif'], signo)
+            if not productos_dia and not clientes_dia:
+                del self.productos_por_dia[dia], self.clientes_por_dia[dia]
+                del self.dias[bisect_left(self.dias, dia)]
+
+    def contadores_dia(self, dia):
+        if dia not in self.productos_por_dia:
+            self.productos_por_dia[dia] = Counter()
+            self.clientes_por_dia[dia] = Counter()
+            insort(self.dias, dia)
+        return self.productos_por_dia[dia], self.clientes_por_dia[dia]
+
+    def mas_frecuentes(self, que, k=10, desde=None, hasta=None, incluir=None):
+        """Los k productos (que='productos') o clientes (que='clientes') con más ventas entre desde y hasta (inclusive).
+
+        Se suman solo los contadores de los días del rango y se eligen los k mayores con un montículo;
+        incluir, si se da, filtra las claves (por ejemplo, productos de una categoría).
+        """
+        total, por_dia = (self.productos, self.productos_por_dia) if que == 'productos' else (self.clientes, self.clientes_por_dia)
+        if not self.dias:
+            return []
+        if (desde is None or desde <= self.dias[0]) and (hasta is None or hasta >= self.dias[-1]):
+            contador = total  # El rango cubre todas las ventas
+        else:
+            inicio = bisect_left(self.dias, desde) if desde is not None else 0
+            fin = bisect_right(self.dias, hasta) if hasta is not None else len(self.dias)
+            contador = Counter()
+            for dia in self.dias[inicio:fin]:
+                contador.update(por_dia[dia])
+        pares = contador.items() if incluir is None else (par for par in contador.items() if incluir(par[0]))
+        return heapq.nlargest(k, pares, key=itemgetter(1))
+
+    def por_periodo(self, periodo):
+        if periodo not in self.totales:
+            raise ValueError("Periodo no válido.")
+        return Counter(self.totales[periodo])
+
+    def a_dict(self):
+        """Representación JSON; las claves se guardan como listas [clave, valor] para conservar su tipo y orden."""
+        return {
+            'tipo': self.tipo,
+            'totales': {
+                periodo: [[clave.isoformat() if periodo == 'dia' else clave, valor] for clave, valor in contador.items()]
+                for periodo, contador in self.totales.items()
+            },
+            'productos': list(map(list, self.productos.items())),
+            'clientes': list(map(list, self.clientes.items())),
+            'por_dia': [
+                [dia.isoformat(), list(map(list, self.productos_por_dia[dia].items())), list(map(list, self.clientes_por_dia[dia].items()))]
+                for dia in self.dias
+            ],
+        }
+
+    @classmethod
+    def desde_dict(cls, datos):
+        agregados = cls(datos['tipo'])
+        for periodo, pares in datos['totales'].items():
+            agregados.totales[periodo] = Counter({
+                date.fromisoformat(clave) if periodo == 'dia' else clave: valor for clave, valor in pares
+            })
+        agregados.productos = Counter(dict(datos['productos']))
+        agregados.clientes = Counter(dict(datos['clientes']))
+        for dia, productos, clientes in datos['por_dia']:
+            dia = date.fromisoformat(dia)
+            agregados.productos_por_dia[dia] = Counter(dict(productos))
+            agregados.clientes_por_dia[dia] = Counter(dict(clientes))
+            agregados.dias.append(dia)
+        return agregados
+
+def agrupar(codigos, pesos=None):
+    """Suma los pesos por código con NumPy. Devuelve los códigos y sus sumas en orden de primera aparición."""
+    unicos, primeros, inversos = np.unique(codigos, return_index=True, return_inverse=True)
+    sumas = np.bincount(inversos, weights=pesos, minlength=len(unicos))
+    orden = np.argsort(primeros, kind='stable')
+    return unicos[orden], sumas[orden]
+
+def factorizar(valores):
+    """Asigna a cada valor un código entero según su orden de primera aparición."""
+    codigos = {}
+    return np.array([codigos.setdefault(valor, len(codigos)) for valor in valores], dtype=np.int64), list(codigos)
+
+class AgregadosColumnares(Agregados):
+    """Agregados calculados con NumPy sobre columnas (fechas, valores y códigos de producto y cliente)."""
+    def __init__(self, tipo, registros=()):
+        registros = list(registros)
+        super().__init__(tipo)
+        if not registros:
+            return
+
+        fechas = np.array([registro['fecha'] for registro in registros], dtype='datetime64[D]')
+        valores = np.array([self.valor(registro) for registro in registros], dtype=np.float64)
+        dias = fechas.astype(np.int64)  # Días desde 1970-01-01
+        anios = fechas.astype('datetime64[Y]')
+        inicio_anio = anios.astype('datetime64[D]').astype(np.int64)
+        # Semana como en '%U': el domingo inicia la semana y los días antes del primer domingo son la semana 0
+        dia_semana = (dias + 4) % 7  # 1970-01-01 fue jueves; 0 = domingo
+        semanas = (dias - inicio_anio + 7 - dia_semana) // 7
+        anios = anios.astype(np.int64) + 1970
+
+        codigos = {
+            'dia': dias,
+            'semana': anios * 100 + semanas,
+            'mes': fechas.astype('datetime64[M]').astype(np.int64),
+            'año': anios,
+        }
+        convertir = {
+            'dia': lambda codigo: date(1970, 1, 1) + timedelta(days=int(codigo)),
+            'semana': lambda codigo: f"{codigo // 100}-{codigo % 100:02d}",
+            'mes': lambda codigo: f"{1970 + codigo // 12}-{codigo % 12 + 1:02d}",
+            'año': int,
+        }
+        for periodo in PERIODOS:
+            unicos, sumas = agrupar(codigos[periodo], valores)
+            if self.tipo == 'envios':
+                sumas = sumas.astype(np.int64)
+            self.totales[periodo] = Counter({convertir[periodo](int(codigo)): suma.item() for codigo, suma in zip(unicos, sumas)})
+
+        if self.tipo == 'ventas':
+            lineas = [linea for registro in registros for linea in registro['productos']]
+            codigos_productos, nombres = factorizar(nombre for nombre, _ in lineas)
+            cantidades = np.bincount(codigos_productos, weights=[cantidad for _, cantidad in lineas], minlength=len(nombres))
+            self.productos = Counter(dict(zip(nombres, (round(cantidad) for cantidad in cantidades.tolist()))))
+            codigos_clientes, clientes = factorizar(registro['cliente']['cedula_rif'] for registro in registros)
+            self.clientes = Counter(dict(zip(clientes, np.bincount(codigos_clientes).tolist())))
+
+            # Contadores por día: se agrupa por el par (día, código) combinado en un solo entero
+            primer_dia = int(dias.min())
+            dias_lineas = np.repeat(dias, [len(registro['productos']) for registro in registros])
+            for claves, codigos_dia, dias_codigo, pesos, por_dia in (
+                (nombres, codigos_productos, dias_lineas, [cantidad for _, cantidad in lineas], self.productos_por_dia),
+                (clientes, codigos_clientes, dias, None, self.clientes_por_dia),
+            ):
+                combinados = (dias_codigo - primer_dia) * len(claves) + codigos_dia
+                unicos, sumas = agrupar(combinados, pesos)
+                for codigo, suma in zip(unicos.tolist(), sumas.tolist()):
+                    dia = date(1970, 1, 1) + timedelta(days=primer_dia + codigo // len(claves))
+                    if dia not in self.productos_por_dia:
+                        self.productos_por_dia[dia] = Counter()
+                        self.clientes_por_dia[dia] = Counter()
+                    por_dia[dia][claves[codigo % len(claves)]] = round(suma)
+            self.dias = sorted(self.productos_por_dia)
+
+def usar_numpy():
+    """Importa NumPy la primera vez que hace falta; es opcional, sin él se usa el cálculo en Python puro."""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+        np = numpy
+    return True
+
+def se_puede_agregar(tipo, registro):
+    """Si el registro tiene fecha y valor válidos; los gestores omiten (y conservan tal cual) los que no."""
+    try:
+        claves_periodo(registro['fecha'])
+        valor = 1 if tipo == 'envios' else (registro['totales']['total'] if tipo == 'ventas' else registro['monto'])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+def calcular_agregados(tipo, registros):
+    registros = [registro for registro in registros if se_puede_agregar(tipo, registro)]
+    if len(registros) >= MINIMO_COLUMNAR and usar_numpy():
+        return AgregadosColumnares(tipo, registros)
+    return Agregados(tipo, registros)
+
+# Los agregados de cada colección se guardan junto a sus datos: una instantánea (<archivo>.agregados) con la
+# firma del almacenamiento a la que corresponde, y un diario (<archivo>.agregados.diario) con los registros
+# agregados o eliminados después, una línea por cambio. Registrar un cambio solo agrega su línea al diario;
+# cuando el diario pasa de MAXIMO_DIARIO se vuelca en la instantánea. Si los datos cambiaron por otra vía
+# (la firma no coincide), los agregados se recalculan.
+MAXIMO_DIARIO = 256 * 1024  # Bytes
+_cache = {}  # archivo -> (firma, agregados)
+
+def como_json(valor):
+    return [como_json(parte) for parte in valor] if isinstance(valor, (tuple, list)) else valor
+
+def firma_actual(almacen):
+    """La firma del almacenamiento como queda guardada en JSON (listas en vez de tuplas), para poder compararlas."""
+    return como_json(almacen.firma())
+
+def leer_agregados(archivo):
+    """La instantánea guardada, como (firma, agregados), con los cambios del diario ya aplicados."""
+    try:
+        with open(archivo + '.agregados', 'r', encoding='utf-8') as f:
+            datos = json.load(f)
+        if datos.get('version') != VERSION:
+            return None
+        firma, agregados = datos['firma'], Agregados.desde_dict(datos['agregados'])
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+    try:
+        with open(archivo + '.agregados.diario', 'r', encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    cambio = json.loads(linea)
+                except ValueError:
+                    break  # Escritura interrumpida: lo que sigue no se puede aplicar
+                # Un cambio que no sigue al estado actual ya estaba en la instantánea (se volcó el diario mientras
+                # otra instancia escribía), o falta uno anterior: entonces la firma final no coincidirá
+                if cambio['previa'] != firma:
+                    continue
+                for registro in cambio['registros']:
+                    agregados.agregar(registro, cambio['signo'])
+                firma = cambio['firma']
+    except FileNotFoundError:
+        pass
+    return firma, agregados
+
+def guardar_agregados(archivo, firma, agregados):
+    """Escribe la instantánea completa y vacía el diario."""
+    _cache[archivo] = (firma, agregados)
+    datos = json.dumps({'version': VERSION, 'firma': firma, 'agregados': agregados.a_dict()}, ensure_ascii=False)
+    escribir_atomico(archivo + '.agregados', datos.encode('utf-8'))
+    try:
+        os.remove(archivo + '.agregados.diario')
+    except FileNotFoundError:
+        pass
+
+def obtener_agregados(almacen, tipo):
+    """Devuelve los agregados de la colección sin recorrer sus datos, salvo que estén desactualizados."""
+    archivo = almacen.archivo
+    firma = firma_actual(almacen)
+    en_cache = _cache.get(archivo)
+    if en_cache is not None and en_cache[0] == firma:
+        return en_cache[1]
+
+    guardados = leer_agregados(archivo)
+    if guardados is not None and guardados[0] == firma:
+        _cache[archivo] = guardados
+        return guardados[1]
+
+    agregados = calcular_agregados(tipo, almacen.cargar())
+    guardar_agregados(archivo, firma, agregados)
+    return agregados
+
+def registrar_cambio(almacen, tipo, registro, signo, firma_previa):
+    """Actualiza los agregados guardados después de que un gestor agregó (signo 1) o eliminó (signo -1) un registro."""
+    registrar_cambios(almacen, tipo, [registro], signo, firma_previa)
+
+def registrar_cambios(almacen, tipo, registros, signo, firma_previa):
+    """Como registrar_cambio, para varios registros guardados en un mismo cambio del almacenamiento.
+
+    firma_previa es firma_actual(almacen) antes del cambio. El costo es el de anotar estos registros en el
+    diario, no el de reescribir los agregados. Si firma_previa es None (el cambio reescribe más que estos
+    registros), los agregados se recalcularán completos en la próxima consulta.
+    """
+    archivo = almacen.archivo
+    en_cache = _cache.pop(archivo, None)
+    if firma_previa is None:
+        return
+    firma = firma_actual(almacen)
+    linea = json.dumps({'previa': firma_previa, 'firma': firma, 'signo': signo, 'registros': registros},
+                       ensure_ascii=False, default=str) + '\n'
+    with open(archivo + '.agregados.diario', 'ab') as f:
+        f.write(linea.encode('utf-8'))
+        tamano = f.tell()
+    if en_cache is not None and en_cache[0] == firma_previa:
+        for registro in registros:
+            en_cache[1].agregar(registro, signo)
+        _cache[archivo] = (firma, en_cache[1])
+    if tamano > MAXIMO_DIARIO:
+        agregados = obtener_agregados(almacen, tipo)
+        if os.path.exists(archivo + '.agregados.diario'):  # Si se recalcularon, ya se guardaron completos
+            guardar_agregados(archivo, firma, agregados)
@@ -0,0 +1,1054 @@
+import codecs
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from contextlib import ExitStack, contextmanager
+
+try:
+    import fcntl
+except ImportError:  # En Windows no hay fcntl: los bloqueos de archivo solo protegen entre hilos del mismo proceso
+    fcntl = None
+
+# Motor de almacenamiento: 'json' reescribe el archivo completo en cada cambio,
+# 'diario' agrega una línea por cambio y compacta cada cierto número de cambios,
+# 'sqlite' guarda todas las colecciones en una base de datos (TIENDA_BD).
+ALMACENAMIENTO = os.environ.get("TIENDA_ALMACENAMIENTO", "json")
+COMPACTAR_CADA = int(os.environ.get("TIENDA_COMPACTAR_CADA", "1000"))
+BASE_DATOS = os.environ.get("TIENDA_BD", "tienda.db")
+# Registro de la transacción en curso con los almacenamientos de archivos (ver confirmar_transaccion)
+ARCHIVO_TRANSACCIONES = os.environ.get("TIENDA_TRANSACCIONES", "transacciones.wal")
+# Formato de los archivos: 'json' (un arreglo) o 'jsonl' (un registro por línea). Al leer se reconocen ambos.
+FORMATO = os.environ.get("TIENDA_FORMATO", "json")
+TAMANO_BLOQUE = 1 << 16  # Bytes que se leen de una vez al cargar un archivo
+BLOQUE_IDS = 100  # Ids que se reservan de una vez; los que no se usen antes de cerrar se saltan
+# Modo multiproceso (TIENDA_MULTIPROCESO=1): varias instancias de la tienda trabajan sobre los mismos datos.
+# Cada escritura se hace con la colección bloqueada, aumenta su generación y deja sus cambios en un
+# registro, del que las demás instancias los toman sin recargar todo (ver Generaciones y Vigilante).
+MULTIPROCESO = os.environ.get("TIENDA_MULTIPROCESO", "") == "1"
+INTERVALO_VIGILANCIA = float(os.environ.get("TIENDA_INTERVALO_VIGILANCIA", "0.5"))  # Segundos entre revisiones
+GENERACIONES_REGISTRADAS = 1000  # Generaciones que guarda el registro de cambios; quien se atrase más recarga todo
+REINTENTOS_CONFLICTO = 30
+INSTANCIA = f"{os.getpid()}-{os.urandom(4).hex()}"  # Identifica en el registro los cambios de esta instancia
+
+# Colecciones de la tienda: archivo JSON -> campo que identifica cada registro (None = por posición)
+COLECCIONES = {
+    "productos.json": "id",
+    "clientes.json": "cedula_rif",
+    "ventas.json": "id",
+    "pagos.json": "id",
+    "envios.json": "id",
+}
+
+# Columnas indexadas de cada tabla en SQLite: columna -> ruta dentro del registro
+COLUMNAS_SQLITE = {
+    "productos": {"name": ("name",), "category": ("category",)},
+    "clientes": {"cedula_rif": ("cedula_rif",), "correo_electronico": ("correo_electronico",)},
+    "ventas": {"cedula_rif": ("cliente", "cedula_rif"), "fecha": ("fecha",)},
+    "pagos": {"cedula_rif": ("cliente", "cedula_rif"), "fecha": ("fecha",)},
+    "envios": {"orden_compra": ("orden_compra",), "fecha": ("fecha",)},
+}
+
+
+def escribir_atomico(archivo, datos):
+    """Escribe los bytes en un archivo temporal y lo renombra, para no dejar el archivo a medias."""
+    temporal = archivo + ".tmp"
+    with open(temporal, "wb") as f:
+        f.write(datos)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, archivo)
+
+
+_ESPACIOS = re.compile(r"[ \t\r\n]*")
+
+
+def leer_registros(archivo, tamano_bloque=TAMANO_BLOQUE):
+    """Lee los registros de un arreglo JSON (o de un archivo JSON Lines) de a uno.
+
+    El archivo se decodifica por bloques, así que en memoria solo hay un bloque y el registro
+    que se está leyendo, no el archivo completo ni la lista entera de registros.
+    """
+    decodificador = json.JSONDecoder()
+    with open(archivo, "rb") as f:
+        texto_utf8 = codecs.getincrementaldecoder("utf-8")()
+        texto = texto_utf8.decode(f.read(tamano_bloque))
+        posicion = _ESPACIOS.match(texto).end()
+        if texto[posicion:posicion + 1] != "[":
+            # JSON Lines: un registro por línea
+            f.seek(0)
+            for linea in f:
+                if linea.strip():
+                    yield json.loads(linea)
+            return
+
+        posicion += 1
+        fin_archivo = False
+        esperando_coma = False
+        despues_de_coma = False
+        while True:
+            posicion = _ESPACIOS.match(texto, posicion).end()
+            if posicion < len(texto):
+                caracter = texto[posicion]
+                if caracter == "]" and not despues_de_coma:
+                    return
+                if esperando_coma:
+                    if caracter != ",":
+                        raise json.JSONDecodeError("Se esperaba ',' o ']'", texto, posicion)
+                    posicion += 1
+                    esperando_coma = False
+                    despues_de_coma = True
+                    continue
+                try:
+                    registro, fin = decodificador.raw_decode(texto, posicion)
+                except json.JSONDecodeError:
+                    if fin_archivo:
+                        raise
+                else:
+                    # Un valor cortado por el final del bloque (un número, por ejemplo) puede decodificarse
+                    # a medias; solo se acepta si lo que sigue es el separador
+                    siguiente = _ESPACIOS.match(texto, fin).end()
+                    if fin_archivo or texto[siguiente:siguiente + 1] in (",", "]"):
+                        yield registro
+                        posicion = fin
+                        esperando_coma = True
+                        despues_de_coma = False
+                        continue
+            elif fin_archivo:
+                raise json.JSONDecodeError("Arreglo JSON incompleto", texto, posicion)
+
+            # Hace falta más texto: se descarta lo ya leído y se agrega otro bloque (más grande si el registro no cabe)
+            bloque = f.read(max(tamano_bloque, len(texto) - posicion))
+            fin_archivo = not bloque
+            texto = texto[posicion:] + texto_utf8.decode(bloque, final=fin_archivo)
+            posicion = 0
+
+
+def crc_archivo(archivo, tamano_bloque=TAMANO_BLOQUE):
+    """CRC del contenido del archivo, calculado por bloques."""
+    crc = 0
+    with open(archivo, "rb") as f:
+        for bloque in iter(lambda: f.read(tamano_bloque), b""):
+            crc = zlib.crc32(bloque, crc)
+    return crc
+
+
+class Conflicto(Exception):
+    """Otra instancia guardó cambios que chocan con los que se intentaba guardar (ver Generaciones.verificar)."""
+
+
+class BloqueoArchivo:
+    """Bloqueo exclusivo de un archivo de datos entre hilos y, con fcntl, entre procesos (flock sobre
+    <archivo>.lock). Es reentrante: el hilo que lo tiene puede volver a tomarlo."""
+
+    def __init__(self, archivo):
+        self.ruta = archivo + ".lock"
+        self.hilos = threading.RLock()
+        self.nivel = 0
+        self.descriptor = None
+
+    def __enter__(self):
+        self.hilos.acquire()
+        self.nivel += 1
+        if self.nivel == 1 and fcntl is not None:
+            try:
+                self.descriptor = open(self.ruta, "a")
+                fcntl.flock(self.descriptor, fcntl.LOCK_EX)
+            except BaseException:
+                self.soltar()
+                raise
+        return self
+
+    def __exit__(self, *error):
+        self.soltar()
+
+    def soltar(self):
+        self.nivel -= 1
+        if self.nivel == 0 and self.descriptor is not None:
+            self.descriptor.close()  # Al cerrar el archivo se libera el flock
+            self.descriptor = None
+        self.hilos.release()
+
+
+_bloqueos_archivos = {}
+_bloqueo_bloqueos = threading.Lock()
+
+
+def bloqueo_archivo(archivo):
+    """El BloqueoArchivo del archivo; uno solo por ruta en cada proceso, para que sea reentrante."""
+    ruta = os.path.abspath(archivo)
+    with _bloqueo_bloqueos:
+        if ruta not in _bloqueos_archivos:
+            _bloqueos_archivos[ruta] = BloqueoArchivo(ruta)
+        return _bloqueos_archivos[ruta]
+
+
+def reintentar(operacion, *gestores):
+    """Ejecuta operacion(); si otra instancia guardó antes algo que choca (Conflicto), aplica en los gestores
+    los cambios ajenos con refrescar y la vuelve a intentar. operacion debe deshacer en memoria lo que hizo
+    antes de dejar pasar el Conflicto. Sin modo multiproceso no hay conflictos y es una llamada directa."""
+    for intento in range(REINTENTOS_CONFLICTO):
+        try:
+            return operacion()
+        except Conflicto:
+            if intento == REINTENTOS_CONFLICTO - 1:
+                raise
+            # Con muchas instancias escribiendo se espera un poco más en cada intento, y al azar para que
+            # las que chocaron no vuelvan a intentar todas a la vez; después se refresca, justo antes de reintentar
+            time.sleep(random.uniform(0, 0.002 * (intento + 1)))
+            for gestor in gestores:
+                gestor.refrescar()
+
+
+def cambios_ajenos(entradas, desde, hasta, instancia):
+    """Cambios de otras instancias en las generaciones desde+1 ... hasta, en orden.
+
+    entradas son las (generación, instancia, cambios) del registro. Devuelve None si falta alguna
+    generación (ya no está en el registro, o la escribió alguien sin registrarla) o si alguna
+    reescribió la colección completa: entonces hay que recargarla.
+    """
+    ajenos = []
+    esperada = desde + 1
+    for generacion, autor, cambios in sorted(entradas, key=lambda entrada: entrada[0]):
+        if generacion <= desde or generacion > hasta:
+            continue
+        if generacion != esperada:
+            return None
+        esperada += 1
+        if autor == instancia:
+            continue
+        if any(cambio["op"] == "reemplazar" for cambio in cambios):
+            return None
+        ajenos.extend(cambios)
+    return ajenos if esperada == hasta + 1 else None
+
+
+def aplicar_por_clave(registros, cambios, campo_clave):
+    """Aplica los cambios ({"op": "agregar" | "actualizar" | "eliminar", ...}) sobre registros guardados,
+    identificándolos por campo_clave. Los registros sin clave (de antes de que la colección tuviera ids)
+    se conservan, al principio."""
+    sin_clave = [registro for registro in registros if campo_clave not in registro]
+    coleccion = {registro[campo_clave]: registro for registro in registros if campo_clave in registro}
+    for cambio in cambios:
+        if cambio["op"] == "agregar":
+            coleccion[cambio["registro"][campo_clave]] = cambio["registro"]
+        elif cambio["op"] == "actualizar":
+            coleccion[cambio["clave"]] = cambio["registro"]
+        elif cambio["op"] == "eliminar":
+            coleccion.pop(cambio["clave"], None)
+    return sin_clave + list(coleccion.values())
+
+
+def firma_archivo(archivo):
+    """Fecha de modificación y tamaño del archivo (None si no existe), para detectar cambios sin leerlo."""
+    try:
+        estado = os.stat(archivo)
+    except FileNotFoundError:
+        return None
+    return (estado.st_mtime_ns, estado.st_size)
+
+
+class SecuenciaIds:
+    """Genera ids enteros crecientes para los registros de la colección.
+
+    Un id no se vuelve a usar aunque se elimine su registro, tampoco entre ejecuciones ni entre instancias:
+    los ids se reservan por bloques y el límite reservado queda guardado (ver leer_secuencia y reservar_ids).
+    """
+
+    def iniciar_secuencia(self):
+        self.bloqueo_ids = threading.Lock()
+        self.proximo_id = None
+        self.reservado = None
+
+    def cargar_secuencia(self):
+        if self.proximo_id is None:
+            self.proximo_id = self.reservado = self.leer_secuencia()
+
+    def ajustar_ids(self, maximo):
+        """Asegura que los próximos ids sean mayores que el mayor id ya usado."""
+        with self.bloqueo_ids:
+            self.cargar_secuencia()
+            self.proximo_id = max(self.proximo_id, maximo + 1)
+
+    def siguiente_id(self):
+        with self.bloqueo_ids:
+            self.cargar_secuencia()
+            if self.proximo_id >= self.reservado:
+                self.reservado = self.reservar_ids(self.proximo_id, BLOQUE_IDS)
+                self.proximo_id = self.reservado - BLOQUE_IDS
+            self.proximo_id += 1
+            return self.proximo_id - 1
+
+    def numerar(self, registros):
+        """Arma el diccionario id -> registro. Los registros sin id (guardados antes de que existieran)
+        o con un id repetido reciben uno nuevo. Devuelve el diccionario y cuántos ids se asignaron."""
+        registros = list(registros)
+        self.ajustar_ids(max((registro.id for registro in registros if registro.id is not None), default=0))
+        por_id = {}
+        asignados = 0
+        for registro in registros:
+            if registro.id is None or registro.id in por_id:
+                registro.id = self.siguiente_id()
+                asignados += 1
+            por_id[registro.id] = registro
+        return por_id, asignados
+
+
+class Generaciones:
+    """Sigue los cambios que guardan otras instancias (modo multiproceso).
+
+    Cada escritura aumenta la generación de la colección y deja sus cambios en un registro, junto con la
+    instancia que los hizo. self.generacion es la última generación cuyos cambios ya están en memoria.
+    Al escribir no se exige estar al día: basta con que los cambios ajenos pendientes no toquen los mismos
+    registros y que la escritura no reescriba la colección completa (los perdería); si no, Conflicto.
+    """
+    reescribe_archivo = False  # Si cada escritura reescribe la colección completa con lo que hay en memoria
+
+    def iniciar_generaciones(self):
+        self.generacion = None  # None: no se siguen (sin modo multiproceso, o antes de cargar)
+        self.instancia = INSTANCIA
+
+    def clave_de(self, cambio):
+        return cambio["registro"].get(self.campo_clave) if cambio["op"] == "agregar" else cambio.get("clave")
+
+    def reescribe_todo(self, cambios):
+        return self.reescribe_archivo or self.requiere_compactar or any(cambio["op"] == "reemplazar" for cambio in cambios)
+
+    def verificar(self, cambios, actual):
+        """Lanza Conflicto si los cambios no se pueden guardar sobre la generación actual (se llama con la
+        colección bloqueada). Devuelve si quedan cambios ajenos por aplicar en memoria."""
+        if self.generacion is None or actual == self.generacion:
+            return False
+        ajenos = cambios_ajenos(self.leer_registro(self.generacion, actual), self.generacion, actual, self.instancia)
+        if ajenos is None:
+            raise Conflicto(f"{self.archivo}: otra instancia reescribió la colección")
+        if not ajenos:
+            return False
+        if self.reescribe_todo(cambios):
+            raise Conflicto(f"{self.archivo}: se perderían cambios de otra instancia al reescribir la colección")
+        tocados = {self.clave_de(cambio) for cambio in ajenos}
+        if any(self.clave_de(cambio) in tocados for cambio in cambios):
+            raise Conflicto(f"{self.archivo}: otra instancia modificó los mismos registros")
+        return True
+
+    def cambios_pendientes(self):
+        """Cambios de otras instancias que todavía no están en memoria, como pares (clave, registro) con
+        registro None si se eliminó, y la generación hasta la que llegan (se confirma con al_dia después de
+        aplicarlos). Devuelve None si no se pueden reconstruir y hay que recargar la colección."""
+        actual = self.leer_generacion()
+        if self.generacion is None or actual == self.generacion:
+            return [], self.generacion
+        ajenos = cambios_ajenos(self.leer_registro(self.generacion, actual), self.generacion, actual, self.instancia)
+        if ajenos is None:
+            return None
+        return [(self.clave_de(cambio), None if cambio["op"] == "eliminar" else cambio["registro"]) for cambio in ajenos], actual
+
+    def al_dia(self, generacion):
+        if generacion is not None and self.generacion is not None:
+            self.generacion = max(self.generacion, generacion)
+
+    def cambio_ajeno(self):
+        """Si se guardó algo que no está en memoria, sin leer el registro (ver Vigilante)."""
+        return self.generacion is not None and self.leer_generacion() != self.generacion
+
+
+class AlmacenamientoJSON(SecuenciaIds, Generaciones):
+    """Guarda la colección completa en un archivo JSON en cada cambio."""
+
+    def __init__(self, archivo, campo_clave=None, ensure_ascii=True):
+        self.archivo = archivo
+        self.archivo_ids = archivo + ".ids"
+        self.archivo_generacion = archivo + ".generacion"
+        self.archivo_registro = archivo + ".cambios"  # Registro de cambios para las demás instancias
+        self.iniciar_secuencia()
+        self.iniciar_generaciones()
+        self.campo_clave = campo_clave  # Si es None, los cambios se identifican por posición
+        self.ensure_ascii = ensure_ascii
+        # Se activa cuando lo que hay en memoria no coincide registro a registro con lo guardado
+        # (por ejemplo, si se omitieron registros al cargar); el próximo cambio reescribe todo.
+        self.requiere_compactar = False
+
+    @property
+    def reescribe_archivo(self):
+        # Con campo clave, si faltan en memoria cambios de otra instancia, los propios se aplican sobre lo guardado
+        return not self.campo_clave
+
+    def serializar(self, registros):
+        if FORMATO == "jsonl":
+            return "".join(json.dumps(registro, ensure_ascii=self.ensure_ascii, default=str) + "\n" for registro in registros).encode("utf-8")
+        # Se usan los saltos de línea de la plataforma, igual que al escribir en modo texto
+        texto = json.dumps(registros, indent=4, ensure_ascii=self.ensure_ascii, default=str)
+        return texto.replace("\n", os.linesep).encode("utf-8")
+
+    def leer_secuencia(self):
+        try:
+            with open(self.archivo_ids, "r", encoding="utf-8") as f:
+                return json.load(f)["reservado"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return 1
+
+    def reservar_ids(self, minimo, cantidad):
+        """Reserva cantidad ids desde el mayor entre minimo y lo ya reservado; devuelve el nuevo límite."""
+        with bloqueo_archivo(self.archivo_ids):
+            reservado = max(self.leer_secuencia(), minimo) + cantidad
+            escribir_atomico(self.archivo_ids, json.dumps({"reservado": reservado}).encode("utf-8"))
+        return reservado
+
+    def exclusivo(self):
+        return bloqueo_archivo(self.archivo)
+
+    def leer_generacion(self):
+        try:
+            with open(self.archivo_generacion, "r", encoding="utf-8") as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def leer_registro(self, desde, hasta):
+        entradas = []
+        try:
+            with open(self.archivo_registro, "rb") as f:
+                for linea in f:
+                    try:
+                        entrada = json.loads(linea)
+                    except ValueError:
+                        break  # Línea a medias: otra instancia la está escribiendo
+                    if desde < entrada["generacion"] <= hasta:
+                        entradas.append((entrada["generacion"], entrada["instancia"], entrada["cambios"]))
+        except FileNotFoundError:
+            pass
+        return entradas
+
+    def publicar(self, generacion, cambios):
+        """Deja los cambios en el registro y después anuncia la nueva generación."""
+        linea = (json.dumps({"generacion": generacion, "instancia": self.instancia, "cambios": cambios},
+                            ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        if generacion % GENERACIONES_REGISTRADAS == 0:
+            # Se conservan solo las últimas generaciones; quien esté más atrasado recarga la colección
+            try:
+                with open(self.archivo_registro, "rb") as f:
+                    anteriores = f.readlines()[-(GENERACIONES_REGISTRADAS // 2):]
+            except FileNotFoundError:
+                anteriores = []
+            escribir_atomico(self.archivo_registro, b"".join(anteriores) + linea)
+        else:
+            with open(self.archivo_registro, "ab") as f:
+                f.write(linea)
+        escribir_atomico(self.archivo_generacion, str(generacion).encode("ascii"))
+
+    @contextmanager
+    def coordinar(self, cambios):
+        """Envuelve cada escritura. En modo multiproceso la hace con la colección bloqueada y después de
+        verificar los cambios; al terminar los publica con una nueva generación. El bloque recibe si quedan
+        cambios de otras instancias por aplicar en memoria."""
+        if not MULTIPROCESO:
+            yield False
+            return
+        with self.exclusivo():
+            actual = self.leer_generacion()
+            pendientes = self.verificar(cambios, actual)
+            yield pendientes
+            self.publicar(actual + 1, cambios)
+            if not pendientes:
+                self.generacion = actual + 1
+
+    def firma(self):
+        """Identifica el estado guardado sin leerlo; None si lo que hay en memoria no coincide con lo guardado."""
+        if self.requiere_compactar:
+            return None
+        return firma_archivo(self.archivo)
+
+    def iterar(self):
+        """Devuelve los registros guardados de a uno, sin cargar el archivo completo."""
+        if MULTIPROCESO:
+            return iter(self.cargar())  # Se lee todo mientras la colección está bloqueada
+        return self.leer()
+
+    def cargar(self):
+        if not MULTIPROCESO:
+            return list(self.leer())
+        with self.exclusivo():
+            self.generacion = self.leer_generacion()
+            return list(self.leer())
+
+    def leer(self):
+        return leer_registros(self.archivo)
+
+    def guardar(self, registros):
+        with self.coordinar([{"op": "reemplazar"}]):
+            self.escribir(registros)
+
+    def escribir(self, registros):
+        escribir_atomico(self.archivo, self.serializar(registros))
+        self.requiere_compactar = False
+
+    # registros es una función que devuelve la colección completa ya serializable;
+    # solo se llama cuando hace falta reescribir el archivo.
+    def agregar(self, registro, registros):
+        self.aplicar([{"op": "agregar", "registro": registro}], registros)
+
+    def actualizar(self, clave, registro, registros):
+        self.aplicar([{"op": "actualizar", "clave": clave, "registro": registro}], registros)
+
+    def eliminar(self, clave, registros):
+        self.aplicar([{"op": "eliminar", "clave": clave}], registros)
+
+    def aplicar(self, cambios, registros):
+        """Guarda varios cambios ({"op": "agregar" | "actualizar" | "eliminar", ...}) con una sola escritura."""
+        with self.coordinar(cambios) as pendientes:
+            if pendientes:
+                # Lo que hay en memoria no tiene los cambios de otra instancia: reescribirlo los perdería
+                self.escribir(aplicar_por_clave(list(self.leer()), cambios, self.campo_clave))
+            else:
+                self.escribir(registros())
+
+
+class AlmacenamientoDiario(AlmacenamientoJSON):
+    """Instantánea JSON más un diario (JSON Lines) con un cambio por línea.
+
+    El diario empieza con una cabecera que guarda el CRC de la instantánea sobre
+    la que se aplican los cambios; si la instantánea ya no coincide (porque se
+    compactó y el proceso se cortó antes de borrar el diario) el diario se aparta.
+    """
+    reescribe_archivo = False
+
+    def __init__(self, archivo, campo_clave=None, ensure_ascii=True, compactar_cada=COMPACTAR_CADA):
+        super().__init__(archivo, campo_clave, ensure_ascii)
+        self.archivo_diario = archivo + ".diario"
+        self.compactar_cada = compactar_cada
+        self.cambios = 0
+        self.crc = None
+
+    def firma(self):
+        if self.requiere_compactar:
+            return None
+        return (firma_archivo(self.archivo), firma_archivo(self.archivo_diario))
+
+    def leer(self):
+        if not os.path.exists(self.archivo_diario):
+            # Sin cambios pendientes la instantánea se puede leer de a un registro
+            self.crc = None
+            self.cambios = 0
+            return leer_registros(self.archivo)
+        try:
+            self.crc = crc_archivo(self.archivo)
+            registros = list(leer_registros(self.archivo))
+        except FileNotFoundError:
+            self.crc = 0
+            registros = []
+        return iter(self.reproducir(registros))
+
+    def al_dia(self, generacion):
+        anterior = self.generacion
+        super().al_dia(generacion)
+        if self.generacion != anterior:
+            self.crc = None  # Otra instancia pudo compactar: la base del diario se vuelve a calcular
+
+    def reproducir(self, registros):
+        """Aplica sobre la instantánea los cambios guardados en el diario."""
+        self.cambios = 0
+        try:
+            f = open(self.archivo_diario, "rb")
+        except FileNotFoundError:
+            return registros
+
+        # Si la instantánea tiene registros sin clave (de antes de que la colección tuviera ids),
+        # el diario se escribió por posición y se aplica igual
+        por_clave = bool(self.campo_clave) and all(self.campo_clave in registro for registro in registros)
+        if por_clave:
+            coleccion = {registro[self.campo_clave]: registro for registro in registros}
+        else:
+            coleccion = registros
+
+        incompleto = None
+        with f:
+            cabecera = f.readline()
+            if not cabecera.endswith(b"\n") or json.loads(cabecera).get("base") != self.crc:
+                f.close()
+                print(f"El diario {self.archivo_diario} no corresponde a {self.archivo}. Se apartará sin aplicarse.")
+                os.replace(self.archivo_diario, self.archivo_diario + ".descartado")
+                return registros
+            posicion = len(cabecera)
+            for linea in f:
+                try:
+                    if not linea.endswith(b"\n"):
+                        raise ValueError
+                    cambio = json.loads(linea)
+                except ValueError:
+                    incompleto = posicion  # Última línea a medias por un corte durante la escritura
+                    break
+                posicion += len(linea)
+                if cambio["op"] == "agregar":
+                    if por_clave:
+                        coleccion[cambio["registro"][self.campo_clave]] = cambio["registro"]
+                    else:
+                        coleccion.append(cambio["registro"])
+                elif cambio["op"] == "actualizar":
+                    coleccion[cambio["clave"]] = cambio["registro"]
+                elif cambio["op"] == "eliminar":
+                    if por_clave:
+                        coleccion.pop(cambio["clave"], None)
+                    else:
+                        del coleccion[cambio["clave"]]
+                self.cambios += 1
+
+        if incompleto is not None:
+            with open(self.archivo_diario, "r+b") as f:
+                f.truncate(incompleto)
+
+        return list(coleccion.values()) if por_clave else coleccion
+
+    def escribir(self, registros):
+        """Compacta: escribe la instantánea completa y descarta el diario."""
+        datos = self.serializar(registros)
+        escribir_atomico(self.archivo, datos)
+        self.crc = zlib.crc32(datos)
+        self.cambios = 0
+        self.requiere_compactar = False
+        try:
+            os.remove(self.archivo_diario)
+        except FileNotFoundError:
+            pass
+
+    def aplicar(self, cambios, registros):
+        with self.coordinar(cambios) as pendientes:
+            if self.requiere_compactar:
+                self.escribir(registros())
+                return
+
+            if self.crc is None or pendientes:  # Con cambios ajenos pendientes, la instantánea pudo cambiar
+                try:
+                    self.crc = crc_archivo(self.archivo)
+                except FileNotFoundError:
+                    self.crc = 0
+
+            with open(self.archivo_diario, "a", encoding="utf-8") as f:
+                if f.tell() == 0:
+                    f.write(json.dumps({"base": self.crc}) + "\n")
+                # Todos los cambios en una escritura y un solo fsync
+                f.write("".join(json.dumps(cambio, ensure_ascii=False, default=str) + "\n" for cambio in cambios))
+                f.flush()
+                os.fsync(f.fileno())
+
+            self.cambios += len(cambios)
+            # Si faltan cambios de otra instancia en memoria, compactar los perdería: se deja para después
+            if self.cambios >= self.compactar_cada and not pendientes:
+                self.escribir(registros())
+
+
+_conexiones = {}
+_bloqueo_conexiones = threading.Lock()
+
+
+def conectar_sqlite(base_datos):
+    """Devuelve la conexión compartida a la base de datos (abierta en modo WAL) y el bloqueo que la protege."""
+    base_datos = os.path.abspath(base_datos)  # Una ruta relativa depende del directorio actual
+    with _bloqueo_conexiones:
+        if base_datos not in _conexiones:
+            conexion = sqlite3.connect(base_datos, check_same_thread=False)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            _conexiones[base_datos] = (conexion, threading.RLock())  # Reentrante: verificar lee el registro dentro de la transacción
+        return _conexiones[base_datos]
+
+
+class AlmacenamientoSQLite(SecuenciaIds, Generaciones):
+    """Guarda la colección en una tabla de SQLite; cada cambio es una transacción.
+
+    La generación es la versión de la tabla (ver aumentar_version) y el registro de cambios para las
+    demás instancias es la tabla cambios, que se escribe en la misma transacción.
+    """
+
+    def __init__(self, archivo, campo_clave=None, base_datos=BASE_DATOS):
+        self.archivo = archivo
+        self.iniciar_secuencia()
+        self.iniciar_generaciones()
+        self.campo_clave = campo_clave
+        self.base_datos = base_datos
+        self.tabla = os.path.splitext(os.path.basename(archivo))[0]
+        if not self.tabla.isidentifier():
+            raise ValueError(f"Nombre de tabla no válido: {self.tabla}")
+        self.columnas = COLUMNAS_SQLITE.get(self.tabla, {})
+        self.requiere_compactar = False
+        self.conexion, self.bloqueo = conectar_sqlite(base_datos)
+        self.existia = self.crear_tabla()
+
+    def crear_tabla(self):
+        """Crea la tabla y sus índices si no existen. Devuelve si la tabla ya existía."""
+        columnas = "".join(f", {columna}" for columna in self.columnas)
+        with self.bloqueo, self.conexion:
+            existia = self.conexion.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.tabla,)
+            ).fetchone() is not None
+            self.conexion.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.tabla} "
+                f"(posicion INTEGER PRIMARY KEY AUTOINCREMENT, clave UNIQUE{columnas}, datos TEXT NOT NULL)"
+            )
+            for columna in self.columnas:
+                self.conexion.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.tabla}_{columna} ON {self.tabla} ({columna})")
+            # Versión de cada tabla: aumenta en la misma transacción de cada cambio
+            self.conexion.execute("CREATE TABLE IF NOT EXISTS versiones (tabla TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+            # Límite de los ids reservados de cada tabla (ver SecuenciaIds)
+            self.conexion.execute("CREATE TABLE IF NOT EXISTS secuencias (tabla TEXT PRIMARY KEY, reservado INTEGER NOT NULL)")
+            # Cambios de cada versión, para las demás instancias (modo multiproceso)
+            self.conexion.execute(
+                "CREATE TABLE IF NOT EXISTS cambios "
+                "(tabla TEXT NOT NULL, version INTEGER NOT NULL, instancia TEXT NOT NULL, datos TEXT NOT NULL, PRIMARY KEY (tabla, version))"
+            )
+        return existia
+
+    def leer_secuencia(self):
+        with self.bloqueo:
+            fila = self.conexion.execute("SELECT reservado FROM secuencias WHERE tabla = ?", (self.tabla,)).fetchone()
+        return fila[0] if fila else 1
+
+    def reservar_ids(self, minimo, cantidad):
+        """Reserva cantidad ids desde el mayor entre minimo y lo ya reservado; devuelve el nuevo límite."""
+        with self.bloqueo, self.conexion:
+            return self.conexion.execute(
+                "INSERT INTO secuencias (tabla, reservado) VALUES (?, ?) "
+                "ON CONFLICT (tabla) DO UPDATE SET reservado = max(reservado, ?) + ? RETURNING reservado",
+                (self.tabla, minimo + cantidad, minimo, cantidad)
+            ).fetchall()[0][0]
+
+    def exclusivo(self):
+        return bloqueo_archivo(f"{self.base_datos}.{self.tabla}")
+
+    def version(self):
+        fila = self.conexion.execute("SELECT version FROM versiones WHERE tabla = ?", (self.tabla,)).fetchone()
+        return fila[0] if fila else 0
+
+    def leer_generacion(self):
+        with self.bloqueo:
+            return self.version()
+
+    def leer_registro(self, desde, hasta):
+        with self.bloqueo:
+            filas = self.conexion.execute(
+                "SELECT version, instancia, datos FROM cambios WHERE tabla = ? AND version > ? AND version <= ?", (self.tabla, desde, hasta)
+            ).fetchall()
+        return [(version, instancia, json.loads(datos)) for version, instancia, datos in filas]
+
+    @contextmanager
+    def transaccion(self):
+        """Transacción de escritura en la conexión compartida. En modo multiproceso toma de entrada el
+        bloqueo de escritura de la base de datos, para que la versión no cambie mientras se verifica."""
+        with self.bloqueo, self.conexion:
+            if MULTIPROCESO:
+                self.conexion.execute("BEGIN IMMEDIATE")
+            yield
+
+    def aumentar_version(self, cambios):
+        """Aumenta la versión de la tabla y, en modo multiproceso, registra los cambios después de verificarlos.
+        Devuelve la generación que queda en memoria al confirmar la transacción (ver confirmada), o None."""
+        pendientes = MULTIPROCESO and self.verificar(cambios, self.version())
+        version = self.conexion.execute(
+            "INSERT INTO versiones (tabla, version) VALUES (?, 1) "
+            "ON CONFLICT (tabla) DO UPDATE SET version = version + 1 RETURNING version", (self.tabla,)
+        ).fetchall()[0][0]
+        if not MULTIPROCESO:
+            return None
+        self.conexion.execute(
+            "INSERT INTO cambios (tabla, version, instancia, datos) VALUES (?, ?, ?, ?)",
+            (self.tabla, version, self.instancia, json.dumps(cambios, ensure_ascii=False, default=str))
+        )
+        if version % GENERACIONES_REGISTRADAS == 0:
+            self.conexion.execute("DELETE FROM cambios WHERE tabla = ? AND version <= ?", (self.tabla, version - GENERACIONES_REGISTRADAS // 2))
+        return None if pendientes else version
+
+    def confirmada(self, generacion):
+        """Después de confirmar la transacción: lo guardado coincide con lo que hay en memoria."""
+        self.requiere_compactar = False
+        if generacion is not None:
+            self.generacion = generacion
+
+    def fila(self, registro):
+        valores = []
+        for ruta in self.columnas.values():
+            valor = registro
+            for parte in ruta:
+                valor = valor.get(parte) if isinstance(valor, dict) else None
+            valores.append(valor)
+        clave = registro.get(self.campo_clave) if self.campo_clave else None
+        return [clave] + valores + [json.dumps(registro, ensure_ascii=False, default=str)]
+
+    def sql_insertar(self):
+        columnas = ", ".join(["clave", *self.columnas, "datos"])
+        marcas = ", ".join("?" * (len(self.columnas) + 2))
+        return f"INSERT INTO {self.tabla} ({columnas}) VALUES ({marcas})"
+
+    def condicion(self, clave):
+        """Condición WHERE que identifica el registro por su clave o por su posición."""
+        if self.campo_clave:
+            return "clave = ?", clave
+        return f"posicion = (SELECT posicion FROM {self.tabla} ORDER BY posicion LIMIT 1 OFFSET ?)", clave
+
+    def iterar(self, tamano_lote=1000):
+        """Devuelve los registros de a uno, leyendo la tabla por lotes."""
+        if not self.existia:
+            self.existia = True
+            raise FileNotFoundError(f"No hay datos de {self.tabla} en {self.base_datos}")
+        if MULTIPROCESO:
+            return iter(self.leer_version_completa())
+        return self.leer_por_lotes(tamano_lote)
+
+    def leer_version_completa(self):
+        """Todos los registros y la versión a la que corresponden, en una misma transacción de lectura."""
+        with self.bloqueo:
+            self.conexion.execute("BEGIN")
+            try:
+                self.generacion = self.version()
+                filas = self.conexion.execute(f"SELECT datos FROM {self.tabla} ORDER BY posicion").fetchall()
+            finally:
+                self.conexion.commit()
+        return [json.loads(datos) for (datos,) in filas]
+
+    def leer_por_lotes(self, tamano_lote):
+        ultima = 0
+        while True:
+            with self.bloqueo:
+                filas = self.conexion.execute(
+                    f"SELECT posicion, datos FROM {self.tabla} WHERE posicion > ? ORDER BY posicion LIMIT ?", (ultima, tamano_lote)
+                ).fetchall()
+            for ultima, datos in filas:
+                yield json.loads(datos)
+            if len(filas) < tamano_lote:
+                return
+
+    def cargar(self):
+        return list(self.iterar())
+
+    def consultar(self, **filtros):
+        """Busca registros usando las columnas indexadas, por ejemplo consultar(fecha='2024-11-17')."""
+        for columna in filtros:
+            if columna not in self.columnas:
+                raise ValueError(f"La columna {columna} no está indexada en {self.tabla}")
+        condiciones = " AND ".join(f"{columna} = ?" for columna in filtros) or "1"
+        with self.bloqueo:
+            filas = self.conexion.execute(
+                f"SELECT datos FROM {self.tabla} WHERE {condiciones} ORDER BY posicion", tuple(filtros.values())
+            ).fetchall()
+        return [json.loads(datos) for (datos,) in filas]
+
+    def firma(self):
+        if self.requiere_compactar:
+            return None
+        return (self.base_datos, self.tabla, self.leer_generacion())
+
+    # reemplazar y ejecutar no toman el bloqueo ni confirman: lo hace quien abre la transacción (ver transaccion).
+    # Devuelven lo que se le pasa a confirmada después de confirmarla.
+    def reemplazar(self, registros):
+        self.conexion.execute(f"DELETE FROM {self.tabla}")
+        self.conexion.executemany(self.sql_insertar(), [self.fila(registro) for registro in registros])
+        return self.aumentar_version([{"op": "reemplazar"}])
+
+    def ejecutar(self, cambios):
+        asignaciones = ", ".join(f"{columna} = ?" for columna in ["clave", *self.columnas, "datos"])
+        for cambio in cambios:
+            if cambio["op"] == "agregar":
+                self.conexion.execute(self.sql_insertar(), self.fila(cambio["registro"]))
+                continue
+            condicion, parametro = self.condicion(cambio["clave"])
+            if cambio["op"] == "actualizar":
+                self.conexion.execute(f"UPDATE {self.tabla} SET {asignaciones} WHERE {condicion}", (*self.fila(cambio["registro"]), parametro))
+            elif cambio["op"] == "eliminar":
+                self.conexion.execute(f"DELETE FROM {self.tabla} WHERE {condicion}", (parametro,))
+        return self.aumentar_version(cambios)
+
+    def guardar(self, registros):
+        with self.transaccion():
+            generacion = self.reemplazar(registros)
+        self.confirmada(generacion)
+
+    def aplicar(self, cambios, registros):
+        """Aplica los cambios en una sola transacción."""
+        if self.requiere_compactar:
+            return self.guardar(registros())
+        with self.transaccion():
+            generacion = self.ejecutar(cambios)
+        self.confirmada(generacion)
+
+    def agregar(self, registro, registros):
+        self.aplicar([{"op": "agregar", "registro": registro}], registros)
+
+    def actualizar(self, clave, registro, registros):
+        self.aplicar([{"op": "actualizar", "clave": clave, "registro": registro}], registros)
+
+    def eliminar(self, clave, registros):
+        self.aplicar([{"op": "eliminar", "clave": clave}], registros)
+
+
+_bloqueo_transacciones = threading.Lock()
+_transacciones_revisadas = set()  # Registros de transacciones ya revisados al abrir un almacenamiento
+
+
+def confirmar_transaccion(operaciones):
+    """Guarda juntos los cambios de varias colecciones: quedan todos o ninguno.
+
+    operaciones es una lista de (almacenamiento, cambios, registros), con los mismos cambios y la misma
+    función registros de aplicar. En SQLite todas las tablas comparten la conexión y basta una transacción.
+    Con archivos, los cambios se escriben primero (con fsync) en ARCHIVO_TRANSACCIONES y luego se aplican
+    a cada colección; si el proceso se corta en medio, recuperar_transacciones los vuelve a aplicar.
+    Como los cambios se identifican por clave, aplicarlos dos veces deja el mismo resultado.
+
+    En modo multiproceso, antes de escribir nada se verifican los cambios de todas las colecciones
+    (ver Generaciones.verificar): si alguna choca con lo que guardó otra instancia, lanza Conflicto.
+    """
+    operaciones = [(almacen, cambios, registros) for almacen, cambios, registros in operaciones if cambios]
+    if not operaciones:
+        return
+    for almacen, _, _ in operaciones:
+        if not almacen.campo_clave:
+            raise ValueError(f"{almacen.archivo} no tiene campo clave; sus cambios no se pueden repetir sin riesgo")
+
+    if isinstance(operaciones[0][0], AlmacenamientoSQLite):
+        generaciones = []
+        with operaciones[0][0].transaccion():
+            for almacen, cambios, registros in operaciones:
+                if almacen.requiere_compactar:
+                    generaciones.append(almacen.reemplazar(registros()))
+                else:
+                    generaciones.append(almacen.ejecutar(cambios))
+        for (almacen, _, _), generacion in zip(operaciones, generaciones):
+            almacen.confirmada(generacion)
+        return
+
+    transaccion = [
+        {"archivo": almacen.archivo, "ensure_ascii": almacen.ensure_ascii, "cambios": cambios}
+        for almacen, cambios, _ in operaciones
+    ]
+    # Orden de los bloqueos: el registro de transacciones y después las colecciones, ordenadas por ruta
+    with ExitStack() as bloqueos:
+        bloqueos.enter_context(bloqueo_archivo(ARCHIVO_TRANSACCIONES))
+        if MULTIPROCESO:
+            recuperar_transacciones()  # Otra instancia pudo cortarse a mitad de una transacción
+            for almacen, _, _ in sorted(operaciones, key=lambda operacion: os.path.abspath(operacion[0].archivo)):
+                bloqueos.enter_context(almacen.exclusivo())
+            for almacen, cambios, _ in operaciones:
+                almacen.verificar(cambios, almacen.leer_generacion())
+        with open(ARCHIVO_TRANSACCIONES, "w", encoding="utf-8") as f:
+            f.write(json.dumps(transaccion, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        for almacen, cambios, registros in operaciones:
+            almacen.aplicar(cambios, registros)
+        os.remove(ARCHIVO_TRANSACCIONES)
+
+
+def recuperar_transacciones():
+    """Termina de aplicar la transacción que quedó a medias si el proceso se cortó. Devuelve si había una."""
+    with bloqueo_archivo(ARCHIVO_TRANSACCIONES):  # Si otra instancia está a mitad de una transacción, se espera
+        return completar_transaccion()
+
+
+def completar_transaccion():
+    try:
+        with open(ARCHIVO_TRANSACCIONES, "rb") as f:
+            linea = f.readline()
+    except FileNotFoundError:
+        return False
+
+    try:
+        if not linea.endswith(b"\n"):
+            raise ValueError
+        transaccion = json.loads(linea)
+    except ValueError:
+        # Se cortó mientras se escribía el registro: todavía no se había aplicado ningún cambio
+        os.remove(ARCHIVO_TRANSACCIONES)
+        return False
+
+    for parte in transaccion:
+        almacen = crear_almacenamiento(parte["archivo"], ensure_ascii=parte["ensure_ascii"])
+        almacen.instancia = None  # Son cambios de la instancia que se cortó: las demás, esta incluida, los deben aplicar
+        try:
+            registros = almacen.cargar()
+        except FileNotFoundError:
+            registros = []
+        almacen.guardar(aplicar_por_clave(registros, parte["cambios"], almacen.campo_clave))
+    print(f"Se completó una transacción interrumpida ({', '.join(parte['archivo'] for parte in transaccion)}).")
+    os.remove(ARCHIVO_TRANSACCIONES)
+    return True
+
+
+def crear_almacenamiento(archivo, campo_clave=None, ensure_ascii=True):
+    """Devuelve el almacenamiento configurado en TIENDA_ALMACENAMIENTO para el archivo.
+
+    Si no se indica campo_clave se usa el de la colección en COLECCIONES, para que quien solo lee
+    (las estadísticas, por ejemplo) aplique el diario igual que quien lo escribió. La primera vez en
+    cada directorio se completa la transacción que haya quedado a medias (ver recuperar_transacciones).
+    """
+    if campo_clave is None:
+        campo_clave = COLECCIONES.get(os.path.basename(archivo))
+    ruta_transacciones = os.path.abspath(ARCHIVO_TRANSACCIONES)
+    with _bloqueo_transacciones:
+        revisar = ruta_transacciones not in _transacciones_revisadas
+        _transacciones_revisadas.add(ruta_transacciones)
+    if revisar:
+        recuperar_transacciones()
+    if ALMACENAMIENTO == "diario":
+        return AlmacenamientoDiario(archivo, campo_clave, ensure_ascii)
+    if ALMACENAMIENTO == "sqlite":
+        return AlmacenamientoSQLite(archivo, campo_clave)
+    return AlmacenamientoJSON(archivo, campo_clave, ensure_ascii)
+
+
+class Vigilante(threading.Thread):
+    """Avisa a los gestores de los cambios que guardan otras instancias (modo multiproceso).
+
+    Cada INTERVALO_VIGILANCIA segundos compara la generación guardada de cada colección con la que tiene su
+    gestor en memoria, y si otra instancia escribió llama a gestor.refrescar(), que aplica solo esos cambios.
+    """
+
+    def __init__(self, intervalo=INTERVALO_VIGILANCIA):
+        super().__init__(name="vigilante", daemon=True)
+        self.intervalo = intervalo
+        self.gestores = []
+
+    def run(self):
+        while True:
+            time.sleep(self.intervalo)
+            for gestor in list(self.gestores):
+                try:
+                    if gestor.almacen.cambio_ajeno():
+                        gestor.refrescar()
+                except Exception as e:  # Se sigue vigilando; el próximo cambio ajeno lo vuelve a intentar
+                    print(f"No se pudieron aplicar los cambios de otra instancia en {gestor.almacen.archivo}: {e}")
+
+
+_vigilante = None
+
+
+def vigilar(gestor):
+    """En modo multiproceso, mantiene al día el gestor (con almacen y refrescar) con los cambios de otras instancias."""
+    global _vigilante
+    if not MULTIPROCESO:
+        return
+    with _bloqueo_transacciones:
+        if _vigilante is None:
+            _vigilante = Vigilante()
+            _vigilante.start()
+        _vigilante.gestores.append(gestor)
+
+
+def migrar_json_a_sqlite(base_datos=BASE_DATOS):
+    """Copia las colecciones de los archivos JSON (y sus diarios, si los hay) a la base de datos."""
+    for archivo, campo_clave in COLECCIONES.items():
+        try:
+            registros = AlmacenamientoDiario(archivo, campo_clave).cargar()
+        except FileNotFoundError:
+            print(f"No se encontró {archivo}. Se omitirá.")
+            continue
+        AlmacenamientoSQLite(archivo, campo_clave, base_datos).guardar(registros)
+        print(f"{archivo}: {len(registros)} registros migrados a {base_datos}.")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrar":
+        migrar_json_a_sqlite(sys.argv[2] if len(sys.argv) > 2 else BASE_DATOS)
+    else:
+        print("Uso: python Almacenamiento.py migrar [base_de_datos]")
@@ -1,3 +1,5 @@
+import os
+import time
 from Producto import GestionProductos, menu_gestion_productos
 from Cliente import GestionClientes, menu_gestion_clientes
 from Pago import GestionPagos, menu_gestion_pagos
@@ -6,14 +8,52 @@ from Envio import GestionEnvios, menu_gestion_envios
 from Estadistica import Estadisticas
 
 class App:
-    def mostrar_menu_principal(self):
-        gestion_productos = GestionProductos()
-        gestion_clientes = GestionClientes()
-        gestion_pagos = GestionPagos()
-        gestion_envios = GestionEnvios()
-        sistema_ventas = SistemaVentas(gestion_clientes, gestion_productos, gestion_envios)
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.tiempo_menu = None
+        self.gestores = {}  # Los gestores se crean (y cargan sus datos) la primera vez que se usan
+        self.tiempos_carga = {}
+
+    def cargar_gestor(self, nombre, clase, *argumentos):
+        if nombre not in self.gestores:
+            inicio = time.perf_counter()
+            self.gestores[nombre] = clase(*argumentos)
+            self.tiempos_carga[nombre] = time.perf_counter() - inicio
+        return self.gestores[nombre]
+
+    @property
+    def gestion_productos(self):
+        return self.cargar_gestor('productos', GestionProductos)
+
+    @property
+    def gestion_clientes(self):
+        return self.cargar_gestor('clientes', GestionClientes)
+
+    @property
+    def gestion_pagos(self):
+        gestion_clientes = self.gestion_clientes
+        return self.cargar_gestor('pagos', GestionPagos, 'pagos.json', gestion_clientes)
 
+    @property
+    def gestion_envios(self):
+        return self.cargar_gestor('envios', GestionEnvios)
+
+    @property
+    def sistema_ventas(self):
+        # Las dependencias se cargan antes para que cada tiempo de carga sea solo el propio
+        dependencias = (self.gestion_clientes, self.gestion_productos, self.gestion_envios)
+        return self.cargar_gestor('ventas', SistemaVentas, *dependencias)
+
+    def reporte_tiempos(self):
+        print("\n--- Tiempos de carga ---")
+        print(f"Menú principal listo en {self.tiempo_menu * 1000:.1f} ms")
+        for nombre, segundos in self.tiempos_carga.items():
+            print(f"{nombre}: {segundos * 1000:.1f} ms")
+
+    def mostrar_menu_principal(self):
         while True:
+            if self.tiempo_menu is None:
+                self.tiempo_menu = time.perf_counter() - self.inicio
             print("\n--- Menú Principal ---")
             print("1. Gestión de Productos")
             print("2. Gestión de Clientes")
@@ -26,25 +66,27 @@ class App:
             opcion = input("Seleccione una opción: ")
 
             if opcion == '1':
-                menu_gestion_productos(gestion_productos)
+                menu_gestion_productos(self.gestion_productos)
 
             elif opcion == '2':
-                menu_gestion_clientes(gestion_clientes)
+                menu_gestion_clientes(self.gestion_clientes)
 
             elif opcion == '3':
-                menu_gestion_pagos(gestion_pagos, gestion_clientes)
+                menu_gestion_pagos(self.gestion_pagos, self.gestion_clientes)
 
             elif opcion == '4':
-                menu_sistema_ventas(sistema_ventas)
+                menu_sistema_ventas(self.sistema_ventas)
                 
             elif opcion == '5':
-                menu_gestion_envios(gestion_envios, gestion_clientes)
+                menu_gestion_envios(self.gestion_envios, self.gestion_clientes)
 
             elif opcion == '6':
                 self.mostrar_estadisticas()
 
             elif opcion == '0':
                 print("Saliendo del programa...")
+                if os.environ.get("TIENDA_TIEMPOS"):
+                    self.reporte_tiempos()
                 break
             else:
                 print("Opción no válida. Intente de nuevo.")
@@ -0,0 +1,956 @@
+"""Pruebas de rendimiento de la tienda.
+
+Uso: python Benchmark.py <prueba> [argumentos]
+"""
+
+import json
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+PRESUPUESTO_ARRANQUE_MS = float(os.environ.get('TIENDA_PRESUPUESTO_ARRANQUE', 250))
+MODULOS_PESADOS = ('matplotlib', 'numpy', 'requests')  # No deben cargarse solo por abrir la aplicación
+
+
+def medir_importacion(modulo='Main', repeticiones=5):
+    """Importa el módulo con `python -X importtime` y devuelve (mejor tiempo acumulado en ms, módulos importados)."""
+    mejor = None
+    modulos = set()
+    for _ in range(repeticiones):
+        resultado = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+            cwd=DIRECTORIO, capture_output=True, text=True, check=True
+        )
+        # Cada línea: "import time: <propio us> | <acumulado us> | <módulo con sangría>"
+        for linea in resultado.stderr.splitlines():
+            if not linea.startswith('import time:') or 'cumulative' in linea:
+                continue
+            _, acumulado, nombre = linea[len('import time:'):].split('|')
+            nombre = nombre.strip()
+            modulos.add(nombre)
+            if nombre == modulo:
+                tiempo = int(acumulado) / 1000
+                mejor = tiempo if mejor is None else min(mejor, tiempo)
+    return mejor, modulos
+
+
+def prueba_arranque(presupuesto_ms=PRESUPUESTO_ARRANQUE_MS):
+    """Comprueba que importar Main quede dentro del presupuesto y sin dependencias pesadas."""
+    presupuesto_ms = float(presupuesto_ms)
+    tiempo, modulos = medir_importacion('Main')
+    pesados = sorted({nombre.split('.')[0] for nombre in modulos} & set(MODULOS_PESADOS))
+    print(f"Importar Main: {tiempo:.1f} ms (presupuesto {presupuesto_ms:.0f} ms)")
+    print(f"Módulos pesados cargados al iniciar: {', '.join(pesados) or 'ninguno'}")
+    assert not pesados, f"Se cargan al iniciar: {', '.join(pesados)}"
+    assert tiempo <= presupuesto_ms, f"El arranque tarda {tiempo:.1f} ms, más que el presupuesto de {presupuesto_ms:.0f} ms"
+
+
+def medir(funcion):
+    """Ejecuta la función y devuelve (resultado, segundos, pico de memoria en MB)."""
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    try:
+        resultado = funcion()
+        return resultado, time.perf_counter() - inicio, tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def prueba_carga(cantidad=100000):
+    """Compara la memoria de leer un archivo de ventas con json.load y con la lectura por registros."""
+    from Almacenamiento import leer_registros
+    cantidad = int(cantidad)
+    with open(os.path.join(DIRECTORIO, 'ventas.json'), 'r', encoding='utf-8') as f:
+        modelos = json.load(f)
+
+    with tempfile.TemporaryDirectory() as directorio:
+        archivo = os.path.join(directorio, 'ventas.json')
+        with open(archivo, 'w', encoding='utf-8') as f:
+            json.dump([modelos[i % len(modelos)] for i in range(cantidad)], f, indent=4, ensure_ascii=False)
+        print(f"{cantidad} ventas, {os.path.getsize(archivo) / 2**20:.1f} MB")
+
+        def con_json_load():
+            with open(archivo, 'r', encoding='utf-8') as f:
+                return len(json.load(f))
+
+        for nombre, funcion in (('json.load', con_json_load), ('por registros', lambda: sum(1 for _ in leer_registros(archivo)))):
+            leidos, segundos, pico = medir(funcion)
+            print(f"{nombre:>14}: {leidos} registros en {segundos:.2f} s, pico de memoria {pico:.1f} MB")
+
+
+def prueba_memoria(cantidad=100000):
+    """Compara la memoria de tener los registros como diccionarios o como objetos con __slots__."""
+    from datetime import datetime
+    from Almacenamiento import leer_registros
+    from Producto import Producto
+    from Cliente import cliente_desde_dict
+    from Pago import Pago
+    from Envio import Envio
+    from Venta import Factura
+    cantidad = int(cantidad)
+
+    compartidos = {}
+    def resolver_cliente(datos):  # Como GestionClientes.resolver_cliente: una sola copia por cédula/RIF
+        if datos['cedula_rif'] not in compartidos:
+            compartidos[datos['cedula_rif']] = cliente_desde_dict(datos)
+        return compartidos[datos['cedula_rif']]
+
+    colecciones = {
+        'productos.json': Producto.desde_dict,
+        'clientes.json': cliente_desde_dict,
+        'pagos.json': lambda datos: Pago(resolver_cliente(datos['cliente']), datos['monto'], datos['moneda'],
+                                         datos['tipo_pago'], datetime.strptime(datos['fecha'], '%Y-%m-%d')),
+        'envios.json': Envio.desde_dict,
+        'ventas.json': lambda datos: Factura.desde_dict(datos, resolver_cliente),
+    }
+    with tempfile.TemporaryDirectory() as directorio:
+        for nombre, construir in colecciones.items():
+            with open(os.path.join(DIRECTORIO, nombre), 'r', encoding='utf-8') as f:
+                modelos = json.load(f)
+            archivo = os.path.join(directorio, nombre)
+            with open(archivo, 'w', encoding='utf-8') as f:
+                json.dump([modelos[i % len(modelos)] for i in range(cantidad)], f, ensure_ascii=False)
+
+            resultados = []
+            for funcion in (lambda: list(leer_registros(archivo)), lambda: [construir(datos) for datos in leer_registros(archivo)]):
+                tracemalloc.start()
+                registros = funcion()
+                resultados.append(tracemalloc.get_traced_memory()[0] / 2**20)
+                tracemalloc.stop()
+                del registros
+            diccionarios, objetos = resultados
+            print(f"{nombre:>14}: {diccionarios:7.1f} MB como diccionarios, {objetos:7.1f} MB como objetos "
+                  f"({100 * (1 - objetos / diccionarios):.0f}% menos) para {cantidad} registros")
+
+
+class DirectorioDePrueba:
+    """Copia los archivos de datos a un directorio temporal y trabaja ahí, para no tocar los datos reales."""
+
+    def __init__(self, **reemplazos):
+        self.reemplazos = reemplazos  # nombre de la colección -> registros que se escriben en lugar de los reales
+
+    def __enter__(self):
+        self.temporal = tempfile.TemporaryDirectory()
+        for nombre in ('productos', 'clientes', 'ventas', 'pagos', 'envios'):
+            if nombre in self.reemplazos:
+                datos = self.reemplazos[nombre]
+            else:
+                with open(os.path.join(DIRECTORIO, f'{nombre}.json'), 'r', encoding='utf-8') as f:
+                    datos = json.load(f)
+            with open(os.path.join(self.temporal.name, f'{nombre}.json'), 'w', encoding='utf-8') as f:
+                json.dump(datos, f, ensure_ascii=False)
+        self.anterior = os.getcwd()
+        os.chdir(self.temporal.name)
+        from Almacenamiento import ALMACENAMIENTO, migrar_json_a_sqlite
+        if ALMACENAMIENTO == 'sqlite':
+            migrar_json_a_sqlite()  # La base de datos queda en el directorio temporal
+        return self.temporal.name
+
+    def __exit__(self, *error):
+        os.chdir(self.anterior)
+        self.temporal.cleanup()
+
+
+def cronometrar(funcion, repeticiones=5):
+    """Mejor tiempo en ms de varias ejecuciones, y el resultado."""
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        segundos = time.perf_counter() - inicio
+        mejor = segundos if mejor is None else min(mejor, segundos)
+    return mejor * 1000, resultado
+
+
+def prueba_consultas_ventas(cantidad=365000):
+    """Consultas de ventas por cliente, rango de fechas, método de pago y moneda usando los índices."""
+    import random
+    from datetime import date, timedelta
+    from Cliente import GestionClientes
+    from Producto import GestionProductos
+    from Envio import GestionEnvios
+    from Venta import SistemaVentas
+    cantidad = int(cantidad)
+    with open(os.path.join(DIRECTORIO, 'ventas.json'), 'r', encoding='utf-8') as f:
+        modelos = json.load(f)
+
+    aleatorio = random.Random(0)
+    inicio = date(2023, 1, 1)
+    ventas = []
+    for i in range(cantidad):
+        venta = dict(modelos[i % len(modelos)])
+        venta['fecha'] = (inicio + timedelta(days=730 * i // cantidad)).isoformat()  # Dos años de ventas, en orden
+        venta['cliente'] = dict(venta['cliente'], cedula_rif=str(aleatorio.randrange(5000)))
+        venta['metodo_pago'] = aleatorio.choice(['zelle', 'paypal', 'efectivo', 'punto de venta', 'pago móvil'])
+        ventas.append(venta)
+
+    with DirectorioDePrueba(ventas=ventas):
+        sistema = SistemaVentas(GestionClientes(), GestionProductos(), GestionEnvios())
+        print(f"{len(sistema.ventas)} ventas cargadas")
+        consultas = {
+            'un cliente': dict(cedula_rif='42'),
+            'un día': dict(desde='2023-06-01', hasta='2023-06-01'),
+            'un año': dict(desde='2023-01-01', hasta='2023-12-31'),
+            'cliente en un año': dict(cedula_rif='42', desde='2023-01-01', hasta='2023-12-31'),
+            'método y moneda': dict(metodo_pago='Zelle', tipo_moneda='divisas'),
+            'mes, método y moneda': dict(desde='2024-03-01', hasta='2024-03-31', metodo_pago='zelle', tipo_moneda='divisas'),
+        }
+        for nombre, filtros in consultas.items():
+            milisegundos, resultado = cronometrar(lambda: sistema.consultar_ventas(**filtros))
+            lineal, esperado = cronometrar(lambda: [
+                factura for factura in sistema.ventas.values()
+                if ('cedula_rif' not in filtros or factura.cedula_rif == filtros['cedula_rif'])
+                and ('desde' not in filtros or filtros['desde'] <= factura.fecha <= filtros['hasta'])
+                and ('metodo_pago' not in filtros or factura.metodo_pago.lower() == filtros['metodo_pago'].lower())
+                and ('tipo_moneda' not in filtros or factura.tipo_moneda == filtros['tipo_moneda'])
+            ], repeticiones=1)
+            assert sorted(map(id, resultado)) == sorted(map(id, esperado)), nombre
+            print(f"{nombre:>22}: {len(resultado):7} ventas en {milisegundos:8.2f} ms (recorriendo todo: {lineal:8.2f} ms)")
+
+
+def prueba_consultas_pagos(cantidad=365000):
+    """Conciliación de pagos: consultas por cliente, rango de meses, tipo de pago y moneda usando los índices."""
+    import random
+    from datetime import date, timedelta
+    from Cliente import GestionClientes
+    from Pago import GestionPagos, fecha_de
+    cantidad = int(cantidad)
+    with open(os.path.join(DIRECTORIO, 'pagos.json'), 'r', encoding='utf-8') as f:
+        modelo = json.load(f)[0]
+
+    aleatorio = random.Random(0)
+    inicio = date(2023, 1, 1)
+    tipos = {'divisas': ['Zelle', 'PayPal', 'Efectivo'], 'bolivares': ['Punto de venta', 'Pago móvil', 'Transferencia']}
+    pagos = []
+    for i in range(cantidad):
+        moneda = aleatorio.choice(list(tipos))
+        pagos.append(dict(
+            modelo,
+            cliente=dict(modelo['cliente'], cedula_rif=str(aleatorio.randrange(5000))),
+            monto=round(aleatorio.uniform(1, 1000), 2),
+            moneda=moneda,
+            tipo_pago=aleatorio.choice(tipos[moneda]),
+            fecha=(inicio + timedelta(days=730 * i // cantidad)).isoformat(),
+        ))
+
+    with DirectorioDePrueba(pagos=pagos):
+        gestion = GestionPagos(gestion_clientes=GestionClientes())
+        print(f"{len(gestion.pagos)} pagos cargados")
+        cliente = next(iter(gestion.pagos.values())).cliente
+        consultas = {
+            'un cliente': dict(cliente=cliente),
+            'un día': dict(fecha='2023-06-01'),
+            'tres meses': dict(desde='2024-01-01', hasta='2024-03-31'),
+            'cliente en un año': dict(cliente=cliente, desde='2023-01-01', hasta='2023-12-31'),
+            'tipo y moneda': dict(tipo_pago='zelle', moneda='DIVISAS'),
+            'mes, tipo y moneda': dict(desde='2024-03-01', hasta='2024-03-31', tipo_pago='Pago móvil', moneda='bolivares'),
+        }
+        for nombre, filtros in consultas.items():
+            milisegundos, resultado = cronometrar(lambda: gestion.buscar_pagos(**filtros))
+            desde = fecha_de(filtros.get('desde', filtros.get('fecha')))
+            hasta = fecha_de(filtros.get('hasta', filtros.get('fecha')))
+            lineal, esperado = cronometrar(lambda: [
+                pago for pago in gestion.pagos.values()
+                if ('cliente' not in filtros or pago.cliente.cedula_rif == filtros['cliente'].cedula_rif)
+                and (desde is None or desde <= pago.fecha.date() <= hasta)
+                and ('tipo_pago' not in filtros or pago.tipo_pago.lower() == filtros['tipo_pago'].lower())
+                and ('moneda' not in filtros or pago.moneda.lower() == filtros['moneda'].lower())
+            ], repeticiones=1)
+            assert sorted(map(id, resultado)) == sorted(map(id, esperado)), nombre
+            print(f"{nombre:>22}: {len(resultado):7} pagos en {milisegundos:8.2f} ms (recorriendo todo: {lineal:8.2f} ms)")
+
+
+def prueba_consultas_envios(cantidad=365000):
+    """Consultas de despacho: envíos de un día o una semana, por servicio, motorizado y orden de compra."""
+    import random
+    from datetime import date, timedelta
+    from Envio import GestionEnvios, normalizar
+    cantidad = int(cantidad)
+
+    aleatorio = random.Random(0)
+    inicio = date(2023, 1, 1)
+    motorizados = [f"Motorizado {numero}" for numero in range(50)]
+    envios = []
+    for i in range(cantidad):
+        servicio = aleatorio.choice(['Zoom', 'MRW', 'Delivery por moto'])
+        envios.append({
+            'orden_compra': str(aleatorio.randrange(100000)),
+            'servicio_envio': servicio,
+            'motorizado': {'nombre': aleatorio.choice(motorizados), 'telefono': '0414'} if servicio.startswith('Delivery') else None,
+            'costo': 2.99,
+            'fecha': (inicio + timedelta(days=730 * i // cantidad)).isoformat(),
+        })
+
+    with DirectorioDePrueba(envios=envios):
+        gestion = GestionEnvios()
+        print(f"{len(gestion.envios)} envíos cargados")
+        consultas = {
+            'un día': lambda: gestion.envios_del_dia('2024-03-05'),
+            'una semana': lambda: gestion.envios_de_la_semana('2024-03-05'),
+            'semana de un motorizado': lambda: gestion.envios_de_la_semana('2024-03-05', motorizado='motorizado 7'),
+            'servicio en un día': lambda: gestion.envios_del_dia('2024-03-05', servicio='ZOOM'),
+            'una orden de compra': lambda: gestion.buscar_envios(orden_compra='4242'),
+        }
+        for nombre, consulta in consultas.items():
+            milisegundos, resultado = cronometrar(consulta)
+            print(f"{nombre:>24}: {len(resultado):7} envíos en {milisegundos:8.3f} ms")
+
+        # Como se hacía antes: convertir la fecha de cada envío en cada consulta
+        lineal, esperado = cronometrar(lambda: [
+            envio for envio in envios if datetime.strptime(envio['fecha'], '%Y-%m-%d').date() == date(2024, 3, 5)
+        ], repeticiones=1)
+        print(f"{'un día recorriendo todo':>24}: {len(esperado):7} envíos en {lineal:8.3f} ms")
+        assert len(esperado) == len(gestion.envios_del_dia('2024-03-05'))
+        assert all(normalizar(envio.servicio_envio) == 'zoom' for envio in gestion.envios_del_dia('2024-03-05', servicio='ZOOM'))
+
+
+def prueba_ingesta(cantidad=20000, tamano_lote=1000):
+    """Pedidos por segundo al ingresarlos por lotes, comparado con guardar cada pedido por separado."""
+    import random
+    from Almacenamiento import ALMACENAMIENTO
+    from Cliente import GestionClientes
+    from Producto import GestionProductos
+    from Envio import GestionEnvios
+    from Venta import SistemaVentas
+    cantidad, tamano_lote = int(cantidad), int(tamano_lote)
+    with open(os.path.join(DIRECTORIO, 'productos.json'), 'r', encoding='utf-8') as f:
+        productos = [dict(producto, inventory=10**9) for producto in json.load(f)]
+    with open(os.path.join(DIRECTORIO, 'clientes.json'), 'r', encoding='utf-8') as f:
+        cedulas = [cliente['cedula_rif'] for cliente in json.load(f)]
+
+    aleatorio = random.Random(0)
+    def pedido():
+        return {
+            'cedula_rif': aleatorio.choice(cedulas),
+            'productos': [{'id': producto['id'], 'cantidad': aleatorio.randint(1, 3)} for producto in aleatorio.sample(productos, 3)],
+            'metodo_pago': 'zelle',
+            'tipo_moneda': 'divisas',
+            'fecha': '2024-12-01',
+            'envio': {'servicio_envio': 'Zoom', 'costo': 3.5},
+        }
+
+    print(f"Almacenamiento: {ALMACENAMIENTO}")
+    # Uno por uno se prueba con menos pedidos: cada uno reescribe (o agrega al diario) las tres colecciones
+    for nombre, pedidos, lote in (('por lotes', cantidad, tamano_lote), ('uno por uno', min(cantidad, 500), 1)):
+        with DirectorioDePrueba(productos=productos):
+            sistema = SistemaVentas(GestionClientes(), GestionProductos(), GestionEnvios())
+            lista = [pedido() for _ in range(pedidos)]
+            inicio = time.perf_counter()
+            registradas, rechazados = sistema.ingresar_pedidos(lista, lote)
+            segundos = time.perf_counter() - inicio
+            assert len(registradas) == pedidos and not rechazados, rechazados[:3]
+            print(f"{nombre:>12}: {pedidos} pedidos en {segundos:.2f} s, {pedidos / segundos:9.0f} pedidos/s (lotes de {lote})")
+
+
+def prueba_concurrencia(hilos=8, ventas_por_hilo=200):
+    """Varios hilos venden a la vez productos con poco inventario: no se debe vender de más ni perder ventas."""
+    import random
+    import threading
+    from Almacenamiento import ALMACENAMIENTO
+    from Cliente import GestionClientes
+    from Producto import GestionProductos
+    from Envio import GestionEnvios
+    from Venta import SistemaVentas, Venta
+    hilos, ventas_por_hilo = int(hilos), int(ventas_por_hilo)
+    with open(os.path.join(DIRECTORIO, 'productos.json'), 'r', encoding='utf-8') as f:
+        productos = json.load(f)[:10]
+    # Alcanza para más o menos la mitad de lo que se intenta vender
+    for producto in productos:
+        producto['inventory'] = hilos * ventas_por_hilo * 2 // len(productos)
+    iniciales = {producto['id']: producto['inventory'] for producto in productos}
+
+    print(f"Almacenamiento: {ALMACENAMIENTO}, {hilos} hilos x {ventas_por_hilo} ventas")
+    with DirectorioDePrueba(productos=productos):
+        gestion_clientes = GestionClientes()
+        gestion_productos = GestionProductos()
+        sistema = SistemaVentas(gestion_clientes, gestion_productos, GestionEnvios())
+        ventas_iniciales = len(sistema.ventas)
+        cliente = gestion_clientes.buscar_cliente('31423389')
+        vendido = {id_producto: 0 for id_producto in iniciales}
+        rechazadas = []
+        bloqueo = threading.Lock()
+
+        def vender(semilla):
+            aleatorio = random.Random(semilla)
+            for _ in range(ventas_por_hilo):
+                elegidos = aleatorio.sample(list(iniciales), aleatorio.randint(1, 3))
+                cantidades = [aleatorio.randint(1, 6) for _ in elegidos]
+                venta = Venta(cliente, [gestion_productos.productos[i] for i in elegidos], cantidades, 'zelle', 'divisas', 'contado', '2024-12-01')
+                try:
+                    sistema.confirmar_ventas([venta])
+                except ValueError:
+                    with bloqueo:
+                        rechazadas.append(venta)
+                    continue
+                with bloqueo:
+                    for id_producto, cantidad in zip(elegidos, cantidades):
+                        vendido[id_producto] += cantidad
+
+        inicio = time.perf_counter()
+        trabajadores = [threading.Thread(target=vender, args=(semilla,)) for semilla in range(hilos)]
+        for trabajador in trabajadores:
+            trabajador.start()
+        for trabajador in trabajadores:
+            trabajador.join()
+        segundos = time.perf_counter() - inicio
+
+        registradas = len(sistema.ventas) - ventas_iniciales
+        print(f"{registradas} ventas registradas y {len(rechazadas)} rechazadas por inventario en {segundos:.2f} s "
+              f"({registradas / segundos:.0f} ventas/s)")
+        assert registradas + len(rechazadas) == hilos * ventas_por_hilo
+        for id_producto, inicial in iniciales.items():
+            inventario = gestion_productos.productos[id_producto].inventory
+            assert inventario >= 0, f"Inventario negativo del producto {id_producto}"
+            assert inventario + vendido[id_producto] == inicial, f"Inventario inconsistente del producto {id_producto}"
+
+        # Lo guardado debe coincidir con lo que quedó en memoria
+        recargados = GestionProductos()
+        assert all(recargados.productos[i].inventory == gestion_productos.productos[i].inventory for i in iniciales)
+        assert len(SistemaVentas(GestionClientes(), recargados, GestionEnvios()).ventas) == len(sistema.ventas)
+        print("Inventario y ventas guardados coinciden: sin ventas de más ni ventas perdidas.")
+
+
+def prueba_inventario(hilos=8, ventas_por_hilo=100, inventario=150):
+    """Prueba de aprobado o fallo: varios hilos registran ventas (con su envío) de pocos productos con poco inventario
+    mientras otro elimina algunas; el inventario final debe ser el inicial menos lo vendido en las ventas guardadas."""
+    import random
+    import threading
+    from Almacenamiento import ALMACENAMIENTO
+    from Cliente import GestionClientes
+    from Producto import GestionProductos
+    from Envio import Envio, GestionEnvios
+    from Venta import SistemaVentas, Venta
+    hilos, ventas_por_hilo, inventario = int(hilos), int(ventas_por_hilo), int(inventario)
+    with open(os.path.join(DIRECTORIO, 'productos.json'), 'r', encoding='utf-8') as f:
+        productos = json.load(f)[:3]
+    # Se intenta vender mucho más de lo que hay, para que las ventas compitan por las últimas unidades
+    for producto in productos:
+        producto['inventory'] = inventario
+    iniciales = {producto['id']: producto['inventory'] for producto in productos}
+
+    print(f"Almacenamiento: {ALMACENAMIENTO}, {hilos} hilos x {ventas_por_hilo} ventas sobre {len(iniciales)} productos "
+          f"con {inventario} unidades cada uno")
+    with DirectorioDePrueba(productos=productos):
+        gestion_productos = GestionProductos()
+        gestion_envios = GestionEnvios()
+        sistema = SistemaVentas(GestionClientes(), gestion_productos, gestion_envios)
+        ventas_previas, envios_previos = set(sistema.ventas), len(gestion_envios.envios)
+        cliente = sistema.gestion_clientes.buscar_cliente('31423389')
+        registradas, rechazadas, eliminadas = [], [], []
+        bloqueo = threading.Lock()
+        terminado = threading.Event()
+
+        def vender(semilla):
+            aleatorio = random.Random(semilla)
+            for numero in range(ventas_por_hilo):
+                elegidos = aleatorio.sample(list(iniciales), aleatorio.randint(1, len(iniciales)))
+                venta = Venta(cliente, [gestion_productos.productos[i] for i in elegidos],
+                              [aleatorio.randint(1, 4) for _ in elegidos], 'zelle', 'divisas', 'contado', '2024-12-01')
+                envio = Envio(f'PRUEBA-{semilla}-{numero}', 'Zoom', None, 1.0, '2024-12-01')
+                try:
+                    factura, = sistema.confirmar_ventas([venta], [envio])
+                except ValueError as e:
+                    assert 'Inventario insuficiente' in str(e), f"Venta rechazada por otro motivo: {e}"
+                    with bloqueo:
+                        rechazadas.append(venta)
+                    continue
+                with bloqueo:
+                    registradas.append(factura.id)
+
+        def eliminar():
+            # Devuelve al inventario algunas ventas mientras se siguen registrando otras
+            aleatorio = random.Random(hilos)
+            while not terminado.is_set():
+                with bloqueo:
+                    candidatas = [id_venta for id_venta in registradas if id_venta not in eliminadas]
+                if candidatas and aleatorio.random() < 0.3:
+                    id_venta = aleatorio.choice(candidatas)
+                    assert sistema.quitar_venta(id_venta) is not None
+                    with bloqueo:
+                        eliminadas.append(id_venta)
+                time.sleep(0.001)
+
+        inicio = time.perf_counter()
+        trabajadores = [threading.Thread(target=vender, args=(semilla,)) for semilla in range(hilos)]
+        eliminador = threading.Thread(target=eliminar)
+        for trabajador in trabajadores + [eliminador]:
+            trabajador.start()
+        for trabajador in trabajadores:
+            trabajador.join()
+        terminado.set()
+        eliminador.join()
+        segundos = time.perf_counter() - inicio
+        print(f"{len(registradas)} ventas registradas, {len(rechazadas)} rechazadas por inventario y "
+              f"{len(eliminadas)} eliminadas en {segundos:.2f} s")
+
+        assert len(registradas) + len(rechazadas) == hilos * ventas_por_hilo, "Se perdieron ventas"
+        assert rechazadas, "El inventario alcanzó para todo: la prueba no hizo competir a las ventas"
+        # Lo vendido se cuenta en las ventas guardadas, no en lo que anotaron los hilos
+        recargados = GestionProductos()
+        recargadas = SistemaVentas(GestionClientes(), recargados, GestionEnvios())
+        nuevas = [factura for id_venta, factura in recargadas.ventas.items() if id_venta not in ventas_previas]
+        assert sorted(factura.id for factura in nuevas) == sorted(set(registradas) - set(eliminadas)), "Ventas guardadas distintas de las registradas"
+        vendido = dict.fromkeys(iniciales, 0)
+        for factura in nuevas:
+            for id_producto, (_, cantidad) in zip(factura.ids_productos, factura.productos):
+                vendido[id_producto] += cantidad
+        for id_producto, inicial in iniciales.items():
+            final = recargados.productos[id_producto].inventory
+            assert final >= 0, f"Se vendió de más el producto {id_producto}: inventario {final}"
+            assert final == inicial - vendido[id_producto], \
+                f"Producto {id_producto}: inventario final {final}, pero {inicial} - {vendido[id_producto]} vendido = {inicial - vendido[id_producto]}"
+            assert gestion_productos.productos[id_producto].inventory == final, f"Inventario en memoria y guardado distintos del producto {id_producto}"
+        assert len(recargadas.gestion_envios.envios) == envios_previos + len(registradas), "Ventas sin su envío o envíos de más"
+        print("Sin ventas de más: el inventario final es el inicial menos lo vendido en las ventas guardadas.")
+
+
+def vender_en_instancia(directorio, semilla, ventas, ids_productos, barrera, cola):
+    """Una instancia de la tienda (otro proceso) para prueba_multiproceso."""
+    import random
+    os.chdir(directorio)
+    from Cliente import GestionClientes
+    from Producto import GestionProductos
+    from Envio import GestionEnvios
+    from Venta import SistemaVentas, Venta
+    gestion_clientes = GestionClientes()
+    gestion_productos = GestionProductos()
+    sistema = SistemaVentas(gestion_clientes, gestion_productos, GestionEnvios())
+    cliente = gestion_clientes.buscar_cliente('31423389')
+    aleatorio = random.Random(semilla)
+    vendido = {id_producto: 0 for id_producto in ids_productos}
+    rechazadas = 0
+    barrera.wait()  # Todas las instancias empiezan a vender a la vez
+    inicio = time.perf_counter()
+    for _ in range(ventas):
+        elegidos = aleatorio.sample(ids_productos, aleatorio.randint(1, 3))
+        cantidades = [aleatorio.randint(1, 6) for _ in elegidos]
+        venta = Venta(cliente, [gestion_productos.productos[i] for i in elegidos], cantidades, 'zelle', 'divisas', 'contado', '2024-12-01')
+        try:
+            sistema.confirmar_ventas([venta])
+        except ValueError:
+            rechazadas += 1
+            continue
+        for id_producto, cantidad in zip(elegidos, cantidades):
+            vendido[id_producto] += cantidad
+    segundos = time.perf_counter() - inicio
+
+    # Cuando terminan todas, el Vigilante debe traer a memoria lo que guardaron las demás
+    barrera.wait()
+    limite = time.monotonic() + 10
+    while (gestion_productos.almacen.cambio_ajeno() or sistema.almacen.cambio_ajeno()) and time.monotonic() < limite:
+        time.sleep(0.05)
+    cola.put((vendido, rechazadas, segundos, sorted(sistema.ventas),
+              {id_producto: gestion_productos.productos[id_producto].inventory for id_producto in ids_productos}))
+
+
+def prueba_multiproceso(procesos=4, ventas_por_proceso=200):
+    """Varias instancias (procesos) venden a la vez sobre los mismos datos en modo multiproceso: no se debe
+    vender de más ni perder ventas, y cada instancia debe terminar con los cambios de las demás en memoria."""
+    import multiprocessing
+    procesos, ventas_por_proceso = int(procesos), int(ventas_por_proceso)
+    with open(os.path.join(DIRECTORIO, 'productos.json'), 'r', encoding='utf-8') as f:
+        productos = json.load(f)[:10]
+    # Alcanza para más o menos la mitad de lo que se intenta vender
+    for producto in productos:
+        producto['inventory'] = procesos * ventas_por_proceso * 2 // len(productos)
+    iniciales = {producto['id']: producto['inventory'] for producto in productos}
+
+    os.environ['TIENDA_MULTIPROCESO'] = '1'  # Lo leen las instancias al importar Almacenamiento
+    from Almacenamiento import ALMACENAMIENTO
+    print(f"Almacenamiento: {ALMACENAMIENTO}, {procesos} instancias x {ventas_por_proceso} ventas")
+    contexto = multiprocessing.get_context('spawn')
+    with DirectorioDePrueba(productos=productos) as directorio:
+        from Producto import GestionProductos
+        from Cliente import GestionClientes
+        from Envio import GestionEnvios
+        from Venta import SistemaVentas
+        ventas_iniciales = len(SistemaVentas(GestionClientes(), GestionProductos(), GestionEnvios()).ventas)
+        barrera = contexto.Barrier(procesos)
+        cola = contexto.Queue()
+        instancias = [contexto.Process(target=vender_en_instancia, args=(directorio, semilla, ventas_por_proceso, list(iniciales), barrera, cola))
+                      for semilla in range(procesos)]
+        for instancia in instancias:
+            instancia.start()
+        resultados = []
+        try:
+            while len(resultados) < procesos:
+                try:
+                    resultados.append(cola.get(timeout=1))
+                except queue.Empty:
+                    # Si una instancia falló, las demás se quedan esperándola en la barrera
+                    if any(instancia.exitcode not in (None, 0) for instancia in instancias):
+                        raise RuntimeError("Una de las instancias terminó con un error (ver arriba)")
+        finally:
+            for instancia in instancias:
+                if len(resultados) < procesos:
+                    instancia.terminate()
+                instancia.join()
+
+        segundos = max(resultado[2] for resultado in resultados)
+        rechazadas = sum(resultado[1] for resultado in resultados)
+        registradas = procesos * ventas_por_proceso - rechazadas
+        print(f"{registradas} ventas registradas y {rechazadas} rechazadas por inventario en {segundos:.2f} s "
+              f"({registradas / segundos:.0f} ventas/s entre todas las instancias)")
+
+        gestion_productos = GestionProductos()
+        sistema = SistemaVentas(GestionClientes(), gestion_productos, GestionEnvios())
+        assert len(sistema.ventas) == ventas_iniciales + registradas, "Se perdieron ventas"
+        for id_producto, inicial in iniciales.items():
+            inventario = gestion_productos.productos[id_producto].inventory
+            vendido = sum(resultado[0][id_producto] for resultado in resultados)
+            assert inventario >= 0, f"Inventario negativo del producto {id_producto}"
+            assert inventario + vendido == inicial, f"Inventario inconsistente del producto {id_producto}"
+        print("Inventario y ventas guardados coinciden: sin ventas de más ni ventas perdidas.")
+        for _, _, _, ventas, inventarios in resultados:
+            assert ventas == sorted(sistema.ventas), "Una instancia no recibió las ventas de las demás"
+            assert all(inventarios[i] == gestion_productos.productos[i].inventory for i in iniciales), "Una instancia no recibió el inventario de las demás"
+        print("Cada instancia terminó con las ventas y el inventario de las demás en memoria.")
+
+
+def percentil(ordenados, p):
+    """Percentil p (0 a 100) de una lista ya ordenada."""
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+async def pedir(lector, escritor, metodo, ruta, datos=None):
+    """Hace una petición HTTP/1.1 por una conexión ya abierta (que queda abierta) y devuelve (estado, cuerpo)."""
+    cuerpo = json.dumps(datos).encode('utf-8') if datos is not None else b''
+    escritor.write(f"{metodo} {ruta} HTTP/1.1\r\nHost: tienda\r\nContent-Length: {len(cuerpo)}\r\n\r\n".encode('latin-1') + cuerpo)
+    await escritor.drain()
+    estado = int((await lector.readline()).split()[1])
+    largo = 0
+    while True:
+        linea = await lector.readline()
+        if linea in (b'\r\n', b''):
+            break
+        nombre, _, valor = linea.decode('latin-1').partition(':')
+        if nombre.strip().lower() == 'content-length':
+            largo = int(valor)
+    return estado, await lector.readexactly(largo)
+
+
+async def usuario_servidor(host, puerto, peticiones, semilla, productos, tiempos, estados):
+    """Un usuario del servicio: una sola conexión (keep-alive) por la que hace sus peticiones una tras otra."""
+    import asyncio
+    import random
+    from urllib.parse import urlencode
+    aleatorio = random.Random(semilla)
+    categorias = sorted({producto['category'] for producto in productos})
+    mezcla = {  # tipo de petición -> peso
+        'producto': 40, 'categoria': 15, 'ventas del cliente': 15, 'totales': 10, 'mas vendidos': 10, 'registrar venta': 10,
+    }
+    lector, escritor = await asyncio.open_connection(host, puerto)
+    try:
+        for tipo in aleatorio.choices(list(mezcla), weights=list(mezcla.values()), k=peticiones):
+            datos = None
+            metodo = 'GET'
+            if tipo == 'producto':
+                ruta = f"/productos/{aleatorio.choice(productos)['id']}"
+            elif tipo == 'categoria':
+                ruta = "/productos?" + urlencode({'categoria': aleatorio.choice(categorias), 'limite': 20})
+            elif tipo == 'ventas del cliente':
+                ruta = "/ventas?cedula_rif=31423389&limite=20"
+            elif tipo == 'totales':
+                ruta = "/estadisticas/ventas?periodo=mes"
+            elif tipo == 'mas vendidos':
+                ruta = "/estadisticas/productos?k=5"
+            else:
+                metodo, ruta = 'POST', "/ventas"
+                datos = {"cedula_rif": "31423389", "metodo_pago": "zelle", "tipo_moneda": "divisas", "fecha": "2024-12-01",
+                         "productos": [{"id": aleatorio.choice(productos)['id'], "cantidad": aleatorio.randint(1, 2)}]}
+            inicio = time.perf_counter()
+            estado, _ = await pedir(lector, escritor, metodo, ruta, datos)
+            tiempos.setdefault(tipo, []).append(time.perf_counter() - inicio)
+            estados[estado] = estados.get(estado, 0) + 1
+            # Una venta puede rechazarse (400) si se acaba el inventario; cualquier otro error es una falla
+            assert estado in (200, 201) or (tipo == 'registrar venta' and estado == 400), f"{metodo} {ruta}: estado {estado}"
+    finally:
+        escritor.close()
+
+
+def prueba_servidor(conexiones=32, peticiones=5000):
+    """Carga sobre Servidor.py (en otro proceso): varias conexiones keep-alive a la vez, con consultas y algunas ventas.
+    Informa las peticiones por segundo y la latencia p50 y p99 de cada tipo de petición."""
+    import asyncio
+    import threading
+    from Almacenamiento import ALMACENAMIENTO
+    conexiones, peticiones = int(conexiones), int(peticiones)
+    with open(os.path.join(DIRECTORIO, 'productos.json'), 'r', encoding='utf-8') as f:
+        productos = json.load(f)
+
+    print(f"Almacenamiento: {ALMACENAMIENTO}, {conexiones} conexiones, {peticiones} peticiones")
+    with DirectorioDePrueba() as directorio:
+        servidor = subprocess.Popen([sys.executable, os.path.join(DIRECTORIO, 'Servidor.py'), '0'], cwd=directorio,
+                                    stdout=subprocess.PIPE, text=True, encoding='utf-8')
+        try:
+            linea = servidor.stdout.readline()
+            while linea and 'http://' not in linea:
+                linea = servidor.stdout.readline()
+            if not linea:
+                raise RuntimeError("El servidor no arrancó")
+            host, puerto = linea.strip().rsplit('http://', 1)[1].rsplit(':', 1)
+            # Lo que el servidor siga escribiendo se descarta, para que no se detenga con la tubería llena
+            threading.Thread(target=lambda: [None for _ in servidor.stdout], daemon=True).start()
+
+            tiempos = {}  # tipo de petición -> segundos de cada una
+            estados = {}  # estado HTTP -> cantidad
+            por_conexion = [peticiones // conexiones + (1 if i < peticiones % conexiones else 0) for i in range(conexiones)]
+
+            async def cargar():
+                await asyncio.gather(*(usuario_servidor(host, int(puerto), cantidad, semilla, productos, tiempos, estados)
+                                       for semilla, cantidad in enumerate(por_conexion)))
+
+            inicio = time.perf_counter()
+            asyncio.run(cargar())
+            segundos = time.perf_counter() - inicio
+        finally:
+            servidor.terminate()
+            servidor.wait()
+
+    print(f"{peticiones} peticiones en {segundos:.2f} s ({peticiones / segundos:.0f} peticiones/s), "
+          f"estados: {', '.join(f'{estado}: {cantidad}' for estado, cantidad in sorted(estados.items()))}")
+    todas = sorted(tiempo for lista in tiempos.values() for tiempo in lista)
+    for tipo, lista in sorted(tiempos.items()) + [('todas', todas)]:
+        lista = sorted(lista)
+        print(f"{tipo:>20}: {len(lista):6d} peticiones, p50 {percentil(lista, 50) * 1000:7.2f} ms, p99 {percentil(lista, 99) * 1000:7.2f} ms")
+
+
+def prueba_catalogo(reintentos=3, espera=0.05):
+    """Sincronización del catálogo contra un servidor HTTP local: combina por id sin duplicar productos, un 304
+    (después de ETag o Last-Modified) no cambia nada, los 5xx se reintentan con espera y la cache en disco se reutiliza."""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from Catalogo import ClienteCatalogo
+    from Producto import GestionProductos
+    reintentos, espera = int(reintentos), float(espera)
+    with open(os.path.join(DIRECTORIO, 'productos.json'), 'r', encoding='utf-8') as f:
+        locales = json.load(f)[:10]
+    # El catálogo remoto cambia el precio y el inventario de tres productos y agrega uno nuevo
+    catalogo = [dict(producto) for producto in locales]
+    for producto in catalogo[:3]:
+        producto['price'] = round(producto['price'] + 1.5, 2)
+        producto['inventory'] += 7
+    catalogo.append(dict(locales[0], id=max(producto['id'] for producto in locales) + 1, name='Producto nuevo del catálogo'))
+    cuerpo = json.dumps(catalogo, ensure_ascii=False).encode('utf-8')
+    validadores = {'etag': ('ETag', 'If-None-Match', '"catalogo-1"'),
+                   'last_modified': ('Last-Modified', 'If-Modified-Since', 'Sun, 01 Dec 2024 00:00:00 GMT')}
+    estado = {'modo': 'etag', 'condiciones': []}  # modo: 'etag', 'last_modified' o 'error'; condición enviada en cada petición
+
+    class ManejadorCatalogo(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, como un servidor real
+
+        def do_GET(self):
+            if estado['modo'] == 'error':
+                estado['condiciones'].append(None)
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            encabezado, condicional, valor = validadores[estado['modo']]
+            estado['condiciones'].append(self.headers.get(condicional))
+            if self.headers.get(condicional) == valor:
+                self.send_response(304)
+                self.send_header(encabezado, valor)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.send_header(encabezado, valor)
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass  # Sin una línea por petición
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), ManejadorCatalogo)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{servidor.server_port}/products.json'
+    try:
+        for modo, (encabezado, condicional, valor) in validadores.items():
+            estado['modo'] = modo
+            with DirectorioDePrueba(productos=locales):
+                gestion_productos = GestionProductos()
+                originales = dict(gestion_productos.productos)
+                gestion_productos.cliente_catalogo = ClienteCatalogo(url, reintentos=reintentos, espera=espera)
+
+                # 200: se combina por id, actualizando en su lugar los productos que cambiaron
+                assert gestion_productos.sincronizar_catalogo() == (1, 3), "Se esperaban 1 producto nuevo y 3 actualizados"
+                assert estado['condiciones'][-1] is None, "La primera descarga no debe ser condicional"
+                assert all(gestion_productos.productos[id_producto] is producto for id_producto, producto in originales.items())
+                for remoto in catalogo:
+                    producto = gestion_productos.productos[remoto['id']]
+                    assert (producto.price, producto.inventory) == (remoto['price'], remoto['inventory']), f"Producto {remoto['id']} sin actualizar"
+                guardados = GestionProductos().serializar_productos()
+                assert sorted(producto['id'] for producto in guardados) == sorted(producto['id'] for producto in catalogo), "Productos duplicados o perdidos"
+                assert guardados == gestion_productos.serializar_productos()
+
+                # 304: se envía el validador recibido y el catálogo no cambia
+                antes = gestion_productos.serializar_productos()
+                assert gestion_productos.sincronizar_catalogo() == (0, 0)
+                assert estado['condiciones'][-1] == valor, f"No se envió {condicional}"
+                assert gestion_productos.serializar_productos() == antes
+                assert GestionProductos().serializar_productos() == antes
+
+                # Cache en disco: otro cliente (como después de reiniciar) reutiliza el validador y los datos guardados
+                otro = ClienteCatalogo(url, reintentos=reintentos, espera=espera)
+                try:
+                    assert otro.obtener() == (catalogo, False), "No se reutilizó la cache en disco"
+                finally:
+                    otro.cerrar()
+                assert estado['condiciones'][-1] == valor
+                gestion_productos.cliente_catalogo.cerrar()
+            print(f"{encabezado}: 200 combina por id sin duplicar, 304 no cambia el catálogo y la cache en disco se reutiliza.")
+
+        # 5xx: se reintenta con espera creciente y al final la sincronización falla sin tocar el catálogo
+        estado['modo'] = 'error'
+        with DirectorioDePrueba(productos=locales):
+            gestion_productos = GestionProductos()
+            gestion_productos.cliente_catalogo = ClienteCatalogo(url, reintentos=reintentos, espera=espera)
+            antes = gestion_productos.serializar_productos()
+            del estado['condiciones'][:]
+            inicio = time.perf_counter()
+            assert gestion_productos.sincronizar_catalogo() is None, "Un 503 persistente debe hacer fallar la sincronización"
+            segundos = time.perf_counter() - inicio
+            gestion_productos.cliente_catalogo.cerrar()
+            assert len(estado['condiciones']) == reintentos + 1, f"Se esperaban {reintentos + 1} intentos y hubo {len(estado['condiciones'])}"
+            assert segundos >= espera, "Los reintentos no esperaron entre sí"
+            assert gestion_productos.serializar_productos() == antes
+            assert not os.path.exists('catalogo.cache'), "Una respuesta con error no se debe guardar en la cache"
+        print(f"503: {reintentos + 1} intentos en {segundos:.2f} s y la sincronización falla sin cambiar el catálogo.")
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def prueba_busqueda(cantidad=100000, consultas=1000):
+    """Búsqueda de texto (Busqueda.py) en un catálogo sintético: armado del índice, consultas por segundo
+    (exactas, sin acentos, con errores de tipeo, con la última palabra incompleta) y actualización incremental."""
+    import random
+    import re
+    from Busqueda import normalizar, palabras
+    from Producto import GestionProductos
+    cantidad, consultas = int(cantidad), int(consultas)
+    with open(os.path.join(DIRECTORIO, 'productos.json'), 'r', encoding='utf-8') as f:
+        modelos = json.load(f)
+
+    aleatorio = random.Random(0)
+    marcas = ['Bosch', 'Mann', 'Mahle', 'NGK', 'Denso', 'Valeo', 'Castrol', 'Mobil', 'Motorcraft', 'ACDelco', 'Febi', 'Sachs', 'Gates', 'SKF']
+    vehiculos = sorted({vehiculo for modelo in modelos for vehiculo in modelo['compatible_vehicles']})
+    productos = []
+    for i in range(1, cantidad + 1):
+        modelo = aleatorio.choice(modelos)
+        pieza = re.sub(r' \d+$', '', modelo['name'])  # "Filtro de aire 5" -> "Filtro de aire"
+        compatibles = aleatorio.sample(vehiculos, aleatorio.randint(1, 3))
+        productos.append(dict(modelo, id=i, name=f"{pieza} {aleatorio.choice(marcas)} {i}", compatible_vehicles=compatibles,
+                              description=f"{modelo['description']}. Compatible con {', '.join(compatibles)}"))
+
+    def con_error(palabra):
+        posicion = aleatorio.randrange(1, len(palabra) - 2)
+        if aleatorio.random() < 0.5:  # Dos letras transpuestas
+            return palabra[:posicion] + palabra[posicion + 1] + palabra[posicion] + palabra[posicion + 2:]
+        return palabra[:posicion] + aleatorio.choice('aeioulnrst') + palabra[posicion + 1:]
+
+    # Cada consulta sale de un producto y lleva las palabras que debe contener el primer resultado
+    tipos = {'exacta': [], 'sin acentos': [], 'con errores': [], 'incompleta': [], 'pieza y vehículo': []}
+    for _ in range(consultas):
+        producto = aleatorio.choice(productos)
+        pieza, marca, _ = producto['name'].rsplit(' ', 2)
+        esperadas = palabras(pieza)
+        tipos['exacta'].append((f"{pieza} {marca}", esperadas + palabras(marca)))
+        tipos['sin acentos'].append((normalizar(pieza), esperadas))
+        larga = max(esperadas, key=len)
+        tipos['con errores'].append((' '.join(con_error(palabra) if palabra == larga and len(palabra) >= 5 else palabra
+                                              for palabra in esperadas), esperadas))
+        ultima = esperadas[-1]
+        prefijo = ultima[:max(3, (len(ultima) + 1) // 2)]  # Quitar los acentos no cambia la cantidad de letras
+        tipos['incompleta'].append((f"{marca} {pieza[:len(pieza) - len(ultima) + len(prefijo)]}", palabras(marca) + esperadas[:-1] + [prefijo]))
+        vehiculo = producto['compatible_vehicles'][0]
+        tipos['pieza y vehículo'].append((f"{esperadas[0]} {vehiculo}", [esperadas[0]] + palabras(vehiculo)))
+
+    def contiene(producto, esperadas):
+        propias = palabras(f"{producto.name} {producto.category} {producto.description}")
+        # La última palabra puede estar incompleta en la consulta
+        return all(palabra in propias for palabra in esperadas[:-1]) and any(propia.startswith(esperadas[-1]) for propia in propias)
+
+    with DirectorioDePrueba(productos=productos):
+        gestion = GestionProductos()
+        print(f"{len(gestion.productos)} productos cargados")
+        milisegundos, _ = cronometrar(lambda: gestion.buscar_productos('filtro'), repeticiones=1)  # La primera búsqueda arma el índice
+        gestion.buscador = None
+        _, _, pico = medir(lambda: gestion.buscar_productos('filtro'))  # Con tracemalloc es más lento: se mide aparte
+        buscador = gestion.buscador
+        print(f"Índice armado en {milisegundos / 1000:.2f} s (pico de memoria {pico:.0f} MB): {len(buscador.listas)} palabras, "
+              f"{len(buscador.por_borrado)} variantes para errores de tipeo")
+
+        for tipo, lista in tipos.items():
+            tiempos = []
+            aciertos = 0
+            for texto, esperadas in lista:
+                inicio = time.perf_counter()
+                resultado = gestion.buscar_productos(texto)
+                tiempos.append(time.perf_counter() - inicio)
+                aciertos += bool(resultado) and contiene(resultado[0], esperadas)
+            assert aciertos >= 0.99 * len(lista), (tipo, aciertos)
+            tiempos.sort()
+            print(f"{tipo:>18}: {len(lista) / sum(tiempos):7.0f} consultas/s, p50 {percentil(tiempos, 50) * 1000:6.2f} ms, "
+                  f"p99 {percentil(tiempos, 99) * 1000:6.2f} ms, primer resultado correcto en {aciertos}/{len(lista)}")
+
+        texto, esperadas = tipos['sin acentos'][0]
+        lineal, _ = cronometrar(lambda: [producto for producto in gestion.productos.values()
+                                         if all(palabra in normalizar(f"{producto.name} {producto.category} {producto.description}")
+                                                for palabra in esperadas)], repeticiones=1)
+        print(f"Recorriendo todo el catálogo sin índice: {lineal:.0f} ms por consulta")
+
+        # Altas, cambios y bajas: el índice se actualiza producto a producto, sin rearmarse
+        cambiados = aleatorio.sample(list(gestion.productos.values()), 1000)
+        with gestion.bloqueo:
+            inicio = time.perf_counter()
+            for producto in cambiados:
+                gestion.cambiar_campos(producto, {'name': f"Turbocompresor {producto.id}"})
+            cambio = (time.perf_counter() - inicio) / len(cambiados)
+            assert len(gestion.buscar_productos('turbocompresor', None)) == len(cambiados)
+            assert len(gestion.buscar_productos('turbocompresr', None)) == len(cambiados)
+            inicio = time.perf_counter()
+            for producto in cambiados:
+                gestion.retirar_producto(producto)
+            baja = (time.perf_counter() - inicio) / len(cambiados)
+            assert not gestion.buscar_productos('turbocompresor')
+            inicio = time.perf_counter()
+            for producto in cambiados:
+                gestion.incorporar_producto(producto)
+            alta = (time.perf_counter() - inicio) / len(cambiados)
+            assert len(gestion.buscar_productos('turbocompresor', None)) == len(cambiados)
+        print(f"Cambio, baja y alta en memoria (con todos los índices del gestor): {cambio * 1e6:.0f}, {baja * 1e6:.0f} "
+              f"y {alta * 1e6:.0f} µs por producto")
+
+
+PRUEBAS = {
+    'arranque': prueba_arranque,
+    'carga': prueba_carga,
+    'memoria': prueba_memoria,
+    'ventas': prueba_consultas_ventas,
+    'pagos': prueba_consultas_pagos,
+    'envios': prueba_consultas_envios,
+    'ingesta': prueba_ingesta,
+    'concurrencia': prueba_concurrencia,
+    'inventario': prueba_inventario,
+    'multiproceso': prueba_multiproceso,
+    'servidor': prueba_servidor,
+    'catalogo': prueba_catalogo,
+    'busqueda': prueba_busqueda,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in PRUEBAS:
+        print(__doc__.strip())
+        print("Pruebas disponibles: " + ", ".join(PRUEBAS))
+        sys.exit(2)
+    PRUEBAS[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,266 @@
+"""Búsqueda de texto: índice invertido con ranking BM25 y tolerancia a errores de tipeo.
+
+Los textos se normalizan (minúsculas, sin acentos) y se separan en palabras. El índice guarda, para cada
+palabra, los registros que la contienen con su frecuencia ponderada según el campo (una palabra del nombre
+pesa más que una de la descripción). Se actualiza registro a registro al agregar, modificar o eliminar.
+
+Una palabra de la consulta que no está en el índice se busca entre las que están a un error de tipeo
+(a dos en las palabras largas); los candidatos salen de un índice de las palabras con una letra borrada,
+así no se compara la consulta con todo el vocabulario. La última palabra de la consulta también se busca
+como prefijo, para encontrar mientras se escribe.
+
+Cada lista guarda ya calculada la parte del puntaje que depende del registro (el impacto), así una consulta
+solo multiplica por el idf y suma. El impacto usa el largo promedio de los registros; se recalculan todos
+cuando el promedio real se aparta más de TOLERANCIA_PROMEDIO del usado.
+"""
+
+import heapq
+import math
+import re
+import unicodedata
+from bisect import bisect_left, insort
+
+K1 = 1.2  # Saturación de la frecuencia de una palabra (BM25)
+B = 0.75  # Cuánto se castiga un registro largo (BM25)
+PALABRAS_VACIAS = frozenset("a al con de del el en la las lo los o para por se sin su un una y".split())
+LETRAS_UN_ERROR = 4  # Palabras de la consulta desde las que se tolera un error de tipeo
+LETRAS_DOS_ERRORES = 8  # ... y desde las que se toleran dos
+LETRAS_PREFIJO = 3  # Largo mínimo de la última palabra para buscarla como prefijo
+MAXIMO_PREFIJOS = 50  # Palabras que puede abarcar un prefijo
+PESO_PREFIJO = 0.8  # Lo que vale una palabra encontrada por prefijo respecto de una exacta
+PESO_ERROR = 0.6  # ... y una encontrada con un error de tipeo (con dos, su cuadrado)
+TOLERANCIA_PROMEDIO = 0.01  # Cuánto puede cambiar el largo promedio de los registros sin recalcular los impactos
+
+_PALABRA = re.compile(r"[a-z0-9]+")
+
+
+def normalizar(texto):
+    """Minúsculas y sin acentos: 'Transmisión' -> 'transmision' (la ñ queda como n)."""
+    texto = texto.lower()
+    if texto.isascii():
+        return texto
+    return "".join(letra for letra in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(letra))
+
+
+def palabras(texto):
+    """Las palabras normalizadas del texto, sin las que no sirven para buscar ('de', 'para'...)."""
+    return [palabra for palabra in _PALABRA.findall(normalizar(texto)) if palabra not in PALABRAS_VACIAS]
+
+
+def borrados(palabra):
+    """Las palabras que quedan al borrar una letra de la palabra."""
+    return {palabra[:i] + palabra[i + 1:] for i in range(len(palabra))}
+
+
+def distancia(a, b, maximo):
+    """Errores de tipeo entre a y b (letras cambiadas, de más, de menos o transpuestas), o maximo + 1 si son más."""
+    if abs(len(a) - len(b)) > maximo:
+        return maximo + 1
+    anterior2 = None
+    anterior = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        actual = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            actual[j] = min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                actual[j] = min(actual[j], anterior2[j - 2] + 1)
+        if min(actual) > maximo:
+            return maximo + 1  # Ninguna alineación baja de maximo: no hace falta seguir
+        anterior2, anterior = anterior, actual
+    return min(anterior[-1], maximo + 1)
+
+
+class IndiceBusqueda:
+    """Índice invertido de registros identificados por clave, cada uno con varios campos de texto.
+
+    pesos indica cuánto vale una palabra de cada campo (por ejemplo {"name": 3, "description": 1}).
+    """
+
+    def __init__(self, pesos):
+        self.pesos = pesos
+        self.registros = {}  # clave -> {palabra: frecuencia ponderada}, para poder quitarlo
+        self.largos = {}  # clave -> largo ponderado del registro
+        self.largo_total = 0.0
+        self.listas = {}  # palabra -> {clave: impacto de la palabra en el registro}
+        self.promedio_impactos = 1.0  # Largo promedio con el que se calcularon los impactos
+        self.por_borrado = {}  # palabra con una letra borrada -> palabras del vocabulario (errores de tipeo)
+        self.ordenadas = None  # Vocabulario ordenado para los prefijos; se arma en la primera búsqueda por prefijo
+
+    def __len__(self):
+        return len(self.registros)
+
+    def agregar(self, clave, campos):
+        """Indexa el registro (campo -> texto); si la clave ya estaba, reemplaza lo que tenía."""
+        if clave in self.registros:
+            self.quitar(clave)
+        frecuencias = {}
+        largo = 0.0
+        for campo, texto in campos.items():
+            peso = self.pesos.get(campo, 1.0)
+            for palabra in palabras(texto or ""):
+                frecuencias[palabra] = frecuencias.get(palabra, 0.0) + peso
+                largo += peso
+        self.registros[clave] = frecuencias
+        self.largos[clave] = largo
+        self.largo_total += largo
+        for palabra, frecuencia in frecuencias.items():
+            lista = self.listas.get(palabra)
+            if lista is None:
+                lista = self.listas[palabra] = {}
+                self.incorporar_palabra(palabra)
+            lista[clave] = self.impacto(frecuencia, largo)
+
+    def quitar(self, clave):
+        frecuencias = self.registros.pop(clave, None)
+        if frecuencias is None:
+            return
+        self.largo_total -= self.largos.pop(clave)
+        for palabra in frecuencias:
+            lista = self.listas[palabra]
+            del lista[clave]
+            if not lista:
+                del self.listas[palabra]
+                self.olvidar_palabra(palabra)
+
+    def incorporar_palabra(self, palabra):
+        if palabra.isalpha() and len(palabra) >= LETRAS_UN_ERROR - 1:  # Los números y códigos se buscan exactos
+            for borrado in borrados(palabra):
+                self.por_borrado.setdefault(borrado, set()).add(palabra)
+        if self.ordenadas is not None:
+            insort(self.ordenadas, palabra)
+
+    def olvidar_palabra(self, palabra):
+        if palabra.isalpha() and len(palabra) >= LETRAS_UN_ERROR - 1:
+            for borrado in borrados(palabra):
+                parecidas = self.por_borrado[borrado]
+                parecidas.discard(palabra)
+                if not parecidas:
+                    del self.por_borrado[borrado]
+        if self.ordenadas is not None:
+            del self.ordenadas[bisect_left(self.ordenadas, palabra)]
+
+    def con_prefijo(self, prefijo):
+        if self.ordenadas is None:
+            self.ordenadas = sorted(self.listas)
+        encontradas = []
+        for palabra in self.ordenadas[bisect_left(self.ordenadas, prefijo):]:
+            if not palabra.startswith(prefijo) or len(encontradas) == MAXIMO_PREFIJOS:
+                break
+            if palabra != prefijo:
+                encontradas.append(palabra)
+        return encontradas
+
+    def parecidas(self, termino):
+        """Palabras del vocabulario a uno o dos errores de tipeo del término, con su número de errores."""
+        if not termino.isalpha() or len(termino) < LETRAS_UN_ERROR:
+            return {}
+        maximo = 2 if len(termino) >= LETRAS_DOS_ERRORES else 1
+        # Comparten una palabra con una letra borrada (o menos): cubre una letra cambiada, de más o de menos
+        # de cada lado; con dos errores se borra una letra más de la consulta
+        consultas = {termino} | borrados(termino)
+        if maximo == 2:
+            consultas |= {segundo for borrado in borrados(termino) for segundo in borrados(borrado)}
+        candidatas = set()
+        for consulta in consultas:
+            if consulta in self.listas:
+                candidatas.add(consulta)
+            candidatas |= self.por_borrado.get(consulta, set())
+        encontradas = {}
+        for candidata in candidatas:
+            errores = distancia(termino, candidata, maximo)
+            if 0 < errores <= maximo:
+                encontradas[candidata] = errores
+        return encontradas
+
+    def variantes(self, termino, ultima):
+        """Palabras del índice con las que se busca el término, con lo que vale cada una."""
+        variantes = {}
+        if termino in self.listas:
+            variantes[termino] = 1.0
+        else:
+            for palabra, errores in self.parecidas(termino).items():
+                variantes[palabra] = PESO_ERROR ** errores
+        if ultima and len(termino) >= LETRAS_PREFIJO:
+            for palabra in self.con_prefijo(termino):
+                variantes[palabra] = max(variantes.get(palabra, 0.0), PESO_PREFIJO)
+        return variantes
+
+    def buscar(self, consulta, k=10):
+        """Las k claves más relevantes para la consulta (todas las encontradas si k es None), como pares
+        (clave, puntaje) de la más a la menos relevante.
+
+        Van primero las que contienen más palabras de la consulta (exactas, parecidas o por prefijo) y,
+        entre ellas, las de mayor puntaje BM25. Cada palabra de la consulta suma una sola vez por registro,
+        con la mejor de sus variantes.
+        """
+        terminos = list(dict.fromkeys(palabras(consulta)))
+        if not terminos or not self.registros:
+            return []
+        self.actualizar_impactos()
+        variantes = [self.variantes(termino, ultima=posicion == len(terminos) - 1) for posicion, termino in enumerate(terminos)]
+        # Los que contienen todas las palabras van primero: si alcanzan para la respuesta, solo se puntúan esos
+        # (la intersección de las listas se hace en C y evita recorrer las listas largas de las palabras comunes)
+        todas = None
+        largo_listas = lambda variantes_termino: sum(len(self.listas[palabra]) for palabra in variantes_termino)
+        for variantes_termino in sorted(variantes, key=largo_listas):
+            if len(variantes_termino) == 1:
+                claves = self.listas[next(iter(variantes_termino))].keys()
+            else:
+                claves = set().union(*(self.listas[palabra].keys() for palabra in variantes_termino))
+            todas = set(claves) if todas is None else claves & todas  # Se recorre la más corta de las dos
+        if k is not None and len(todas) >= k:
+            puntajes = self.puntuar(variantes, todas)
+            orden = puntajes.__getitem__
+        else:
+            puntajes, cubiertos = self.puntuar(variantes), {}
+            for variantes_termino in variantes:
+                for clave in set().union(*(self.listas[palabra].keys() for palabra in variantes_termino)):
+                    cubiertos[clave] = cubiertos.get(clave, 0) + 1
+            orden = lambda clave: (cubiertos[clave], puntajes[clave])
+        mejores = sorted(puntajes, key=orden, reverse=True) if k is None else heapq.nlargest(k, puntajes, key=orden)
+        return [(clave, puntajes[clave]) for clave in mejores]
+
+    def puntuar(self, variantes, claves=None):
+        """Puntaje BM25 de cada registro que contiene alguna de las variantes (solo de las claves, si se indican)."""
+        total = len(self.registros)
+        puntajes = {}
+        for variantes_termino in variantes:
+            mejores = {}
+            for palabra, factor in variantes_termino.items():
+                lista = self.listas[palabra]
+                peso = factor * math.log(1 + (total - len(lista) + 0.5) / (len(lista) + 0.5))  # Por el idf
+                if claves is None:
+                    candidatas = lista
+                elif len(variantes_termino) == 1:
+                    candidatas = claves  # Todas las claves contienen la palabra
+                else:
+                    candidatas = lista.keys() & claves
+                if not mejores:
+                    mejores = {clave: peso * lista[clave] for clave in candidatas}
+                    continue
+                for clave in candidatas:
+                    puntaje = peso * lista[clave]
+                    if puntaje > mejores.get(clave, 0.0):
+                        mejores[clave] = puntaje
+            if not puntajes:
+                puntajes = mejores
+                continue
+            for clave, puntaje in mejores.items():
+                puntajes[clave] = puntajes.get(clave, 0.0) + puntaje
+        return puntajes
+
+    def impacto(self, frecuencia, largo):
+        """La parte del puntaje BM25 que depende del registro: la frecuencia de la palabra, saturada y
+        corregida por el largo del registro respecto del promedio."""
+        return frecuencia * (K1 + 1) / (frecuencia + K1 * (1 - B + B * largo / self.promedio_impactos))
+
+    def actualizar_impactos(self):
+        """Recalcula los impactos si el largo promedio real se alejó del que se usó para calcularlos."""
+        promedio = self.largo_total / len(self.registros) or 1.0
+        if abs(promedio - self.promedio_impactos) <= TOLERANCIA_PROMEDIO * self.promedio_impactos:
+            return
+        self.promedio_impactos = promedio
+        for clave, frecuencias in self.registros.items():
+            largo = self.largos[clave]
+            for palabra, frecuencia in frecuencias.items():
+                self.listas[palabra][clave] = self.impacto(frecuencia, largo)
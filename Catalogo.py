@@ -0,0 +1,73 @@
+import json
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from Almacenamiento import escribir_atomico
+
+URL_CATALOGO = os.environ.get('TIENDA_URL_CATALOGO', "https://raw.githubusercontent.com/Algoritmos-y-Programacion/api-proyecto/main/products.json")
+TIEMPO_ESPERA = (5, 30)  # Segundos para conectar y para leer la respuesta
+REINTENTOS = 3
+
+
+class ClienteCatalogo:
+    """Descarga el catálogo de productos de la API.
+
+    Usa una sesión persistente (reutiliza las conexiones), peticiones condicionales con ETag y
+    Last-Modified, y guarda la última respuesta en una cache en disco para poder usarla cuando el
+    servidor contesta 304 (sin cambios). Los errores de red y 429/5xx se reintentan con espera creciente.
+    """
+
+    def __init__(self, url=URL_CATALOGO, archivo_cache='catalogo.cache', reintentos=REINTENTOS, espera=0.5, tiempo_espera=TIEMPO_ESPERA):
+        self.url = url
+        self.archivo_cache = archivo_cache
+        self.tiempo_espera = tiempo_espera
+        reintento = Retry(
+            total=reintentos,
+            backoff_factor=espera,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False,
+        )
+        adaptador = HTTPAdapter(max_retries=reintento, pool_connections=1, pool_maxsize=4)
+        self.sesion = requests.Session()
+        self.sesion.mount('http://', adaptador)
+        self.sesion.mount('https://', adaptador)
+
+    def leer_cache(self):
+        try:
+            with open(self.archivo_cache, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return cache if cache.get('url') == self.url else None
+
+    def guardar_cache(self, respuesta, datos):
+        cache = {
+            'url': self.url,
+            'etag': respuesta.headers.get('ETag'),
+            'last_modified': respuesta.headers.get('Last-Modified'),
+            'datos': datos,
+        }
+        escribir_atomico(self.archivo_cache, json.dumps(cache, ensure_ascii=False).encode('utf-8'))
+
+    def obtener(self, condicional=True):
+        """Devuelve (productos, cambiado); cambiado es False si el servidor indica que el catálogo no cambió."""
+        cache = self.leer_cache() if condicional else None
+        encabezados = {}
+        if cache is not None:
+            if cache.get('etag'):
+                encabezados['If-None-Match'] = cache['etag']
+            if cache.get('last_modified'):
+                encabezados['If-Modified-Since'] = cache['last_modified']
+
+        respuesta = self.sesion.get(self.url, headers=encabezados, timeout=self.tiempo_espera)
+        if respuesta.status_code == 304 and cache is not None:
+            return cache['datos'], False
+        respuesta.raise_for_status()
+        datos = respuesta.json()
+        self.guardar_cache(respuesta, datos)
+        return datos, True
+
+    def cerrar(self):
+        self.sesion.close()
@@ -1,6 +1,10 @@
-import json
+import threading
+from Almacenamiento import Conflicto, crear_almacenamiento, reintentar, vigilar
 
 class Cliente:
+    __slots__ = ('nombre', 'apellido', 'cedula_rif', 'correo_electronico', 'direccion_envio', 'telefono')  # Sin __dict__ por cliente
+    CAMPOS = __slots__  # Campos que se guardan, en el orden de clientes.json
+
     def __init__(self, nombre, apellido, cedula_rif, correo_electronico, direccion_envio, telefono):
         self.nombre = nombre
         self.apellido = apellido
@@ -12,7 +16,13 @@ class Cliente:
     def show(self):
         return f"Nombre: {self.nombre} {self.apellido}\nCédula/RIF: {self.cedula_rif}\nCorreo electrónico: {self.correo_electronico}\nDirección de envío: {self.direccion_envio}\nTeléfono: {self.telefono}"
 
+    def a_dict(self):
+        return {campo: getattr(self, campo) for campo in self.CAMPOS}
+
 class ClienteJuridico(Cliente):
+    __slots__ = ('razon_social', 'nombre_contacto', 'telefono_contacto', 'correo_contacto')
+    CAMPOS = Cliente.CAMPOS + __slots__
+
     def __init__(self, razon_social, cedula_rif, correo_electronico, direccion_envio, telefono, nombre_contacto, telefono_contacto, correo_contacto):
         super().__init__("", "", cedula_rif, correo_electronico, direccion_envio, telefono)
         self.razon_social = razon_social
@@ -23,10 +33,152 @@ class ClienteJuridico(Cliente):
     def show(self):
         return f"Razón Social: {self.razon_social}\nCédula/RIF: {self.cedula_rif}\nCorreo electrónico: {self.correo_electronico}\nDirección de envío: {self.direccion_envio}\nTeléfono: {self.telefono}\nNombre de contacto: {self.nombre_contacto}\nTeléfono de contacto: {self.telefono_contacto}\nCorreo de contacto: {self.correo_contacto}"
 
+def cliente_desde_dict(data):
+    # Las ventas y los pagos guardan solo algunos datos del cliente, por eso los demás son opcionales
+    if 'razon_social' in data:  # Cliente Jurídico
+        return ClienteJuridico(
+            razon_social=data['razon_social'],
+            cedula_rif=data['cedula_rif'],
+            correo_electronico=data.get('correo_electronico', ''),
+            direccion_envio=data.get('direccion_envio', ''),
+            telefono=data.get('telefono', ''),
+            nombre_contacto=data.get('nombre_contacto', ''),  # En este caso utilice .get() para evitar un KeyError
+            telefono_contacto=data.get('telefono_contacto', ''),
+            correo_contacto=data.get('correo_contacto', '')
+        )
+    # Cliente Natural
+    return Cliente(
+        nombre=data.get('nombre', ''),
+        apellido=data.get('apellido', ''),
+        cedula_rif=data['cedula_rif'],
+        correo_electronico=data.get('correo_electronico', ''),
+        direccion_envio=data.get('direccion_envio', ''),
+        telefono=data.get('telefono', '')
+    )
+
 class GestionClientes:
     def __init__(self):
-        self.clientes = []
+        self.clientes = {}  # cédula/RIF -> cliente
+        self.indice_correo = {}  # correo en minúsculas -> cliente
+        self.externos = {}  # cédula/RIF -> cliente de ventas o pagos que no está registrado (una sola copia por cliente)
+        self.bloqueo = threading.RLock()  # Protege los clientes y el índice de correos si se usan desde varios hilos
+        self.almacen = crear_almacenamiento('clientes.json', campo_clave='cedula_rif', ensure_ascii=False)
         self.cargar_clientes()  # Cargar clientes al iniciar
+        vigilar(self)
+
+    def agregar_cliente(self, cliente):
+        """Agrega el cliente a los índices si su cédula/RIF y su correo no están registrados."""
+        if cliente.cedula_rif in self.clientes:
+            print("Ya existe un cliente con esa cédula o RIF.")
+            return False
+        correo = (cliente.correo_electronico or "").lower()
+        if correo and correo in self.indice_correo:
+            print("Ya existe un cliente con ese correo electrónico.")
+            return False
+        self.clientes[cliente.cedula_rif] = cliente
+        self.externos.pop(cliente.cedula_rif, None)
+        if correo:
+            self.indice_correo[correo] = cliente
+        return True
+
+    def retirar_cliente(self, cliente):
+        self.clientes.pop(cliente.cedula_rif, None)
+        correo = (cliente.correo_electronico or "").lower()
+        if self.indice_correo.get(correo) is cliente:
+            del self.indice_correo[correo]
+
+    def cambiar_datos(self, cliente, datos):
+        """Cambia los campos indicados del cliente, manteniendo el índice de correos."""
+        correo = (cliente.correo_electronico or "").lower()
+        if self.indice_correo.get(correo) is cliente:
+            del self.indice_correo[correo]
+        for campo, valor in datos.items():
+            setattr(cliente, campo, valor)
+        correo = (cliente.correo_electronico or "").lower()
+        if correo:
+            self.indice_correo[correo] = cliente
+
+    def guardar_cliente(self, cliente):
+        """Agrega el cliente y lo guarda; devuelve False si su cédula/RIF o su correo ya están registrados."""
+        def guardar():
+            with self.bloqueo:
+                if not self.agregar_cliente(cliente):
+                    return False
+                try:
+                    self.almacen.agregar(cliente.a_dict(), self.serializar_clientes)
+                except Conflicto:
+                    self.retirar_cliente(cliente)
+                    raise
+            return True
+        return reintentar(guardar, self)
+
+    def actualizar_cliente(self, cedula_rif, **datos):
+        """Modifica los campos indicados del cliente y lo guarda; devuelve el cliente, o None si no existe."""
+        def actualizar():
+            with self.bloqueo:
+                cliente = self.clientes.get(cedula_rif)
+                if cliente is None:
+                    return None
+                anteriores = {campo: getattr(cliente, campo) for campo in datos}
+                self.cambiar_datos(cliente, datos)
+                try:
+                    self.almacen.actualizar(cliente.cedula_rif, cliente.a_dict(), self.serializar_clientes)
+                except Conflicto:
+                    self.cambiar_datos(cliente, anteriores)
+                    raise
+            return cliente
+        return reintentar(actualizar, self)
+
+    def quitar_cliente(self, cedula_rif):
+        """Elimina el cliente y lo guarda; devuelve el cliente eliminado, o None si no existía."""
+        def quitar():
+            with self.bloqueo:
+                cliente = self.clientes.get(cedula_rif)
+                if cliente is None:
+                    return None
+                self.retirar_cliente(cliente)
+                try:
+                    self.almacen.eliminar(cedula_rif, self.serializar_clientes)
+                except Conflicto:
+                    self.agregar_cliente(cliente)
+                    raise
+                # Sus ventas y pagos siguen usando este objeto; se resuelven a él si se vuelven a cargar
+                self.externos[cedula_rif] = cliente
+            return cliente
+        return reintentar(quitar, self)
+
+    def refrescar(self):
+        """Aplica los clientes que registraron, editaron o eliminaron otras instancias (modo multiproceso).
+
+        Un cliente editado se actualiza en el mismo objeto, que comparten sus ventas y sus pagos.
+        """
+        with self.bloqueo:
+            pendientes = self.almacen.cambios_pendientes()
+            if pendientes is None:
+                return self.cargar_clientes()
+            cambios, generacion = pendientes
+            for cedula_rif, data in cambios:
+                cliente = self.clientes.get(cedula_rif)
+                nuevo = None if data is None else cliente_desde_dict(data)
+                if cliente is not None and nuevo is not None and type(cliente) is type(nuevo):
+                    self.cambiar_datos(cliente, nuevo.a_dict())
+                    continue
+                if cliente is not None:
+                    self.retirar_cliente(cliente)
+                    if nuevo is None:
+                        self.externos[cedula_rif] = cliente  # Como en quitar_cliente
+                if nuevo is not None:
+                    self.agregar_cliente(nuevo)
+            self.almacen.al_dia(generacion)
+
+    def resolver_cliente(self, data):
+        """Cliente de una venta o un pago guardado: el registrado con su cédula/RIF, o si no está registrado,
+        una única copia compartida construida con los datos guardados."""
+        cedula_rif = data['cedula_rif']
+        cliente = self.clientes.get(cedula_rif) or self.externos.get(cedula_rif)
+        if cliente is None:
+            cliente = self.externos[cedula_rif] = cliente_desde_dict(data)
+        return cliente
 
     def registrar_cliente(self):
         tipo_cliente = input("Ingrese el tipo de cliente (Natural/Jurídico): ").lower()
@@ -39,8 +191,8 @@ class GestionClientes:
             telefono = input("Ingrese el número de teléfono del cliente: ")
             
             cliente = Cliente(nombre, apellido, cedula_rif, correo_electronico, direccion_envio, telefono)
-            self.clientes.append(cliente)
-            self.guardar_clientes()  # Guardar clientes naturales después de registrar
+            if not self.guardar_cliente(cliente):  # Guardar clientes naturales después de registrar
+                return
             print("Cliente natural registrado exitosamente.")
         
         elif tipo_cliente == "jurídico":
@@ -54,24 +206,25 @@ class GestionClientes:
             correo_contacto = input("Ingrese el correo electrónico del contacto: ")
             
             cliente = ClienteJuridico(razon_social, cedula_rif, correo_electronico, direccion_envio, telefono, nombre_contacto, telefono_contacto, correo_contacto)
-            self.clientes.append(cliente)
-            self.guardar_clientes()  # Guardar clientes juridicos después de registrar
+            if not self.guardar_cliente(cliente):  # Guardar clientes juridicos después de registrar
+                return
             print("Cliente jurídico registrado exitosamente.")
         
         else:
             print("Tipo de cliente no válido. Por favor, ingrese 'Natural' o 'Jurídico'.")
 
     def buscar_cliente(self, cedula_rif=None, correo_electronico=None):
-        for cliente in self.clientes:
-            if cliente.cedula_rif == cedula_rif or cliente.correo_electronico == correo_electronico:
-                return cliente
+        if cedula_rif in self.clientes:
+            return self.clientes[cedula_rif]
+        if correo_electronico:
+            return self.indice_correo.get(correo_electronico.lower())
         return None
 
     def mostrar_clientes(self):
         if not self.clientes:
             print("No hay clientes registrados.")
         else:
-            for cliente in self.clientes:
+            for cliente in self.clientes.values():
                 print(cliente.show())
                 print("-" * 30)
 
@@ -86,73 +239,67 @@ class GestionClientes:
             nuevo_nombre = input(f"Nuevo nombre [{cliente.nombre}]: ") or cliente.nombre
             nuevo_apellido = input(f"Nuevo apellido [{cliente.apellido}]: ") or cliente.apellido
             nuevo_correo = input(f"Nuevo correo electrónico [{cliente.correo_electronico}]: ") or cliente.correo_electronico
+            correo_actual = (cliente.correo_electronico or "").lower()
+            if nuevo_correo.lower() != correo_actual and nuevo_correo.lower() in self.indice_correo:
+                print("Ya existe un cliente con ese correo electrónico. Se mantendrá el correo actual.")
+                nuevo_correo = cliente.correo_electronico
             nueva_direccion = input(f"Nueva dirección de envío [{cliente.direccion_envio}]: ") or cliente.direccion_envio
             nuevo_telefono = input(f"Nuevo teléfono [{cliente.telefono}]: ") or cliente.telefono
 
             # Actualizar los datos
-            cliente.nombre = nuevo_nombre
-            cliente.apellido = nuevo_apellido
-            cliente.correo_electronico = nuevo_correo
-            cliente.direccion_envio = nueva_direccion
-            cliente.telefono = nuevo_telefono
+            datos = {
+                'nombre': nuevo_nombre,
+                'apellido': nuevo_apellido,
+                'correo_electronico': nuevo_correo,
+                'direccion_envio': nueva_direccion,
+                'telefono': nuevo_telefono,
+            }
 
             # Si es cliente jurídico, actualizar datos adicionales
             if isinstance(cliente, ClienteJuridico):
-                nuevo_nombre_contacto = input(f"Nuevo nombre de contacto [{cliente.nombre_contacto}]: ") or cliente.nombre_contacto
-                nuevo_telefono_contacto = input(f"Nuevo teléfono de contacto [{cliente.telefono_contacto}]: ") or cliente.telefono_contacto
-                nuevo_correo_contacto = input(f"Nuevo correo de contacto [{cliente.correo_contacto}]: ") or cliente.correo_contacto
-                
-                cliente.nombre_contacto = nuevo_nombre_contacto
-                cliente.telefono_contacto = nuevo_telefono_contacto
-                cliente.correo_contacto = nuevo_correo_contacto
-
-            self.guardar_clientes()  # Guardar cambios después de editar
+                datos['nombre_contacto'] = input(f"Nuevo nombre de contacto [{cliente.nombre_contacto}]: ") or cliente.nombre_contacto
+                datos['telefono_contacto'] = input(f"Nuevo teléfono de contacto [{cliente.telefono_contacto}]: ") or cliente.telefono_contacto
+                datos['correo_contacto'] = input(f"Nuevo correo de contacto [{cliente.correo_contacto}]: ") or cliente.correo_contacto
+
+            self.actualizar_cliente(cliente.cedula_rif, **datos)  # Guardar cambios después de editar
             print("Cliente actualizado exitosamente.")
         else:
             print("Cliente no encontrado.")
 
     def eliminar_cliente(self, cedula_rif):
-        cliente = self.buscar_cliente(cedula_rif)
-        if cliente:
-            self.clientes.remove(cliente)
-            self.guardar_clientes()  # Guardar cambios después de eliminar
+        if self.quitar_cliente(cedula_rif) is not None:  # Guardar cambios después de eliminar
             print("Cliente eliminado exitosamente.")
         else:
             print("Cliente no encontrado.")
 
+    def serializar_clientes(self):
+        return [cliente.a_dict() for cliente in self.clientes.values()]
+
     def guardar_clientes(self):
-        with open('clientes.json', 'w', encoding='utf-8') as f:
-            json.dump([cliente.__dict__ for cliente in self.clientes], f, ensure_ascii=False, indent=4)
+        with self.bloqueo:
+            self.almacen.guardar(self.serializar_clientes())
 
     def cargar_clientes(self):
         try:
-            with open('clientes.json', 'r', encoding='utf-8') as f:
-                clientes_data = json.load(f)
-                self.clientes = []
-                for data in clientes_data:
-                    if 'razon_social' in data:  # Cliente Jurídico
-                        cliente = ClienteJuridico(
-                            razon_social=data['razon_social'],
-                            cedula_rif=data['cedula_rif'],
-                            correo_electronico=data['correo_electronico'],
-                            direccion_envio=data['direccion_envio'],
-                            telefono=data['telefono'],
-                            nombre_contacto=data.get('nombre_contacto', ''),  # En este caso utilice .get() para evitar un KeyError
-                            telefono_contacto=data.get('telefono_contacto', ''),
-                            correo_contacto=data.get('correo_contacto', '')
-                        )
-                    else:  # Cliente Natural
-                        cliente = Cliente(
-                            nombre=data.get('nombre', ''),
-                            apellido=data.get('apellido', ''),
-                            cedula_rif=data['cedula_rif'],
-                            correo_electronico=data['correo_electronico'],
-                            direccion_envio=data['direccion_envio'],
-                            telefono=data['telefono']
-                        )
-                    self.clientes.append(cliente)
+            clientes_data = self.almacen.iterar()
+            self.clientes = {}
+            self.indice_correo = {}
+            for data in clientes_data:
+                cliente = cliente_desde_dict(data)
+                if cliente.cedula_rif in self.clientes:
+                    print(f"Cliente repetido con cédula o RIF {cliente.cedula_rif}: se conserva el primero y se descarta este registro: {data}")
+                    self.almacen.requiere_compactar = True  # Al guardar, el archivo queda con un solo registro por cédula/RIF
+                    continue
+                correo = (cliente.correo_electronico or "").lower()
+                if correo and correo in self.indice_correo:
+                    # Es otro cliente: se conserva, pero el correo sigue llevando al primero que lo registró
+                    print(f"El correo {correo} del cliente {cliente.cedula_rif} ya es de otro cliente; a este solo se lo encontrará por su cédula o RIF.")
+                    self.clientes[cliente.cedula_rif] = cliente
+                    self.externos.pop(cliente.cedula_rif, None)
+                    continue
+                self.agregar_cliente(cliente)
         except FileNotFoundError:
-            self.clientes = []
+            self.clientes = {}
             
 # Menu de los clientes
 def menu_gestion_clientes(gestion):
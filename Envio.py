@@ -1,43 +1,135 @@
 import json
-from datetime import datetime
+import threading
+from datetime import date, datetime, timedelta
+from Almacenamiento import Conflicto, crear_almacenamiento, reintentar, vigilar
+from Agregados import firma_actual, registrar_cambio, registrar_cambios
 from Cliente import GestionClientes
+from Indices import IndiceHash, IndiceOrdenado, aplicar_cambios, consultar
+
+def normalizar(texto):
+    """Minúsculas y espacios simples, para comparar servicios y motorizados escritos de distinta forma."""
+    return " ".join(texto.lower().split()) if texto else ""
+
+def fecha_de(valor):
+    """Convierte 'YYYY-MM-DD', date o datetime en date (None se mantiene); ValueError con cualquier otro valor."""
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        return date.fromisoformat(valor)
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    raise ValueError(f"fecha no válida: {valor!r}")
 
 class Envio:
-    def __init__(self, orden_compra, servicio_envio, motorizado, costo, fecha):
+    __slots__ = ('id', 'orden_compra', 'servicio_envio', 'motorizado', 'costo', 'fecha', 'servicio_normalizado', 'motorizado_normalizado')  # Sin __dict__ por envío
+
+    def __init__(self, orden_compra, servicio_envio, motorizado, costo, fecha, id=None):
+        self.id = id  # Lo asigna GestionEnvios al registrar el envío
         self.orden_compra = orden_compra
         self.servicio_envio = servicio_envio
+        if motorizado is not None and not isinstance(motorizado, dict):
+            raise ValueError(f"motorizado no válido: {motorizado!r}")
         self.motorizado = motorizado  # Puede ser None si no es delivery por moto
         self.costo = costo
-        self.fecha = fecha
+        self.fecha = fecha_de(fecha)  # Se convierte una sola vez; en envios.json se guarda como 'YYYY-MM-DD'
+        if self.fecha is None:
+            raise ValueError("el envío no tiene fecha")
+        self.servicio_normalizado = normalizar(servicio_envio)
+        self.motorizado_normalizado = normalizar(motorizado.get('nombre')) if motorizado else ""
 
     def __str__(self):
         motorizado_info = f"\nMotorizado: {self.motorizado}" if self.motorizado else "\nMotorizado: No aplica"
-        return (f"Orden de Compra: {self.orden_compra}\n"
+        return (f"ID: {self.id}\n"
+                f"Orden de Compra: {self.orden_compra}\n"
                 f"Servicio de Envío: {self.servicio_envio}\n"
                 f"{motorizado_info}\n"
                 f"Costo del Servicio: {self.costo}\n"
-                f"Fecha: {self.fecha.strftime('%Y-%m-%d')}")
+                f"Fecha: {self.fecha}")
+
+    def a_dict(self):
+        return {
+            'id': self.id,
+            'orden_compra': self.orden_compra,
+            'servicio_envio': self.servicio_envio,
+            'motorizado': self.motorizado,
+            'costo': self.costo,
+            'fecha': self.fecha.isoformat()
+        }
+
+    @classmethod
+    def desde_dict(cls, datos):
+        return cls(datos['orden_compra'], datos['servicio_envio'], datos.get('motorizado'), datos['costo'], datos['fecha'], datos.get('id'))
 
 class GestionEnvios:
     def __init__(self, archivo='envios.json'):
-        self.envios = []
+        self.envios = {}  # id -> envío, en el orden en que se registraron
+        self.ilegibles = []  # Datos guardados de los envíos que no se pudieron leer; se vuelven a escribir tal cual
+        self.bloqueo = threading.RLock()  # Protege los envíos y sus índices si se usan desde varios hilos
+        # Índices de los envíos; se mantienen al registrar y eliminar envíos
+        self.indice_orden = IndiceHash(lambda envio: envio.orden_compra)
+        self.indice_servicio = IndiceHash(lambda envio: envio.servicio_normalizado)
+        self.indice_motorizado = IndiceHash(lambda envio: envio.motorizado_normalizado)
+        self.indice_fecha = IndiceOrdenado(lambda envio: envio.fecha)
         self.archivo = archivo
+        self.almacen = crear_almacenamiento(archivo, campo_clave='id')
         self.cargar_envios()
+        vigilar(self)
+
+    def indices(self):
+        return (self.indice_orden, self.indice_servicio, self.indice_motorizado, self.indice_fecha)
 
     def cargar_envios(self):
         """Carga los envíos desde el archivo JSON al iniciar la clase."""
+        self.ilegibles = []
         try:
-            with open(self.archivo, 'r') as f:
-                self.envios = json.load(f)
+            envios = [envio for envio in map(self.envio_desde_dict, self.almacen.iterar()) if envio is not None]
         except (FileNotFoundError, json.JSONDecodeError):
-            self.envios = []  # Si el archivo no existe o está vacío, se inicializa una lista vacía
+            envios = []  # Si el archivo no existe o está vacío, no hay envíos
+        # Los ids de los envíos omitidos siguen en el archivo: no se reutilizan
+        self.almacen.ajustar_ids(max((datos['id'] for datos in self.ilegibles if isinstance(datos.get('id'), int)), default=0))
+        self.envios, asignados = self.almacen.numerar(envios)
+        for indice in self.indices():
+            indice.reconstruir(self.envios.values())
+        if asignados:  # Envíos guardados antes de que tuvieran id
+            reintentar(self.guardar_envios, self)
+
+    def envio_desde_dict(self, datos):
+        """Construye el envío guardado; None si sus datos no son válidos (el registro se conserva tal cual en el archivo)."""
+        try:
+            return Envio.desde_dict(datos)
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            print(f"Envío de la orden {datos.get('orden_compra')} con datos no válidos ({e}). Se omitirá este envío.")
+            self.ilegibles.append(datos)
+            return None
+
+    def refrescar(self):
+        """Aplica los envíos que registraron o eliminaron otras instancias (modo multiproceso), sin recargar todo."""
+        with self.bloqueo:
+            pendientes = self.almacen.cambios_pendientes()
+            if pendientes is None:
+                return self.cargar_envios()
+            cambios, generacion = pendientes
+            claves = {clave for clave, _ in cambios}
+            self.ilegibles = [datos for datos in self.ilegibles if datos.get('id') not in claves]
+            aplicar_cambios(self.envios, self.indices(), cambios, self.envio_desde_dict)
+            self.almacen.al_dia(generacion)
+
+    def serializar_envios(self):
+        return [envio.a_dict() for envio in self.envios.values()] + self.ilegibles
 
     def guardar_envios(self):
         """Guarda los envíos en el archivo JSON."""
-        with open(self.archivo, 'w') as f:
-            json.dump(self.envios, f, default=str, indent=4)
+        with self.bloqueo:
+            self.almacen.guardar(self.serializar_envios())
 
     def registrar_envio(self):
+        envio = self.agregar_envio(self.pedir_envio())
+        print(f"Envío registrado exitosamente con ID {envio.id}.")
+
+    def pedir_envio(self):
+        """Pide los datos del envío y lo devuelve sin guardarlo (ValueError si no son válidos)."""
         orden_compra = input("Ingrese el número de orden de compra: ")
         servicio_envio = input("Ingrese el servicio de envío (e.g. Zoom, Delivery por moto): ")
         
@@ -50,52 +142,124 @@ class GestionEnvios:
         costo = float(input("Ingrese el costo del servicio: "))
         fecha_str = input("Ingrese la fecha del envío (YYYY-MM-DD): ")
         fecha = datetime.strptime(fecha_str, '%Y-%m-%d')
+        return Envio(orden_compra, servicio_envio, motorizado, costo, fecha)
 
-        envio = {
-            'orden_compra': orden_compra,
-            'servicio_envio': servicio_envio,
-            'motorizado': motorizado,
-            'costo': costo,
-            'fecha': fecha.strftime('%Y-%m-%d')
-        }
-        
-        self.envios.append(envio)
-        self.guardar_envios()  # Guardar en el archivo JSON
-        print("Envío registrado exitosamente.")
+    def agregar_envio(self, envio):
+        """Le asigna un id nuevo al envío, lo indexa y lo guarda."""
+        return self.agregar_envios([envio])[0]
+
+    def agregar_envios(self, envios):
+        """Como agregar_envio, para varios envíos que se guardan con una sola escritura."""
+        def guardar():
+            with self.bloqueo:
+                self.incorporar_envios(envios)
+                registros = [envio.a_dict() for envio in envios]
+                firma = firma_actual(self.almacen)
+                try:
+                    self.almacen.aplicar([{"op": "agregar", "registro": registro} for registro in registros], self.serializar_envios)  # Guardar en el archivo JSON
+                except Conflicto:
+                    self.retirar_envios(envios)
+                    raise
+                registrar_cambios(self.almacen, 'envios', registros, 1, firma)  # Actualizar las estadísticas
+        reintentar(guardar, self)
+        return envios
+
+    def incorporar_envios(self, envios):
+        """Les asigna un id nuevo a los envíos y los agrega a la colección y a los índices, sin guardarlos."""
+        for envio in envios:
+            envio.id = self.almacen.siguiente_id()
+            self.envios[envio.id] = envio
+            for indice in self.indices():
+                indice.agregar(envio)
+
+    def retirar_envios(self, envios):
+        """Deshace incorporar_envios, si no se pudieron guardar."""
+        for envio in envios:
+            if self.envios.pop(envio.id, None) is not None:
+                for indice in self.indices():
+                    indice.quitar(envio)
 
     def eliminar_envio(self):
         if not self.envios:
             print("No hay envíos registrados para eliminar.")
             return
-        
-        self.mostrar_envios()  # Muestra los envíos para que el usuario elija
+
         try:
-            indice = int(input("Ingrese el número del envío que desea eliminar: ")) - 1
-            
-            if 0 <= indice < len(self.envios):
-                envio_eliminado = self.envios.pop(indice)
-                self.guardar_envios()  # Guarda los cambios en el archivo
-                print("Envío eliminado exitosamente.")
-                print(f"Envío eliminado: {envio_eliminado}")
-            else:
-                print("Número de envío no válido.")
+            id_envio = int(input("Ingrese el ID del envío que desea eliminar: "))
         except ValueError:
             print("Entrada no válida. Debe ingresar un número.")
+            return
+
+        envio_eliminado = self.quitar_envio(id_envio)
+        if envio_eliminado is not None:
+            print("Envío eliminado exitosamente.")
+            print(f"Envío eliminado:\n{envio_eliminado}")
+        else:
+            print("No se encontró un envío con ese ID.")
+
+    def quitar_envio(self, id_envio):
+        """Elimina el envío con ese id; devuelve el envío eliminado, o None si no existía."""
+        def quitar():
+            with self.bloqueo:
+                envio = self.envios.pop(id_envio, None)
+                if envio is None:
+                    return None
+                for indice in self.indices():
+                    indice.quitar(envio)
+                firma = firma_actual(self.almacen)
+                try:
+                    self.almacen.eliminar(envio.id, self.serializar_envios)  # Guarda los cambios en el archivo
+                except Conflicto:
+                    self.envios[envio.id] = envio
+                    for indice in self.indices():
+                        indice.agregar(envio)
+                    raise
+                registrar_cambio(self.almacen, 'envios', envio.a_dict(), -1, firma)
+            return envio
+        return reintentar(quitar, self)
+
+    def buscar_envios(self, cliente=None, fecha=None, orden_compra=None, servicio=None, motorizado=None, desde=None, hasta=None):
+        """Envíos que cumplen todos los filtros indicados, usando primero el índice más selectivo.
+
+        cliente busca por su cédula/RIF como orden de compra. fecha busca un día exacto; desde y hasta
+        (inclusivos) un rango. servicio y motorizado (su nombre) no distinguen mayúsculas ni espacios.
+        """
+        if cliente is not None:
+            orden_compra = cliente.cedula_rif
+        if fecha is not None:
+            desde = hasta = fecha
+        desde, hasta = fecha_de(desde), fecha_de(hasta)
+
+        filtros = []
+        if orden_compra is not None:
+            filtros.append((self.indice_orden.buscar(orden_compra), lambda envio: envio.orden_compra == orden_compra))
+        if desde is not None or hasta is not None:
+            filtros.append((self.indice_fecha.rango(desde, hasta),
+                            lambda envio: (desde is None or envio.fecha >= desde) and (hasta is None or envio.fecha <= hasta)))
+        if servicio is not None:
+            servicio = normalizar(servicio)
+            filtros.append((self.indice_servicio.buscar(servicio), lambda envio: envio.servicio_normalizado == servicio))
+        if motorizado is not None:
+            motorizado = normalizar(motorizado)
+            filtros.append((self.indice_motorizado.buscar(motorizado), lambda envio: envio.motorizado_normalizado == motorizado))
+        return consultar(self.envios.values(), filtros)
+
+    def envios_del_dia(self, dia=None, **filtros):
+        """Envíos de un día (hoy si no se indica), con los mismos filtros de buscar_envios."""
+        dia = fecha_de(dia) or date.today()
+        return self.buscar_envios(desde=dia, hasta=dia, **filtros)
 
-    def buscar_envios(self, cliente=None, fecha=None):
-        resultados = []
-        for envio in self.envios:
-            if (cliente is None or envio['orden_compra'] == cliente.cedula_rif) and \
-               (fecha is None or datetime.strptime(envio['fecha'], '%Y-%m-%d').date() == fecha):
-                resultados.append(envio)
-        return resultados
+    def envios_de_la_semana(self, dia=None, **filtros):
+        """Envíos de la semana (de lunes a domingo) que contiene el día indicado, o la actual."""
+        dia = fecha_de(dia) or date.today()
+        lunes = dia - timedelta(days=dia.weekday())
+        return self.buscar_envios(desde=lunes, hasta=lunes + timedelta(days=6), **filtros)
 
     def mostrar_envios(self):
         if not self.envios:
             print("No hay envíos registrados.")
         else:
-            for i, envio in enumerate(self.envios, start=1):
-                print(f"Envío {i}:")
+            for envio in self.envios.values():
                 print(envio)
                 print("-" * 30)
 
@@ -116,12 +280,13 @@ def menu_gestion_envios(gestion_envios, gestion_clientes):
         elif opcion == "2":
             print("Filtros de búsqueda:")
             cliente_rif = input("Ingrese la cédula o RIF del cliente (deje vacío para omitir): ")
-            fecha_str = input("Ingrese la fecha del envío (YYYY-MM-DD) (deje vacío para omitir): ")
+            desde = input("Ingrese la fecha inicial del envío (YYYY-MM-DD) (deje vacío para omitir): ")
+            hasta = input("Ingrese la fecha final del envío (YYYY-MM-DD) (deje vacío para usar la misma fecha inicial): ") or desde
+            servicio = input("Ingrese el servicio de envío (deje vacío para omitir): ")
+            motorizado = input("Ingrese el nombre del motorizado (deje vacío para omitir): ")
 
-            cliente = gestion_clientes.buscar_cliente(cliente_rif) if cliente_rif else None
-            fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date() if fecha_str else None
-            
-            resultados = gestion_envios.buscar_envios(cliente, fecha)
+            resultados = gestion_envios.buscar_envios(orden_compra=cliente_rif or None, desde=desde or None, hasta=hasta or None,
+                                                      servicio=servicio or None, motorizado=motorizado or None)
             if resultados:
                 for envio in resultados:
                     print(envio)
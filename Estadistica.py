@@ -1,154 +1,145 @@
-import json
-from datetime import datetime
-from collections import Counter
-import matplotlib.pyplot as plt
+import os
+from datetime import date, timedelta
+from Almacenamiento import crear_almacenamiento
+from Agregados import Agregados, obtener_agregados
+from Graficos import renderizador
+
+DIRECTORIO_GRAFICOS = os.environ.get('TIENDA_GRAFICOS')  # Si se define, los gráficos se guardan como imágenes en vez de mostrarse
+
+GRAFICOS = {  # tipo -> (título, etiqueta del eje y, color)
+    'ventas': ('Ventas Totales', 'Total de Ventas', 'blue'),
+    'pagos': ('Pagos Totales', 'Total de Pagos', 'green'),
+    'envios': ('Envíos Totales', 'Total de Envíos', 'orange'),
+}
+
+def rango_fechas(desde=None, hasta=None, dias=None):
+    """Convierte las fechas ('YYYY-MM-DD' o date) del rango; dias=N equivale a los últimos N días hasta hoy."""
+    if dias is not None:
+        desde = date.today() - timedelta(days=dias - 1)
+    desde = date.fromisoformat(desde) if isinstance(desde, str) else desde
+    hasta = date.fromisoformat(hasta) if isinstance(hasta, str) else hasta
+    return desde, hasta
 
 class Estadisticas:
-    def __init__(self, archivo_ventas='ventas.json', archivo_pagos='pagos.json', archivo_envios='envios.json'):
+    def __init__(self, archivo_ventas='ventas.json', archivo_pagos='pagos.json', archivo_envios='envios.json', archivo_productos='productos.json', directorio_graficos=None):
         self.archivo_ventas = archivo_ventas
         self.archivo_pagos = archivo_pagos
         self.archivo_envios = archivo_envios
-        self.ventas = []
-        self.pagos = []
-        self.envios = []
+        self.archivo_productos = archivo_productos
+        self.categorias = None  # nombre del producto en minúsculas -> categoría; se carga al filtrar por categoría
+        self.agregados = {}
+        self.almacenes = {}  # archivo -> almacenamiento, para no crearlo en cada consulta
+        self.directorio_graficos = directorio_graficos or DIRECTORIO_GRAFICOS
         self.cargar_datos()
 
     def cargar_datos(self):
-        """Carga los datos de ventas, pagos y envíos desde los archivos JSON."""
-        try:
-            with open(self.archivo_ventas, 'r', encoding='utf-8') as f:
-                self.ventas = json.load(f)
-        except FileNotFoundError:
-            print("Archivo de ventas no encontrado.")
-            self.ventas = []
+        """Carga los agregados de ventas, pagos y envíos; solo se recorren los datos si cambiaron por otra vía."""
+        for tipo in GRAFICOS:
+            self.cargar_agregados(tipo)
 
+    def cargar_agregados(self, tipo):
+        """Carga (o actualiza, si los datos cambiaron) los agregados de 'ventas', 'pagos' o 'envios'."""
+        archivo = {'ventas': self.archivo_ventas, 'pagos': self.archivo_pagos, 'envios': self.archivo_envios}[tipo]
         try:
-            with open(self.archivo_pagos, 'r', encoding='utf-8') as f:
-                self.pagos = json.load(f)
+            self.agregados[tipo] = obtener_agregados(self.almacen(archivo), tipo)
         except FileNotFoundError:
-            print("Archivo de pagos no encontrado.")
-            self.pagos = []
+            print(f"Archivo de {tipo} no encontrado.")
+            self.agregados[tipo] = Agregados(tipo)
 
-        try:
-            with open(self.archivo_envios, 'r', encoding='utf-8') as f:
-                self.envios = json.load(f)
-        except FileNotFoundError:
-            print("Archivo de envíos no encontrado.")
-            self.envios = []
+    def almacen(self, archivo):
+        """El almacenamiento del archivo, creado la primera vez que se usa (en SQLite, crearlo revisa el esquema)."""
+        if archivo not in self.almacenes:
+            self.almacenes[archivo] = crear_almacenamiento(archivo)
+        return self.almacenes[archivo]
+
+    # Los registros completos ya no hacen falta para las estadísticas; se leen solo si se piden
+    @property
+    def ventas(self):
+        return self.almacen(self.archivo_ventas).cargar()
+
+    @property
+    def pagos(self):
+        return self.almacen(self.archivo_pagos).cargar()
+
+    @property
+    def envios(self):
+        return self.almacen(self.archivo_envios).cargar()
 
     def ventas_totales(self, periodo='dia'):
         """Calcula las ventas totales por día, semana, mes o año."""
-        totales = Counter()
-        for venta in self.ventas:
-            fecha = datetime.strptime(venta['fecha'], '%Y-%m-%d')
-            if periodo == 'dia':
-                clave = fecha.date()
-            elif periodo == 'semana':
-                clave = fecha.strftime('%Y-%U')  # Año y número de semana
-            elif periodo == 'mes':
-                clave = fecha.strftime('%Y-%m')  # Año y mes
-            elif periodo == 'año':
-                clave = fecha.year
-            else:
-                raise ValueError("Periodo no válido.")
-            totales[clave] += venta['totales']['total']
-        return totales
-
-    def productos_mas_vendidos(self):
-        """Devuelve los productos más vendidos."""
-        productos = Counter()
-        for venta in self.ventas:
-            for producto, cantidad in venta['productos']:
-                productos[producto] += cantidad
-        return productos.most_common(10)  # Devuelve los 10 más vendidos
-
-    def clientes_mas_frecuentes(self):
-        """Devuelve los clientes más frecuentes."""
-        clientes = Counter()
-        for venta in self.ventas:
-            clientes[venta['cliente']['cedula_rif']] += 1
-        return clientes.most_common(10)  # Devuelve los 10 más frecuentes
+        return self.agregados['ventas'].por_periodo(periodo)
+
+    def categoria_producto(self, nombre):
+        if self.categorias is None:
+            self.categorias = {}
+            try:
+                for producto in self.almacen(self.archivo_productos).iterar():
+                    self.categorias.setdefault(producto['name'].lower(), producto['category'].lower())
+            except FileNotFoundError:
+                pass
+        return self.categorias.get(nombre.lower())
+
+    def productos_mas_vendidos(self, k=10, desde=None, hasta=None, categoria=None, dias=None):
+        """Devuelve los k productos más vendidos, opcionalmente en un rango de fechas (o los últimos días) y de una categoría."""
+        desde, hasta = rango_fechas(desde, hasta, dias)
+        incluir = None
+        if categoria:
+            incluir = lambda nombre: self.categoria_producto(nombre) == categoria.lower()
+        return self.agregados['ventas'].mas_frecuentes('productos', k, desde, hasta, incluir)
+
+    def clientes_mas_frecuentes(self, k=10, desde=None, hasta=None, dias=None):
+        """Devuelve los k clientes más frecuentes, opcionalmente en un rango de fechas (o los últimos días)."""
+        desde, hasta = rango_fechas(desde, hasta, dias)
+        return self.agregados['ventas'].mas_frecuentes('clientes', k, desde, hasta)
 
     def pagos_totales(self, periodo='dia'):
         """Calcula los pagos totales por día, semana, mes o año."""
-        totales = Counter()
-        for pago in self.pagos:
-            fecha = datetime.strptime(pago['fecha'], '%Y-%m-%d')
-            if periodo == 'dia':
-                clave = fecha.date()
-            elif periodo == 'semana':
-                clave = fecha.strftime('%Y-%U')
-            elif periodo == 'mes':
-                clave = fecha.strftime('%Y-%m')
-            elif periodo == 'año':
-                clave = fecha.year
-            else:
-                raise ValueError("Periodo no válido.")
-            totales[clave] += pago['monto']
-        return totales
+        return self.agregados['pagos'].por_periodo(periodo)
 
     def envios_totales(self, periodo='dia'):
         """Calcula los envíos totales por día, semana, mes o año."""
-        totales = Counter()
-        for envio in self.envios:
-            fecha = datetime.strptime(envio['fecha'], '%Y-%m-%d')
-            if periodo == 'dia':
-                clave = fecha.date()
-            elif periodo == 'semana':
-                clave = fecha.strftime('%Y-%U')
-            elif periodo == 'mes':
-                clave = fecha.strftime('%Y-%m')
-            elif periodo == 'año':
-                clave = fecha.year
-            else:
-                raise ValueError("Periodo no válido.")
-            totales[clave] += 1  # Contamos el número de envíos
-        return totales
+        return self.agregados['envios'].por_periodo(periodo)
 
-    def graficar_ventas(self, periodo='dia'):
-        """Genera un gráfico de las ventas totales por periodo."""
-        totales = self.ventas_totales(periodo)
+    def renderizar_grafico(self, tipo, periodo='dia', formato='png', archivo=None):
+        """Dibuja el gráfico sin pantalla en segundo plano y devuelve un Future con los bytes de la imagen."""
+        titulo, etiqueta_y, color = GRAFICOS[tipo]
+        totales = self.agregados[tipo].por_periodo(periodo)
+        return renderizador().renderizar(f'{titulo} por {periodo.capitalize()}', periodo.capitalize(), etiqueta_y,
+                                         list(totales.keys()), list(totales.values()), color, formato, archivo)
+
+    def graficar(self, tipo, periodo='dia'):
+        """Muestra el gráfico en pantalla, o lo guarda en el directorio de gráficos si se configuró uno."""
+        if self.directorio_graficos:
+            archivo = os.path.join(self.directorio_graficos, f'{tipo}_{periodo}.png')
+            return self.renderizar_grafico(tipo, periodo, archivo=archivo)
+
+        import matplotlib.pyplot as plt  # Se importa aquí para no pagar su carga al iniciar la aplicación
+
+        titulo, etiqueta_y, color = GRAFICOS[tipo]
+        totales = self.agregados[tipo].por_periodo(periodo)
         fechas = list(totales.keys())
         valores = list(totales.values())
 
         plt.figure(figsize=(10, 5))
-        plt.bar(fechas, valores, color='blue')
-        plt.title(f'Ventas Totales por {periodo.capitalize()}')
+        plt.bar(fechas, valores, color=color)
+        plt.title(f'{titulo} por {periodo.capitalize()}')
         plt.xlabel(periodo.capitalize())
-        plt.ylabel('Total de Ventas')
+        plt.ylabel(etiqueta_y)
         plt.xticks(rotation=45)
         plt.tight_layout()
         plt.show()
 
+    def graficar_ventas(self, periodo='dia'):
+        """Genera un gráfico de las ventas totales por periodo."""
+        return self.graficar('ventas', periodo)
+
     def graficar_pagos(self, periodo='dia'):
         """Genera un gráfico de los pagos totales por periodo."""
-        totales = self.pagos_totales(periodo)
-        fechas = list(totales.keys())
-        valores = list(totales.values())
-
-        plt.figure(figsize=(10, 5))
-        plt.bar(fechas, valores, color='green')
-        plt.title(f'Pagos Totales por {periodo.capitalize()}')
-        plt.xlabel(periodo.capitalize())
-        plt.ylabel('Total de Pagos')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.show()
+        return self.graficar('pagos', periodo)
 
     def graficar_envios(self, periodo='dia'):
         """Genera un gráfico de los envíos totales por periodo."""
-        totales = self.envios_totales(periodo)
-        fechas = list(totales.keys())
-        valores = list(totales.values())
-
-        plt.figure(figsize=(10, 5))
-        plt.bar(fechas, valores, color='orange')
-        plt.title(f'Envíos Totales por {periodo.capitalize()}')
-        plt.xlabel(periodo.capitalize())
-        plt.ylabel('Total de Envíos')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.show()
+        return self.graficar('envios', periodo)
 
 #Menu de las estadisticas
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class RenderizadorGraficos:
+    """Dibuja gráficos de barras sin pantalla (backend Agg) en un hilo de fondo.
+
+    La figura se reutiliza entre llamadas y cada imagen queda en una cache según un hash de
+    los datos graficados, así que pedir de nuevo un gráfico con los mismos datos no lo redibuja.
+    """
+
+    def __init__(self, tamano_cache=256):
+        # Un solo hilo dibuja, así la figura reutilizada nunca se usa desde dos hilos a la vez
+        self.ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="graficos")
+        self.figura = None
+        self.ejes = None
+        self.cache = OrderedDict()  # hash de los datos -> bytes de la imagen
+        self.tamano_cache = tamano_cache
+        self.bloqueo = threading.Lock()
+
+    def renderizar(self, titulo, etiqueta_x, etiqueta_y, claves, valores, color, formato="png", archivo=None):
+        """Devuelve un Future con los bytes de la imagen; si se indica archivo, también se escribe en él."""
+        datos = [titulo, etiqueta_x, etiqueta_y, [str(clave) for clave in claves], list(valores), color, formato]
+        clave_cache = hashlib.sha1(json.dumps(datos, ensure_ascii=False).encode("utf-8")).hexdigest()
+        with self.bloqueo:
+            imagen = self.cache.get(clave_cache)
+            if imagen is not None:
+                self.cache.move_to_end(clave_cache)
+
+        if imagen is None:
+            return self.ejecutor.submit(
+                self.dibujar, clave_cache, titulo, etiqueta_x, etiqueta_y, claves, valores, color, formato, archivo
+            )
+        if archivo is not None:
+            return self.ejecutor.submit(self.escribir, archivo, imagen)
+        futuro = Future()
+        futuro.set_result(imagen)
+        return futuro
+
+    def dibujar(self, clave_cache, titulo, etiqueta_x, etiqueta_y, claves, valores, color, formato, archivo):
+        if self.figura is None:
+            # Se usa Figure directamente (sin pyplot), que dibuja con Agg y no necesita pantalla
+            from matplotlib.figure import Figure
+            self.figura = Figure(figsize=(10, 5))
+            self.ejes = self.figura.add_subplot()
+
+        self.ejes.clear()
+        self.ejes.bar(claves, valores, color=color)
+        self.ejes.set_title(titulo)
+        self.ejes.set_xlabel(etiqueta_x)
+        self.ejes.set_ylabel(etiqueta_y)
+        self.ejes.tick_params(axis="x", labelrotation=45)
+        self.figura.tight_layout()
+
+        buffer = io.BytesIO()
+        self.figura.savefig(buffer, format=formato)
+        imagen = buffer.getvalue()
+
+        with self.bloqueo:
+            self.cache[clave_cache] = imagen
+            if len(self.cache) > self.tamano_cache:
+                self.cache.popitem(last=False)
+
+        if archivo is not None:
+            self.escribir(archivo, imagen)
+        return imagen
+
+    def escribir(self, archivo, imagen):
+        directorio = os.path.dirname(archivo)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with open(archivo, "wb") as f:
+            f.write(imagen)
+        return imagen
+
+
+_renderizador = None
+_bloqueo_renderizador = threading.Lock()
+
+
+def renderizador():
+    """Renderizador compartido por toda la aplicación."""
+    global _renderizador
+    with _bloqueo_renderizador:
+        if _renderizador is None:
+            _renderizador = RenderizadorGraficos()
+        return _renderizador
@@ -0,0 +1,117 @@
+from bisect import bisect_left, bisect_right
+
+
+class IndiceHash:
+    """Agrupa los registros por una clave (cédula/RIF, método de pago, ...) para buscarlos sin recorrer la lista."""
+
+    def __init__(self, clave):
+        self.clave = clave  # Función registro -> clave
+        self.grupos = {}
+
+    def reconstruir(self, registros):
+        self.grupos = {}
+        for registro in registros:
+            self.agregar(registro)
+
+    def agregar(self, registro):
+        self.grupos.setdefault(self.clave(registro), []).append(registro)
+
+    def quitar(self, registro):
+        clave = self.clave(registro)
+        grupo = self.grupos.get(clave, [])
+        if registro in grupo:
+            grupo.remove(registro)
+        if not grupo:
+            self.grupos.pop(clave, None)
+
+    def buscar(self, valor):
+        """Registros con esa clave, en el orden en que se agregaron (sin copiar la lista)."""
+        return self.grupos.get(valor, [])
+
+
+class Tramo:
+    """Registros entre dos posiciones de un índice ordenado; solo se copian si se recorren."""
+    __slots__ = ('registros', 'inicio', 'fin')
+
+    def __init__(self, registros, inicio, fin):
+        self.registros = registros
+        self.inicio = inicio
+        self.fin = fin
+
+    def __len__(self):
+        return self.fin - self.inicio
+
+    def __iter__(self):
+        return iter(self.registros[self.inicio:self.fin])
+
+
+class IndiceOrdenado:
+    """Mantiene los registros ordenados por una clave (la fecha, por ejemplo) para consultar rangos con bisect."""
+
+    def __init__(self, clave):
+        self.clave = clave  # Función registro -> clave comparable
+        self.claves = []
+        self.registros = []
+
+    def reconstruir(self, registros):
+        self.registros = sorted(registros, key=self.clave)  # Estable: a igual clave se mantiene el orden original
+        self.claves = [self.clave(registro) for registro in self.registros]
+
+    def agregar(self, registro):
+        clave = self.clave(registro)
+        posicion = bisect_right(self.claves, clave)  # Normalmente es el final, porque los registros llegan en orden
+        self.claves.insert(posicion, clave)
+        self.registros.insert(posicion, registro)
+
+    def quitar(self, registro):
+        clave = self.clave(registro)
+        posicion = bisect_left(self.claves, clave)
+        while posicion < len(self.claves) and self.claves[posicion] == clave:
+            if self.registros[posicion] is registro:
+                del self.claves[posicion]
+                del self.registros[posicion]
+                return
+            posicion += 1
+
+    def rango(self, desde=None, hasta=None):
+        """Registros con desde <= clave <= hasta (un extremo en None no limita), ordenados por la clave."""
+        inicio = 0 if desde is None else bisect_left(self.claves, desde)
+        fin = len(self.claves) if hasta is None else bisect_right(self.claves, hasta)
+        return Tramo(self.registros, inicio, max(inicio, fin))
+
+
+def aplicar_cambios(coleccion, indices, cambios, construir):
+    """Aplica en la colección (clave -> registro) y sus índices cambios guardados por otra instancia.
+
+    cambios son pares (clave, datos guardados), con datos None si el registro se eliminó; construir
+    convierte los datos guardados en el registro (o devuelve None si no son válidos, y no se agrega).
+    Un registro modificado conserva su lugar en la colección.
+    """
+    for clave, datos in cambios:
+        anterior = coleccion.get(clave)
+        if anterior is not None:
+            for indice in indices:
+                indice.quitar(anterior)
+        registro = None if datos is None else construir(datos)
+        if registro is None:
+            coleccion.pop(clave, None)
+            continue
+        coleccion[clave] = registro
+        for indice in indices:
+            indice.agregar(registro)
+
+
+def consultar(todos, filtros):
+    """Aplica los filtros usando primero el índice más selectivo.
+
+    Cada filtro es un par (candidatos, cumple): los registros que da su índice y una función que dice si
+    un registro cumple el filtro. Se parte de los candidatos del filtro con menos registros y sobre ellos
+    se comprueban los demás filtros, también del más al menos selectivo.
+    """
+    if not filtros:
+        return list(todos)
+    filtros = sorted(filtros, key=lambda filtro: len(filtro[0]))
+    resultado = list(filtros[0][0])
+    for _, cumple in filtros[1:]:
+        resultado = [registro for registro in resultado if cumple(registro)]
+    return resultado
@@ -1,14 +1,33 @@
+import threading
 from datetime import datetime
 from Cliente import GestionClientes, Cliente 
 import json
+from Almacenamiento import Conflicto, crear_almacenamiento, reintentar, vigilar
+from Agregados import firma_actual, registrar_cambio
+from Indices import IndiceHash, IndiceOrdenado, aplicar_cambios, consultar
+
+def fecha_de(valor):
+    """Convierte 'YYYY-MM-DD', date o datetime en date (None se mantiene)."""
+    if isinstance(valor, str):
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    if isinstance(valor, datetime):
+        return valor.date()
+    return valor
 
 class Pago:
-    def __init__(self, cliente, monto, moneda, tipo_pago, fecha):
+    __slots__ = ('id', 'cliente', 'monto', 'moneda', 'tipo_pago', 'fecha', 'dia', 'moneda_normalizada', 'tipo_pago_normalizado')  # Sin __dict__ por pago
+
+    def __init__(self, cliente, monto, moneda, tipo_pago, fecha, id=None):
+        self.id = id  # Lo asigna GestionPagos al registrar el pago
         self.cliente = cliente
         self.monto = monto
         self.moneda = moneda
         self.tipo_pago = tipo_pago
         self.fecha = fecha
+        # Se calculan una vez para no convertirlos en cada búsqueda
+        self.dia = fecha.date()
+        self.moneda_normalizada = moneda.lower()
+        self.tipo_pago_normalizado = tipo_pago.lower()
 
     def __str__(self):
         # Verificar si el cliente es jurídico y mostrar su razón social, ya que no poseen nombre ni apellido porque es una empresa
@@ -17,82 +36,133 @@ class Pago:
         else:
             cliente_info = f"{self.cliente.nombre} {self.cliente.apellido}"
 
-        return (f"Cliente: {cliente_info}\n"
+        return (f"ID: {self.id}\n"
+                f"Cliente: {cliente_info}\n"
                 f"Monto: {self.monto} {self.moneda}\n"
                 f"Tipo de Pago: {self.tipo_pago}\n"
                 f"Fecha: {self.fecha.strftime('%Y-%m-%d')}")
     
 class GestionPagos:
-    def __init__(self, archivo='pagos.json'):
-        self.pagos = []
+    def __init__(self, archivo='pagos.json', gestion_clientes=None):
+        self.pagos = {}  # id -> pago, en el orden en que se registraron
+        self.ilegibles = []  # Datos guardados de los pagos que no se pudieron leer; se vuelven a escribir tal cual
+        self.bloqueo = threading.RLock()  # Protege los pagos y sus índices si se usan desde varios hilos
+        self.gestion_clientes = gestion_clientes if gestion_clientes is not None else GestionClientes()
+        # Índices de los pagos; se mantienen al registrar y eliminar pagos
+        self.indice_cliente = IndiceHash(lambda pago: pago.cliente.cedula_rif)
+        self.indice_fecha = IndiceOrdenado(lambda pago: pago.dia)
+        self.indice_tipo_pago = IndiceHash(lambda pago: pago.tipo_pago_normalizado)
+        self.indice_moneda = IndiceHash(lambda pago: pago.moneda_normalizada)
         self.archivo = archivo
+        self.almacen = crear_almacenamiento(archivo, campo_clave='id')
         self.cargar_pagos()
+        vigilar(self)
 
     def cargar_pagos(self):
         """Carga los pagos desde el archivo JSON al iniciar la clase."""
+        pagos = []
+        self.ilegibles = []
         try:
-            with open(self.archivo, 'r') as f:
-                pagos_data = json.load(f)
-                for pago_data in pagos_data:
-                    cliente_data = pago_data.get('cliente', {})
-                    # Verifica que las claves necesarias existan
-                    if 'nombre' in cliente_data and 'apellido' in cliente_data and 'cedula_rif' in cliente_data:
-                        cliente = Cliente(
-                            nombre=cliente_data['nombre'],
-                            apellido=cliente_data['apellido'],
-                            cedula_rif=cliente_data['cedula_rif'],
-                            correo_electronico=cliente_data.get('correo_electronico', ''),
-                            direccion_envio=cliente_data.get('direccion_envio', ''),
-                            telefono=cliente_data.get('telefono', '')
-                        )
-                    else:
-                        print("Datos del cliente incompletos. Se omitirá este pago.")
-                        continue  # Salta este pago si faltan datos del cliente
-
-                    monto = pago_data.get('monto', 0)
-                    moneda = pago_data.get('moneda', 'No especificado')
-                    tipo_pago = pago_data.get('tipo_pago', 'No especificado')
-                    fecha_str = pago_data.get('fecha', None)
-
-                    if fecha_str:
-                        fecha = datetime.strptime(fecha_str, '%Y-%m-%d')
-                    else:
-                        print("Fecha no válida. Se omitirá este pago.")
-                        continue
-
-                    self.pagos.append(Pago(cliente, monto, moneda, tipo_pago, fecha))
+            pagos_data = self.almacen.iterar()
+            for pago_data in pagos_data:
+                pago = self.pago_desde_dict(pago_data)
+                if pago is not None:
+                    pagos.append(pago)
         except (FileNotFoundError, json.JSONDecodeError) as e:
             print(f"Error al cargar los pagos: {e}")
-            self.pagos = []  
+            pagos = []
+        # Los ids de los pagos omitidos siguen en el archivo: no se reutilizan
+        self.almacen.ajustar_ids(max((datos['id'] for datos in self.ilegibles if isinstance(datos.get('id'), int)), default=0))
+        self.pagos, asignados = self.almacen.numerar(pagos)
+        for indice in self.indices():
+            indice.reconstruir(self.pagos.values())
+        if asignados:  # Pagos guardados antes de que tuvieran id
+            reintentar(self.guardar_pagos, self)
+
+    def pago_desde_dict(self, pago_data):
+        """Construye el pago guardado; None si le faltan datos (el registro se conserva tal cual en el archivo)."""
+        cliente_data = pago_data.get('cliente') or {}
+        # Verifica que las claves necesarias existan
+        if isinstance(cliente_data, dict) and 'cedula_rif' in cliente_data:
+            # Todos los pagos de un cliente comparten el mismo objeto Cliente
+            cliente = self.gestion_clientes.resolver_cliente(cliente_data)
+        else:
+            print("Datos del cliente incompletos. Se omitirá este pago.")
+            self.ilegibles.append(pago_data)
+            return None  # Salta este pago si faltan datos del cliente
+
+        monto = pago_data.get('monto')
+        moneda = pago_data.get('moneda')
+        tipo_pago = pago_data.get('tipo_pago')
+        fecha_str = pago_data.get('fecha', None)
+
+        if monto is None:
+            monto = 0
+        if moneda is None:
+            moneda = 'No especificado'
+        if tipo_pago is None:
+            tipo_pago = 'No especificado'
+        if isinstance(monto, bool) or not isinstance(monto, (int, float)) or not isinstance(moneda, str) or not isinstance(tipo_pago, str):
+            print(f"Monto, moneda o tipo de pago no válidos ({monto!r}, {moneda!r}, {tipo_pago!r}). Se omitirá este pago.")
+            self.ilegibles.append(pago_data)
+            return None
+
+        try:
+            fecha = datetime.strptime(fecha_str, '%Y-%m-%d') if fecha_str else None
+        except (TypeError, ValueError):
+            fecha = None
+        if fecha is None:
+            print(f"Fecha no válida ({fecha_str}). Se omitirá este pago.")
+            self.ilegibles.append(pago_data)
+            return None
+
+        return Pago(cliente, monto, moneda, tipo_pago, fecha, pago_data.get('id'))
+
+    def refrescar(self):
+        """Aplica los pagos que registraron o eliminaron otras instancias (modo multiproceso), sin recargar todo."""
+        with self.bloqueo:
+            pendientes = self.almacen.cambios_pendientes()
+            if pendientes is None:
+                return self.cargar_pagos()
+            cambios, generacion = pendientes
+            claves = {clave for clave, _ in cambios}
+            self.ilegibles = [datos for datos in self.ilegibles if datos.get('id') not in claves]
+            aplicar_cambios(self.pagos, self.indices(), cambios, self.pago_desde_dict)
+            self.almacen.al_dia(generacion)
+
+    def indices(self):
+        return (self.indice_cliente, self.indice_fecha, self.indice_tipo_pago, self.indice_moneda)
+
+    def serializar_pago(self, pago):
+        cliente_data = {
+            'cedula_rif': pago.cliente.cedula_rif,
+            'correo_electronico': pago.cliente.correo_electronico,
+            'direccion_envio': pago.cliente.direccion_envio,
+            'telefono': pago.cliente.telefono
+        }
+
+        if hasattr(pago.cliente, 'razon_social') and pago.cliente.razon_social:
+            cliente_data['razon_social'] = pago.cliente.razon_social
+        else:
+            cliente_data['nombre'] = pago.cliente.nombre
+            cliente_data['apellido'] = pago.cliente.apellido
+
+        return {
+            'id': pago.id,
+            'cliente': cliente_data,
+            'monto': pago.monto,
+            'moneda': pago.moneda,
+            'tipo_pago': pago.tipo_pago,
+            'fecha': pago.fecha.strftime('%Y-%m-%d')
+        }
+
+    def serializar_pagos(self):
+        return [self.serializar_pago(pago) for pago in self.pagos.values()] + self.ilegibles
 
     def guardar_pagos(self):
         #Guarda los pagos en el archivo JSON
-        pagos_data = []
-        for pago in self.pagos:
-            cliente_data = {
-                'cedula_rif': pago.cliente.cedula_rif,
-                'correo_electronico': pago.cliente.correo_electronico,
-                'direccion_envio': pago.cliente.direccion_envio,
-                'telefono': pago.cliente.telefono
-            }
-        
-           
-            if hasattr(pago.cliente, 'razon_social') and pago.cliente.razon_social:
-                cliente_data['razon_social'] = pago.cliente.razon_social
-            else:
-                cliente_data['nombre'] = pago.cliente.nombre
-                cliente_data['apellido'] = pago.cliente.apellido
-        
-            pagos_data.append({
-                'cliente': cliente_data,
-                'monto': pago.monto, 
-                'moneda': pago.moneda,
-                'tipo_pago': pago.tipo_pago,
-                'fecha': pago.fecha.strftime('%Y-%m-%d')
-            })
-    
-        with open(self.archivo, 'w') as f:
-            json.dump(pagos_data, f, indent=4)
+        with self.bloqueo:
+            self.almacen.guardar(self.serializar_pagos())
 
     def registrar_pago(self, cliente):
         monto = float(input("Ingrese el monto del pago: "))
@@ -136,46 +206,96 @@ class GestionPagos:
         fecha_str = input("Ingrese la fecha del pago (YYYY-MM-DD): ")
         fecha = datetime.strptime(fecha_str, '%Y-%m-%d')
 
-        pago = Pago(cliente, monto, moneda, tipo_pago, fecha)
-        self.pagos.append(pago)
-        self.guardar_pagos()  # Guardar el pago en el archivo JSON
-        print("Pago registrado exitosamente.")
+        pago = self.agregar_pago(Pago(cliente, monto, moneda, tipo_pago, fecha))
+        print(f"Pago registrado exitosamente con ID {pago.id}.")
+
+    def agregar_pago(self, pago):
+        """Le asigna un id nuevo al pago, lo indexa y lo guarda."""
+        def guardar():
+            with self.bloqueo:
+                pago.id = self.almacen.siguiente_id()
+                self.pagos[pago.id] = pago
+                for indice in self.indices():
+                    indice.agregar(pago)
+                registro = self.serializar_pago(pago)
+                firma = firma_actual(self.almacen)
+                try:
+                    self.almacen.agregar(registro, self.serializar_pagos)  # Guardar el pago en el archivo JSON
+                except Conflicto:
+                    self.retirar_pago(pago)
+                    raise
+                registrar_cambio(self.almacen, 'pagos', registro, 1, firma)  # Actualizar las estadísticas
+        reintentar(guardar, self)
+        return pago
+
+    def retirar_pago(self, pago):
+        if self.pagos.pop(pago.id, None) is not None:
+            for indice in self.indices():
+                indice.quitar(pago)
 
     def eliminar_pago(self):
-        """Elimina un pago específico basado en la fecha y el monto."""
-        fecha_str = input("Ingrese la fecha del pago a eliminar (YYYY-MM-DD): ")
-        monto = float(input("Ingrese el monto del pago a eliminar: "))
-        
-        fecha = datetime.strptime(fecha_str, '%Y-%m-%d')
-        pago_a_eliminar = None
-        
-        for pago in self.pagos:
-            if pago.fecha.date() == fecha.date() and pago.monto == monto:
-                pago_a_eliminar = pago
-                break
-        
-        if pago_a_eliminar:
-            self.pagos.remove(pago_a_eliminar)
-            self.guardar_pagos()  # Guardar los cambios en el archivo JSON
+        """Elimina un pago por su ID (se muestra al registrarlo, al buscarlo y al listar los pagos)."""
+        try:
+            id_pago = int(input("Ingrese el ID del pago a eliminar: "))
+        except ValueError:
+            print("Entrada no válida. Debe ingresar un número.")
+            return
+
+        if self.quitar_pago(id_pago) is not None:
             print("Pago eliminado exitosamente.")
         else:
-            print("No se encontró un pago con la fecha y monto especificados.")
-
-    def buscar_pagos(self, cliente=None, fecha=None, tipo_pago=None, moneda=None):
-        resultados = []
-        for pago in self.pagos:
-            if (cliente is None or pago.cliente == cliente) and \
-               (fecha is None or pago.fecha.date() == fecha) and \
-               (tipo_pago is None or pago.tipo_pago.lower() == tipo_pago.lower()) and \
-               (moneda is None or pago.moneda.lower() == moneda.lower()):
-                resultados.append(pago)
-        return resultados
+            print("No se encontró un pago con ese ID.")
+
+    def quitar_pago(self, id_pago):
+        """Elimina el pago con ese id; devuelve el pago eliminado, o None si no existía."""
+        def quitar():
+            with self.bloqueo:
+                pago = self.pagos.get(id_pago)
+                if pago is None:
+                    return None
+                self.retirar_pago(pago)
+                firma = firma_actual(self.almacen)
+                try:
+                    self.almacen.eliminar(pago.id, self.serializar_pagos)  # Guardar los cambios en el archivo JSON
+                except Conflicto:
+                    self.pagos[pago.id] = pago
+                    for indice in self.indices():
+                        indice.agregar(pago)
+                    raise
+                registrar_cambio(self.almacen, 'pagos', self.serializar_pago(pago), -1, firma)
+            return pago
+        return reintentar(quitar, self)
+
+    def buscar_pagos(self, cliente=None, fecha=None, tipo_pago=None, moneda=None, desde=None, hasta=None):
+        """Pagos que cumplen todos los filtros indicados, usando primero el índice más selectivo.
+
+        fecha busca un día exacto; desde y hasta (inclusivos) un rango. Las fechas pueden ser
+        'YYYY-MM-DD', date o datetime. tipo_pago y moneda no distinguen mayúsculas.
+        """
+        if fecha is not None:
+            desde = hasta = fecha
+        desde, hasta = fecha_de(desde), fecha_de(hasta)
+
+        filtros = []
+        if cliente is not None:
+            cedula_rif = cliente.cedula_rif
+            filtros.append((self.indice_cliente.buscar(cedula_rif), lambda pago: pago.cliente.cedula_rif == cedula_rif))
+        if desde is not None or hasta is not None:
+            filtros.append((self.indice_fecha.rango(desde, hasta),
+                            lambda pago: (desde is None or pago.dia >= desde) and (hasta is None or pago.dia <= hasta)))
+        if tipo_pago is not None:
+            tipo_pago = tipo_pago.lower()
+            filtros.append((self.indice_tipo_pago.buscar(tipo_pago), lambda pago: pago.tipo_pago_normalizado == tipo_pago))
+        if moneda is not None:
+            moneda = moneda.lower()
+            filtros.append((self.indice_moneda.buscar(moneda), lambda pago: pago.moneda_normalizada == moneda))
+        return consultar(self.pagos.values(), filtros)
 
     def mostrar_pagos(self):
         if not self.pagos:
             print("No hay pagos registrados.")
         else:
-            for pago in self.pagos:
+            for pago in self.pagos.values():
                 print(pago)
                 print("-" * 30)
 
@@ -200,14 +320,15 @@ def menu_gestion_pagos(gestion_pagos, gestion_clientes):
         elif opcion == "2":
             print("Filtros de búsqueda:")
             cliente_rif = input("Ingrese la cédula o RIF del cliente (deje vacío para omitir): ")
-            fecha_str = input("Ingrese la fecha del pago (YYYY-MM-DD) (deje vacío para omitir): ")
+            desde = input("Ingrese la fecha inicial del pago (YYYY-MM-DD) (deje vacío para omitir): ")
+            hasta = input("Ingrese la fecha final del pago (YYYY-MM-DD) (deje vacío para usar la misma fecha inicial): ") or desde
             tipo_pago = input("Ingrese el tipo de pago (deje vacío para omitir): ")
             moneda = input("Ingrese la moneda del pago (deje vacío para omitir): ")
 
-            cliente = gestion_clientes.buscar_cliente(cliente_rif) if cliente_rif else None
-            fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date() if fecha_str else None
+            # Un cliente que ya no está registrado puede tener pagos; se busca por su cédula/RIF igualmente
+            cliente = (gestion_clientes.buscar_cliente(cliente_rif) or Cliente('', '', cliente_rif, '', '', '')) if cliente_rif else None
             
-            resultados = gestion_pagos.buscar_pagos(cliente, fecha, tipo_pago, moneda)
+            resultados = gestion_pagos.buscar_pagos(cliente, None, tipo_pago or None, moneda or None, desde or None, hasta or None)
             if resultados:
                 for pago in resultados:
                     print(pago)
@@ -227,6 +348,6 @@ def menu_gestion_pagos(gestion_pagos, gestion_clientes):
 
 if __name__ == "__main__":
     gestion_clientes = GestionClientes()  
-    gestion_pagos = GestionPagos()  
+    gestion_pagos = GestionPagos(gestion_clientes=gestion_clientes)  
 
     menu_gestion_pagos(gestion_pagos, gestion_clientes)
\ No newline at end of file
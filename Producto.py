@@ -1,7 +1,11 @@
-import json
-import requests
+import threading
+from contextlib import contextmanager
+from Almacenamiento import Conflicto, crear_almacenamiento, reintentar, vigilar
+from Busqueda import IndiceBusqueda
 
 class Producto:
+    __slots__ = ("id", "name", "description", "price", "category", "inventory", "compatible_vehicles")  # Sin __dict__ por producto
+
     def __init__(self, id, name, description, price, category, inventory, compatible_vehicles=None):
         self.id = id
         self.name = name
@@ -22,57 +26,164 @@ class Producto:
             "compatible_vehicles": self.compatible_vehicles
         }
 
+    @classmethod
+    def desde_dict(cls, datos):
+        return cls(
+            id=datos["id"],
+            name=datos["name"],
+            description=datos["description"],
+            price=datos["price"],
+            category=datos["category"],
+            inventory=datos["inventory"],
+            compatible_vehicles=datos.get("compatible_vehicles", [])
+        )
+
+CAMPOS_CATALOGO = ("name", "description", "price", "category", "inventory", "compatible_vehicles")  # Lo que se actualiza al sincronizar
+PESOS_BUSQUEDA = {"name": 3.0, "category": 2.0, "description": 1.0}  # Campos de la búsqueda de texto y cuánto vale cada uno
+
 class GestionProductos:
     def __init__(self):
-        self.productos = []
+        self.productos = {}  # id -> producto, en el orden en que se agregaron
+        self.indice_nombre = {}  # nombre en minúsculas -> lista de productos con ese nombre
+        self.indice_categoria = {}  # categoría en minúsculas -> lista de productos
+        self.buscador = None  # Índice de búsqueda de texto; se arma en la primera búsqueda (ver buscar_productos)
+        self.almacen = crear_almacenamiento("productos.json", campo_clave="id")
+        self.cliente_catalogo = None  # Se crea en la primera sincronización y reutiliza su sesión HTTP
+        self.bloqueo = threading.RLock()  # Protege los productos y sus índices si se usan desde varios hilos
+        # Un bloqueo por producto para el inventario; siempre se toman antes que self.bloqueo
+        self.bloqueos_productos = {}
+        self.bloqueo_bloqueos = threading.Lock()
+        self.bloqueo_refresco = threading.Lock()  # Un solo hilo a la vez aplica los cambios de otras instancias
         self.cargar_productos()
+        vigilar(self)
+
+    def indexar_producto(self, producto):
+        self.indice_nombre.setdefault(producto.name.lower(), []).append(producto)
+        self.indice_categoria.setdefault(producto.category.lower(), []).append(producto)
+        if self.buscador is not None:
+            self.buscador.agregar(producto.id, {campo: getattr(producto, campo) for campo in PESOS_BUSQUEDA})
+
+    def desindexar_producto(self, producto):
+        for indice, clave in ((self.indice_nombre, producto.name.lower()), (self.indice_categoria, producto.category.lower())):
+            lista = indice.get(clave, [])
+            if producto in lista:
+                lista.remove(producto)
+            if not lista:
+                indice.pop(clave, None)
+        if self.buscador is not None:
+            self.buscador.quitar(producto.id)
+
+    def incorporar_producto(self, producto):
+        self.productos[producto.id] = producto
+        self.indexar_producto(producto)
+
+    def retirar_producto(self, producto):
+        if self.productos.pop(producto.id, None) is not None:
+            self.desindexar_producto(producto)
 
     def cargar_productos(self):
         try:
-            with open("productos.json", "r") as f:
-                productos_data = json.load(f)
-                for producto_data in productos_data:
-                    producto = Producto(
-                        id=producto_data["id"],
-                        name=producto_data["name"],
-                        description=producto_data["description"],
-                        price=producto_data["price"],
-                        category=producto_data["category"],
-                        inventory=producto_data["inventory"],
-                        compatible_vehicles=producto_data.get("compatible_vehicles", [])
-                    )
-                    self.productos.append(producto)
+            self.productos, asignados = self.almacen.numerar(Producto.desde_dict(producto_data) for producto_data in self.almacen.iterar())
+            self.indice_nombre = {}
+            self.indice_categoria = {}
+            self.buscador = None
+            for producto in self.productos.values():
+                self.indexar_producto(producto)
+            if asignados:
+                reintentar(self.guardar_productos, self)
         except FileNotFoundError:
             print("Archivo no encontrado. Cargando productos desde la API...")
+            self.almacen.requiere_compactar = True
             self.cargar_productos_desde_api()
         except Exception as e:
             print(f"Error al cargar productos desde el archivo: {e}")
+            self.almacen.requiere_compactar = True
             self.cargar_productos_desde_api()
 
+    def refrescar(self):
+        """Aplica los productos que guardaron o eliminaron otras instancias (modo multiproceso), sin recargar todo.
+
+        Cada producto se cambia con su bloqueo tomado: una reserva en curso de ese producto termina antes, y
+        como al guardar ve el cambio ajeno sobre el mismo producto (Conflicto), se repite con el inventario nuevo.
+        Los productos modificados son los mismos objetos, con sus campos actualizados.
+        """
+        with self.bloqueo_refresco:
+            pendientes = self.almacen.cambios_pendientes()
+            if pendientes is None:
+                with self.bloqueo:
+                    return self.cargar_productos()
+            cambios, generacion = pendientes
+            for id_producto, datos in cambios:
+                with self.bloqueo_producto(id_producto), self.bloqueo:
+                    producto = self.productos.get(id_producto)
+                    if datos is None:
+                        if producto is not None:
+                            self.retirar_producto(producto)
+                    elif producto is None:
+                        self.incorporar_producto(Producto.desde_dict(datos))
+                    else:
+                        nuevo = Producto.desde_dict(datos)
+                        self.cambiar_campos(producto, {campo: getattr(nuevo, campo) for campo in CAMPOS_CATALOGO})
+            with self.bloqueo:
+                self.almacen.al_dia(generacion)
+
     def cargar_productos_desde_api(self):  #Importarse todos los productos de la API
+        self.sincronizar_catalogo(condicional=False)
+
+    def sincronizar_catalogo(self, condicional=True):
+        """Trae el catálogo de la API y lo combina con el local por id: actualiza los productos que cambiaron y agrega los nuevos.
+
+        Devuelve (agregados, actualizados), o None si no se pudo descargar el catálogo.
+        """
+        import requests  # Solo hace falta al sincronizar; así no retrasa el arranque
+        from Catalogo import ClienteCatalogo
+        if self.cliente_catalogo is None:
+            self.cliente_catalogo = ClienteCatalogo()
         try:
-            response = requests.get("https://raw.githubusercontent.com/Algoritmos-y-Programacion/api-proyecto/main/products.json")
-            response.raise_for_status()
-            productos_data = response.json()
-            for producto_data in productos_data:
-                producto = Producto(
-                    id=producto_data["id"],
-                    name=producto_data["name"],
-                    description=producto_data["description"],
-                    price=producto_data["price"],
-                    category=producto_data["category"],
-                    inventory=producto_data["inventory"],
-                    compatible_vehicles=producto_data.get("compatible_vehicles", [])
-                )
-                self.productos.append(producto)
+            productos_data, cambiado = self.cliente_catalogo.obtener(condicional)
         except requests.exceptions.RequestException as e: # Esto es para indicarle al usuario que hay algun error que hace que no se puedan importar datos de la API
             print(f"Error al cargar los productos desde la API: {e}")
+            return None
         except Exception as e:
             print(f"Error inesperado: {e}")
+            return None
+
+        if not cambiado:
+            print("El catálogo no cambió desde la última sincronización.")
+            return 0, 0
+
+        agregados = actualizados = 0
+        for producto_data in productos_data:
+            with self.bloqueo_producto(producto_data["id"]), self.bloqueo:
+                producto = self.buscar_producto_por_id(producto_data["id"])
+                if producto is None:
+                    self.incorporar_producto(Producto.desde_dict(producto_data))
+                    agregados += 1
+                    continue
+
+                cambios = {campo: valor for campo, valor in producto_data.items() if campo in CAMPOS_CATALOGO and getattr(producto, campo) != valor}
+                if cambios:
+                    self.desindexar_producto(producto)
+                    for campo, valor in cambios.items():
+                        setattr(producto, campo, valor)
+                    self.indexar_producto(producto)
+                    actualizados += 1
+
+        with self.bloqueo:
+            # Los ids del catálogo no se deben volver a generar para productos creados aquí
+            self.almacen.ajustar_ids(max(self.productos, default=0))
+        # Se escribe una sola vez, aunque hayan cambiado muchos productos
+        if agregados or actualizados or self.almacen.requiere_compactar:
+            reintentar(self.guardar_productos, self)
+        print(f"Catálogo sincronizado: {agregados} productos nuevos, {actualizados} actualizados.")
+        return agregados, actualizados
+
+    def serializar_productos(self):
+        return [producto.show() for producto in self.productos.values()]
 
     def guardar_productos(self):
-        with open("productos.json", "w") as f:
-            json.dump([producto.show() for producto in self.productos], f, indent=4)
+        with self.bloqueo:
+            self.almacen.guardar(self.serializar_productos())
 
     def agregar_producto(self):
         name = input("Ingrese el nombre del producto: ")
@@ -91,7 +202,7 @@ class GestionProductos:
         compatible_vehicles = input("Ingrese los vehículos compatibles (separados por comas): ").split(',')
 
         producto = Producto(
-            id=len(self.productos) + 1,
+            id=None,
             name=name,
             description=description,
             price=price,
@@ -99,61 +210,187 @@ class GestionProductos:
             inventory=inventory,
             compatible_vehicles=[vehiculo.strip() for vehiculo in compatible_vehicles]
         )
-        self.productos.append(producto)
-        self.guardar_productos()
-        print("Producto agregado exitosamente.")
+        self.registrar_producto(producto)
+        print(f"Producto agregado exitosamente con ID {producto.id}.")
+
+    def registrar_producto(self, producto):
+        """Agrega el producto con un id nuevo (nunca el de un producto eliminado) y lo guarda."""
+        def guardar():
+            with self.bloqueo:
+                producto.id = self.almacen.siguiente_id()
+                self.incorporar_producto(producto)
+                try:
+                    self.almacen.agregar(producto.show(), self.serializar_productos)
+                except Conflicto:
+                    self.retirar_producto(producto)
+                    raise
+        reintentar(guardar, self)
+        return producto
 
     def buscar_producto(self, name_producto):
-        for producto in self.productos:
-            if producto.name.lower() == name_producto.lower():
-                return producto
-        return None
+        productos = self.indice_nombre.get(name_producto.lower())
+        return productos[0] if productos else None
+
+    def buscar_producto_por_id(self, id_producto):
+        return self.productos.get(id_producto)
+
+    def buscar_productos_por_categoria(self, categoria):
+        return list(self.indice_categoria.get(categoria.lower(), []))
+
+    def buscar_productos(self, texto, cantidad=10):
+        """Los productos más relevantes para el texto, buscado en el nombre, la categoría y la descripción.
+
+        No distingue mayúsculas ni acentos, tolera errores de tipeo y la última palabra puede estar incompleta.
+        Devuelve hasta cantidad productos (todos los encontrados si es None), del más al menos relevante.
+        El índice se arma en la primera búsqueda y después se actualiza con cada alta, cambio o baja.
+        """
+        with self.bloqueo:
+            if self.buscador is None:
+                self.buscador = IndiceBusqueda(PESOS_BUSQUEDA)
+                for producto in self.productos.values():
+                    self.buscador.agregar(producto.id, {campo: getattr(producto, campo) for campo in PESOS_BUSQUEDA})
+            return [self.productos[id_producto] for id_producto, _ in self.buscador.buscar(texto, cantidad)]
 
     def modificar_producto(self):
         id_producto = int(input("Ingrese el ID del producto a modificar: "))
-        for producto in self.productos:
-            if producto.id == id_producto:
-                print("Producto encontrado:")
-                print(f"ID: {producto.id}, Nombre: {producto.name}, Descripción: {producto.description}, Precio: {producto.price}, Categoría: {producto.category}, Inventario: {producto.inventory}, Vehículos compatibles: {', '.join(producto.compatible_vehicles)}")
-                
-                # Modificar los atributos del producto
-                producto.name = input("Ingrese el nuevo nombre del producto (deje vacío para no modificar): ") or producto.name
-                producto.description = input("Ingrese la nueva descripción (deje vacío para no modificar): ") or producto.description
-                while True:
-                    precio_input = input("Ingrese el nuevo precio (deje vacío para no modificar): ")
-                    if precio_input == "":
-                        break
-                    try:
-                        producto.price = float(precio_input.replace(",", "."))
-                        break
-                    except ValueError:
-                        print("Error... Por favor, ingrese un precio válido (use '.' como separador decimal).")
-                
-                producto.category = input("Ingrese la nueva categoría (deje vacío para no modificar): ") or producto.category
-                inventory_input = input("Ingrese la nueva cantidad en inventario (deje vacío para no modificar): ")
-                if inventory_input != "":
-                    producto.inventory = int(inventory_input)
-                
-                compatible_vehicles_input = input("Ingrese los nuevos vehículos compatibles (separados por comas, deje vacío para no modificar): ")
-                if compatible_vehicles_input != "":
-                    producto.compatible_vehicles = [vehiculo.strip() for vehiculo in compatible_vehicles_input.split(',')]
-                
-                self.guardar_productos()
-                print("Producto modificado exitosamente.")
-                return
-        
-        print("Producto no encontrado.")
+        producto = self.buscar_producto_por_id(id_producto)
+        if producto is None:
+            print("Producto no encontrado.")
+            return
+
+        print("Producto encontrado:")
+        print(f"ID: {producto.id}, Nombre: {producto.name}, Descripción: {producto.description}, Precio: {producto.price}, Categoría: {producto.category}, Inventario: {producto.inventory}, Vehículos compatibles: {', '.join(producto.compatible_vehicles)}")
+
+        cambios = {}
+        name = input("Ingrese el nuevo nombre del producto (deje vacío para no modificar): ")
+        if name:
+            cambios["name"] = name
+        description = input("Ingrese la nueva descripción (deje vacío para no modificar): ")
+        if description:
+            cambios["description"] = description
+        while True:
+            precio_input = input("Ingrese el nuevo precio (deje vacío para no modificar): ")
+            if precio_input == "":
+                break
+            try:
+                cambios["price"] = float(precio_input.replace(",", "."))
+                break
+            except ValueError:
+                print("Error... Por favor, ingrese un precio válido (use '.' como separador decimal).")
+
+        category = input("Ingrese la nueva categoría (deje vacío para no modificar): ")
+        if category:
+            cambios["category"] = category
+        inventory_input = input("Ingrese la nueva cantidad en inventario (deje vacío para no modificar): ")
+        if inventory_input != "":
+            cambios["inventory"] = int(inventory_input)
+
+        compatible_vehicles_input = input("Ingrese los nuevos vehículos compatibles (separados por comas, deje vacío para no modificar): ")
+        if compatible_vehicles_input != "":
+            cambios["compatible_vehicles"] = [vehiculo.strip() for vehiculo in compatible_vehicles_input.split(',')]
+
+        self.actualizar_producto(producto.id, **cambios)
+        print("Producto modificado exitosamente.")
+
+    def actualizar_producto(self, id_producto, **cambios):
+        """Modifica los campos indicados del producto y lo guarda; devuelve el producto, o None si no existe."""
+        def actualizar():
+            with self.bloqueo_producto(id_producto), self.bloqueo:
+                producto = self.productos.get(id_producto)
+                if producto is None:
+                    return None
+                anteriores = {campo: getattr(producto, campo) for campo in cambios}
+                self.cambiar_campos(producto, cambios)
+                try:
+                    self.almacen.actualizar(producto.id, producto.show(), self.serializar_productos)
+                except Conflicto:
+                    self.cambiar_campos(producto, anteriores)
+                    raise
+            return producto
+        return reintentar(actualizar, self)
+
+    def cambiar_campos(self, producto, valores):
+        # Se saca de los índices antes de modificar el nombre o la categoría
+        self.desindexar_producto(producto)
+        for campo, valor in valores.items():
+            setattr(producto, campo, valor)
+        self.indexar_producto(producto)
+
+    def bloqueo_producto(self, id_producto):
+        with self.bloqueo_bloqueos:
+            return self.bloqueos_productos.setdefault(id_producto, threading.Lock())
+
+    @contextmanager
+    def bloquear_productos(self, ids_productos):
+        """Toma los bloqueos de esos productos mientras dura el bloque with, en orden de id para que dos
+        operaciones sobre el inventario no se esperen mutuamente. Se toman antes que self.bloqueo."""
+        bloqueos = [self.bloqueo_producto(id_producto) for id_producto in sorted(ids_productos)]
+        for bloqueo in bloqueos:
+            bloqueo.acquire()
+        try:
+            yield
+        finally:
+            for bloqueo in reversed(bloqueos):
+                bloqueo.release()
+
+    @contextmanager
+    def ajustar_inventario(self, cantidades):
+        """Suma al inventario (id del producto -> cantidad, negativa para descontar) mientras dura el bloque with.
+
+        Hay que tener tomados los bloqueos de esos productos (ver bloquear_productos); los que ya no existen
+        se omiten. El bloque recibe los cambios de los productos, para guardarlos en la misma transacción
+        que la venta; si el bloque termina con una excepción, el inventario vuelve a como estaba.
+        """
+        productos = [self.productos[id_producto] for id_producto in sorted(cantidades) if id_producto in self.productos]
+        for producto in productos:
+            producto.inventory += cantidades[producto.id]
+        try:
+            yield [{"op": "actualizar", "clave": producto.id, "registro": producto.show()} for producto in productos]
+        except BaseException:
+            for producto in productos:
+                producto.inventory -= cantidades[producto.id]
+            raise
+
+    @contextmanager
+    def reservar(self, cantidades):
+        """Reserva inventario (id del producto -> cantidad) mientras dura el bloque with.
+
+        Bloquea solo esos productos, comprueba que cada cantidad sea positiva y que alcance el inventario
+        (si no, lanza ValueError) y lo descuenta en memoria con ajustar_inventario.
+        """
+        with self.bloquear_productos(cantidades):
+            for id_producto in sorted(cantidades):
+                producto = self.productos.get(id_producto)
+                if producto is None:
+                    raise ValueError(f"Producto no encontrado: {id_producto}")
+                if cantidades[id_producto] <= 0:  # Una cantidad negativa aumentaría el inventario
+                    raise ValueError(f"Cantidad no válida de {producto.name}: {cantidades[id_producto]}")
+                if cantidades[id_producto] > producto.inventory:
+                    raise ValueError(f"Inventario insuficiente de {producto.name}: se piden {cantidades[id_producto]} y hay {producto.inventory}")
+            with self.ajustar_inventario({id_producto: -cantidad for id_producto, cantidad in cantidades.items()}) as cambios:
+                yield cambios
 
     def eliminar_producto(self):
         id_producto = int(input("Ingrese el ID del producto a eliminar: "))
-        for i, producto in enumerate(self.productos):
-            if producto.id == id_producto:
-                del self.productos[i]
-                self.guardar_productos()
-                print("Producto eliminado exitosamente.")
-                return
-        
-        print("Producto no encontrado.")
+        if self.quitar_producto(id_producto) is None:
+            print("Producto no encontrado.")
+            return
+        print("Producto eliminado exitosamente.")
+
+    def quitar_producto(self, id_producto):
+        """Elimina el producto con ese id; devuelve el producto eliminado, o None si no existía."""
+        def quitar():
+            with self.bloqueo_producto(id_producto), self.bloqueo:
+                producto = self.productos.get(id_producto)
+                if producto is not None:
+                    self.retirar_producto(producto)
+                    try:
+                        self.almacen.eliminar(producto.id, self.serializar_productos)
+                    except Conflicto:
+                        self.incorporar_producto(producto)
+                        raise
+            return producto
+        return reintentar(quitar, self)
 
 #Mneu de productos
 def menu_gestion_productos(gestion_productos):
@@ -164,17 +401,20 @@ def menu_gestion_productos(gestion_productos):
         print("3. Modificar Producto")
         print("4. Eliminar Producto")
         print("5. Mostrar Todos los Productos")
-        print("6. Salir")
+        print("6. Sincronizar Catálogo desde la API")
+        print("7. Salir")
 
         opcion = input("Seleccione una opción: ")
 
         if opcion == "1":
             gestion_productos.agregar_producto()
         elif opcion == "2":
-            nombre_producto = input("Ingrese el nombre del producto a buscar: ")
-            producto = gestion_productos.buscar_producto(nombre_producto)
-            if producto:
-                print(producto.show())
+            texto = input("Ingrese lo que busca (nombre, categoría o descripción del producto): ")
+            productos = gestion_productos.buscar_productos(texto)
+            if productos:
+                for producto in productos:
+                    print(producto.show())
+                    print("-" * 30)
             else:
                 print("Producto no encontrado.")
         elif opcion == "3":
@@ -183,12 +423,14 @@ def menu_gestion_productos(gestion_productos):
             gestion_productos.eliminar_producto()
         elif opcion == "5":
             if gestion_productos.productos:
-                for producto in gestion_productos.productos:
+                for producto in gestion_productos.productos.values():
                     print(producto.show())
                     print("-" * 30)
             else:
                 print("No hay productos registrados.")
         elif opcion == "6":
+            gestion_productos.sincronizar_catalogo()
+        elif opcion == "7":
             print("Gracias por usar el sistema de gestión de productos.")
             break
         else:
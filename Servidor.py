@@ -0,0 +1,573 @@
+"""Servicio HTTP/JSON de la tienda, para atender a varios usuarios a la vez (tienda web, otras cajas).
+
+Uso: python Servidor.py [puerto] [host]
+
+Usa los mismos gestores que el menú (GestionProductos, SistemaVentas, Estadisticas...). Las conexiones
+las atiende asyncio y se mantienen abiertas entre peticiones (keep-alive); cada petición se resuelve en
+un hilo del ejecutor, así una escritura que espera al disco no detiene a las demás.
+
+    GET    /productos?q=&categoria=&nombre=       GET /productos/<id>      (q: búsqueda de texto, por relevancia)
+    POST   /productos                              PATCH, DELETE /productos/<id>
+    GET    /clientes?correo=                       GET /clientes/<cedula_rif>
+    POST   /clientes                               PATCH, DELETE /clientes/<cedula_rif>
+    GET    /ventas?cedula_rif=&desde=&hasta=&metodo_pago=&tipo_moneda=      GET, DELETE /ventas/<id>
+    POST   /ventas      un pedido (como en SistemaVentas.ingresar_pedidos) o una lista de pedidos
+    GET    /pagos?cedula_rif=&fecha=&desde=&hasta=&tipo_pago=&moneda=       GET, DELETE /pagos/<id>
+    POST   /pagos       {"cedula_rif", "monto", "moneda", "tipo_pago", "fecha"}
+    GET    /envios?orden_compra=&fecha=&desde=&hasta=&servicio=&motorizado=  GET, DELETE /envios/<id>
+    POST   /envios      {"orden_compra", "servicio_envio", "motorizado", "costo", "fecha"}
+    GET    /estadisticas/<ventas|pagos|envios>?periodo=dia|semana|mes|año
+    GET    /estadisticas/productos?k=&desde=&hasta=&dias=&categoria=      (más vendidos)
+    GET    /estadisticas/clientes?k=&desde=&hasta=&dias=                  (más frecuentes)
+    GET    /estadisticas/graficos/<ventas|pagos|envios>?periodo=          (imagen PNG)
+
+Los listados se paginan con limite y desplazamiento y devuelven {"total": ..., "resultados": [...]}.
+Los errores devuelven {"error": "motivo"}: 400 si los datos no son válidos, 404 si no existe, 409 si choca
+con lo que ya está registrado (o con otra instancia, en modo multiproceso).
+"""
+
+import asyncio
+import json
+import os
+import re
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from functools import partial
+from http import HTTPStatus
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from App import App
+from Almacenamiento import Conflicto
+from Cliente import cliente_desde_dict
+from Envio import Envio
+from Estadistica import Estadisticas
+from Pago import Pago
+from Producto import Producto
+
+HOST = os.environ.get("TIENDA_HOST", "127.0.0.1")
+PUERTO = int(os.environ.get("TIENDA_PUERTO", "8000"))
+HILOS = int(os.environ.get("TIENDA_HILOS_SERVIDOR", "8"))  # Peticiones que se resuelven a la vez
+TIEMPO_INACTIVO = float(os.environ.get("TIENDA_TIEMPO_INACTIVO", "15"))  # Segundos que espera una conexión abierta sin peticiones
+MAXIMO_CUERPO = 16 * 1024 * 1024  # Bytes; alcanza para un lote grande de pedidos
+MAXIMO_CABECERAS = 100
+LIMITE_PAGINA = 100  # Resultados por página si no se indica limite
+MAXIMO_PAGINA = 10000
+
+TIPOS_PRODUCTO = {  # Campos que se pueden enviar al crear o modificar un producto, y su tipo
+    "name": str, "description": str, "price": float, "category": str, "inventory": int, "compatible_vehicles": list,
+}
+FALTA = object()
+
+
+class ErrorHTTP(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.mensaje = mensaje
+
+
+def valor(datos, nombre, tipo, predeterminado=FALTA):
+    """datos[nombre], comprobando que sea del tipo indicado (un int vale como float; un bool no vale como número)."""
+    if nombre not in datos:
+        if predeterminado is FALTA:
+            raise ErrorHTTP(400, f"Falta el campo {nombre}")
+        return predeterminado
+    dato = datos[nombre]
+    if tipo is float and isinstance(dato, int) and not isinstance(dato, bool):
+        dato = float(dato)
+    if not isinstance(dato, tipo) or (isinstance(dato, bool) and tipo is not bool):
+        raise ErrorHTTP(400, f"El campo {nombre} no es válido: {dato!r}")
+    return dato
+
+
+def objeto(datos):
+    if not isinstance(datos, dict):
+        raise ErrorHTTP(400, "Se esperaba un objeto JSON en el cuerpo de la petición")
+    return datos
+
+
+def entero(consulta, nombre, predeterminado):
+    if nombre not in consulta:
+        return predeterminado
+    try:
+        numero = int(consulta[nombre])
+    except ValueError:
+        numero = -1
+    if numero < 0:
+        raise ErrorHTTP(400, f"{nombre} debe ser un entero no negativo")
+    return numero
+
+
+def fecha(consulta, nombre):
+    """La fecha 'YYYY-MM-DD' del parámetro (o del campo del cuerpo), o None si no se indicó."""
+    texto = consulta.get(nombre)
+    if texto is None:
+        return None
+    try:
+        date.fromisoformat(texto)
+    except (TypeError, ValueError):
+        raise ErrorHTTP(400, f"{nombre} no es una fecha válida (YYYY-MM-DD): {texto}")
+    return texto
+
+
+def paginar(registros, consulta, serializar):
+    limite = min(entero(consulta, "limite", LIMITE_PAGINA), MAXIMO_PAGINA)
+    desplazamiento = entero(consulta, "desplazamiento", 0)
+    return {
+        "total": len(registros),
+        "resultados": [serializar(registro) for registro in registros[desplazamiento:desplazamiento + limite]],
+    }
+
+
+def validar_producto(datos, obligatorios):
+    """Los campos de producto del cuerpo, comprobados; obligatorios son los que no pueden faltar."""
+    desconocidos = set(datos) - set(TIPOS_PRODUCTO)
+    if desconocidos:
+        raise ErrorHTTP(400, f"Campos desconocidos: {', '.join(sorted(desconocidos))}")
+    for nombre in obligatorios:
+        valor(datos, nombre, TIPOS_PRODUCTO[nombre])
+    campos = {nombre: valor(datos, nombre, tipo) for nombre, tipo in TIPOS_PRODUCTO.items() if nombre in datos}
+    if campos.get("price", 0) < 0 or campos.get("inventory", 0) < 0:
+        raise ErrorHTTP(400, "El precio y el inventario no pueden ser negativos")
+    if not all(isinstance(vehiculo, str) for vehiculo in campos.get("compatible_vehicles", [])):
+        raise ErrorHTTP(400, "compatible_vehicles debe ser una lista de textos")
+    return campos
+
+
+async def leer_peticion(lector):
+    """Lee una petición HTTP/1.x: (método, destino, versión, cabeceras, cuerpo), o None si el cliente cerró."""
+    linea = await lector.readline()
+    while linea in (b"\r\n", b"\n"):  # Se toleran líneas vacías entre peticiones
+        linea = await lector.readline()
+    if not linea:
+        return None
+    try:
+        metodo, destino, version = linea.decode("latin-1").split()
+    except ValueError:
+        raise ErrorHTTP(400, "Línea de petición no válida")
+
+    cabeceras = {}
+    while True:
+        linea = await lector.readline()
+        if linea in (b"\r\n", b"\n", b""):
+            break
+        if len(cabeceras) >= MAXIMO_CABECERAS:
+            raise ErrorHTTP(431, "Demasiadas cabeceras")
+        nombre, separador, contenido = linea.decode("latin-1").partition(":")
+        if not separador:
+            raise ErrorHTTP(400, "Cabecera no válida")
+        cabeceras[nombre.strip().lower()] = contenido.strip()
+
+    if "transfer-encoding" in cabeceras:
+        raise ErrorHTTP(501, "Transfer-Encoding no soportado: envíe el cuerpo con Content-Length")
+    try:
+        largo = int(cabeceras.get("content-length", "0"))
+    except ValueError:
+        largo = -1
+    if largo < 0:
+        raise ErrorHTTP(400, "Content-Length no válido")
+    if largo > MAXIMO_CUERPO:
+        raise ErrorHTTP(413, f"El cuerpo supera el máximo de {MAXIMO_CUERPO} bytes")
+    cuerpo = await lector.readexactly(largo) if largo else b""
+    return metodo.upper(), destino, version.upper(), cabeceras, cuerpo
+
+
+def armar_respuesta(estado, cuerpo, tipo, mantener):
+    cabeceras = [
+        f"HTTP/1.1 {estado} {HTTPStatus(estado).phrase}",
+        f"Content-Type: {tipo}",
+        f"Content-Length: {len(cuerpo)}",
+        "Connection: keep-alive" if mantener else "Connection: close",
+    ]
+    if mantener:
+        cabeceras.append(f"Keep-Alive: timeout={int(TIEMPO_INACTIVO)}")
+    return ("\r\n".join(cabeceras) + "\r\n\r\n").encode("latin-1") + cuerpo
+
+
+def json_bytes(datos):
+    return json.dumps(datos, ensure_ascii=False, default=str).encode("utf-8")
+
+
+class Servidor:
+    """Atiende las peticiones HTTP con los gestores de una App (cargados al iniciar)."""
+
+    RUTAS = [  # (método, ruta, nombre del método que la atiende); los grupos de la ruta son sus argumentos
+        ("GET", r"/productos", "listar_productos"),
+        ("POST", r"/productos", "crear_producto"),
+        ("GET", r"/productos/(\d+)", "ver_producto"),
+        ("PATCH", r"/productos/(\d+)", "modificar_producto"),
+        ("DELETE", r"/productos/(\d+)", "eliminar_producto"),
+        ("GET", r"/clientes", "listar_clientes"),
+        ("POST", r"/clientes", "crear_cliente"),
+        ("GET", r"/clientes/([^/]+)", "ver_cliente"),
+        ("PATCH", r"/clientes/([^/]+)", "modificar_cliente"),
+        ("DELETE", r"/clientes/([^/]+)", "eliminar_cliente"),
+        ("GET", r"/ventas", "listar_ventas"),
+        ("POST", r"/ventas", "crear_ventas"),
+        ("GET", r"/ventas/(\d+)", "ver_venta"),
+        ("DELETE", r"/ventas/(\d+)", "eliminar_venta"),
+        ("GET", r"/pagos", "listar_pagos"),
+        ("POST", r"/pagos", "crear_pago"),
+        ("GET", r"/pagos/(\d+)", "ver_pago"),
+        ("DELETE", r"/pagos/(\d+)", "eliminar_pago"),
+        ("GET", r"/envios", "listar_envios"),
+        ("POST", r"/envios", "crear_envio"),
+        ("GET", r"/envios/(\d+)", "ver_envio"),
+        ("DELETE", r"/envios/(\d+)", "eliminar_envio"),
+        ("GET", r"/estadisticas/(ventas|pagos|envios)", "totales"),
+        ("GET", r"/estadisticas/productos", "productos_mas_vendidos"),
+        ("GET", r"/estadisticas/clientes", "clientes_mas_frecuentes"),
+        ("GET", r"/estadisticas/graficos/(ventas|pagos|envios)", "grafico"),
+    ]
+
+    def __init__(self, app=None, hilos=HILOS):
+        self.app = app or App()
+        self.ejecutor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="servidor")
+        self.rutas = [(metodo, re.compile(ruta), nombre) for metodo, ruta, nombre in self.RUTAS]
+        # Los gestores se cargan antes de aceptar conexiones: la App los crea sin bloqueos la primera vez que se usan
+        self.productos = self.app.gestion_productos
+        self.clientes = self.app.gestion_clientes
+        self.pagos = self.app.gestion_pagos
+        self.envios = self.app.gestion_envios
+        self.ventas = self.app.sistema_ventas
+        self.estadisticas = Estadisticas()
+        # Los agregados de cada tipo los modifican las escrituras de su gestor, con su bloqueo tomado
+        self.gestores_agregados = {"ventas": self.ventas, "pagos": self.pagos, "envios": self.envios}
+
+    async def atender(self, lector, escritor):
+        """Atiende las peticiones de una conexión, una tras otra, hasta que el cliente la cierre o quede inactiva."""
+        try:
+            while True:
+                try:
+                    peticion = await asyncio.wait_for(leer_peticion(lector), TIEMPO_INACTIVO)
+                except ErrorHTTP as e:
+                    escritor.write(armar_respuesta(e.estado, json_bytes({"error": e.mensaje}), "application/json", False))
+                    await escritor.drain()
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+                    break  # Inactiva, cerrada a mitad de una petición, o una línea más larga que el límite del lector
+                if peticion is None:
+                    break
+                metodo, destino, version, cabeceras, cuerpo = peticion
+                conexion = cabeceras.get("connection", "").lower()
+                mantener = "keep-alive" in conexion if version == "HTTP/1.0" else "close" not in conexion
+                estado, contenido, tipo = await self.responder(metodo, destino, cuerpo)
+                escritor.write(armar_respuesta(estado, contenido, tipo, mantener))
+                await escritor.drain()
+                if not mantener:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            escritor.close()
+            try:
+                await escritor.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def responder(self, metodo, destino, cuerpo):
+        """Resuelve la petición en un hilo del ejecutor y devuelve (estado, cuerpo, tipo de contenido)."""
+        partes = urlsplit(destino)
+        ruta = partes.path.rstrip("/") or "/"
+        consulta = dict(parse_qsl(partes.query))
+        try:
+            manejador, argumentos = self.enrutar(metodo, ruta)
+            try:
+                datos = json.loads(cuerpo) if cuerpo else None
+            except ValueError:
+                raise ErrorHTTP(400, "El cuerpo no es JSON válido")
+            resultado = await asyncio.get_running_loop().run_in_executor(
+                self.ejecutor, partial(manejador, *argumentos, consulta=consulta, datos=datos)
+            )
+        except ErrorHTTP as e:
+            return e.estado, json_bytes({"error": e.mensaje}), "application/json"
+        except Conflicto as e:
+            return 409, json_bytes({"error": str(e)}), "application/json"
+        except ValueError as e:  # Los gestores avisan así de datos no válidos (inventario insuficiente, fechas...)
+            return 400, json_bytes({"error": str(e)}), "application/json"
+        except Exception as e:
+            traceback.print_exc()
+            return 500, json_bytes({"error": f"Error interno: {e!r}"}), "application/json"
+        if len(resultado) == 3:
+            return resultado  # Ya viene con su tipo de contenido (las imágenes)
+        estado, respuesta = resultado
+        return estado, json_bytes(respuesta), "application/json"
+
+    def enrutar(self, metodo, ruta):
+        permitidos = []
+        for metodo_ruta, patron, nombre in self.rutas:
+            coincidencia = patron.fullmatch(ruta)
+            if coincidencia is None:
+                continue
+            if metodo_ruta == metodo:
+                return getattr(self, nombre), [unquote(grupo) for grupo in coincidencia.groups()]
+            permitidos.append(metodo_ruta)
+        if permitidos:
+            raise ErrorHTTP(405, f"Método no permitido; use {', '.join(permitidos)}")
+        raise ErrorHTTP(404, f"No existe la ruta {ruta}")
+
+    # Productos
+
+    def listar_productos(self, consulta, datos):
+        with self.productos.bloqueo:
+            if "q" in consulta:
+                productos = self.productos.buscar_productos(consulta["q"], None)
+                if "categoria" in consulta:
+                    categoria = consulta["categoria"].lower()
+                    productos = [producto for producto in productos if producto.category.lower() == categoria]
+            elif "categoria" in consulta:
+                productos = self.productos.buscar_productos_por_categoria(consulta["categoria"])
+            else:
+                productos = list(self.productos.productos.values())
+        if "nombre" in consulta:
+            nombre = consulta["nombre"].lower()
+            productos = [producto for producto in productos if producto.name.lower() == nombre]
+        return 200, paginar(productos, consulta, Producto.show)
+
+    def producto(self, id_producto):
+        producto = self.productos.buscar_producto_por_id(int(id_producto))
+        if producto is None:
+            raise ErrorHTTP(404, f"Producto no encontrado: {id_producto}")
+        return producto
+
+    def ver_producto(self, id_producto, consulta, datos):
+        return 200, self.producto(id_producto).show()
+
+    def crear_producto(self, consulta, datos):
+        campos = validar_producto(objeto(datos), ("name", "price", "category", "inventory"))
+        producto = Producto(id=None, **{"description": "", "compatible_vehicles": [], **campos})
+        return 201, self.productos.registrar_producto(producto).show()
+
+    def modificar_producto(self, id_producto, consulta, datos):
+        producto = self.productos.actualizar_producto(int(id_producto), **validar_producto(objeto(datos), ()))
+        if producto is None:
+            raise ErrorHTTP(404, f"Producto no encontrado: {id_producto}")
+        return 200, producto.show()
+
+    def eliminar_producto(self, id_producto, consulta, datos):
+        producto = self.productos.quitar_producto(int(id_producto))
+        if producto is None:
+            raise ErrorHTTP(404, f"Producto no encontrado: {id_producto}")
+        return 200, producto.show()
+
+    # Clientes
+
+    def listar_clientes(self, consulta, datos):
+        if "correo" in consulta:
+            cliente = self.clientes.buscar_cliente(correo_electronico=consulta["correo"])
+            clientes = [cliente] if cliente else []
+        else:
+            with self.clientes.bloqueo:
+                clientes = list(self.clientes.clientes.values())
+        return 200, paginar(clientes, consulta, lambda cliente: cliente.a_dict())
+
+    def cliente(self, cedula_rif):
+        cliente = self.clientes.buscar_cliente(cedula_rif)
+        if cliente is None:
+            raise ErrorHTTP(404, f"Cliente no encontrado: {cedula_rif}")
+        return cliente
+
+    def ver_cliente(self, cedula_rif, consulta, datos):
+        return 200, self.cliente(cedula_rif).a_dict()
+
+    def crear_cliente(self, consulta, datos):
+        datos = objeto(datos)
+        if not valor(datos, "cedula_rif", str).strip():
+            raise ErrorHTTP(400, "La cédula o RIF no puede estar vacía")
+        cliente = cliente_desde_dict(datos)
+        desconocidos = set(datos) - set(cliente.CAMPOS)
+        if desconocidos:
+            raise ErrorHTTP(400, f"Campos desconocidos: {', '.join(sorted(desconocidos))}")
+        for campo in cliente.CAMPOS:
+            valor(datos, campo, str, "")
+        if not self.clientes.guardar_cliente(cliente):
+            raise ErrorHTTP(409, "Ya existe un cliente con esa cédula/RIF o ese correo electrónico")
+        return 201, cliente.a_dict()
+
+    def modificar_cliente(self, cedula_rif, consulta, datos):
+        datos = objeto(datos)
+        cliente = self.cliente(cedula_rif)
+        desconocidos = set(datos) - (set(cliente.CAMPOS) - {"cedula_rif"})
+        if desconocidos:
+            raise ErrorHTTP(400, f"Campos que no se pueden modificar: {', '.join(sorted(desconocidos))}")
+        datos = {campo: valor(datos, campo, str) for campo in datos}
+        if "correo_electronico" in datos:
+            otro = self.clientes.buscar_cliente(correo_electronico=datos["correo_electronico"])
+            if otro is not None and otro is not cliente:
+                raise ErrorHTTP(409, "Ya existe un cliente con ese correo electrónico")
+        cliente = self.clientes.actualizar_cliente(cedula_rif, **datos)
+        if cliente is None:
+            raise ErrorHTTP(404, f"Cliente no encontrado: {cedula_rif}")
+        return 200, cliente.a_dict()
+
+    def eliminar_cliente(self, cedula_rif, consulta, datos):
+        cliente = self.clientes.quitar_cliente(cedula_rif)
+        if cliente is None:
+            raise ErrorHTTP(404, f"Cliente no encontrado: {cedula_rif}")
+        return 200, cliente.a_dict()
+
+    # Ventas
+
+    def listar_ventas(self, consulta, datos):
+        with self.ventas.bloqueo:
+            facturas = self.ventas.consultar_ventas(
+                cedula_rif=consulta.get("cedula_rif"), desde=fecha(consulta, "desde"), hasta=fecha(consulta, "hasta"),
+                metodo_pago=consulta.get("metodo_pago"), tipo_moneda=consulta.get("tipo_moneda"),
+            )
+        return 200, paginar(facturas, consulta, lambda factura: factura.a_dict())
+
+    def factura(self, id_venta):
+        factura = self.ventas.ventas.get(int(id_venta))
+        if factura is None:
+            raise ErrorHTTP(404, f"Venta no encontrada: {id_venta}")
+        return factura
+
+    def ver_venta(self, id_venta, consulta, datos):
+        return 200, self.factura(id_venta).a_dict()
+
+    def crear_ventas(self, consulta, datos):
+        """Un pedido devuelve su factura (201) o el motivo del rechazo (400); una lista de pedidos se ingresa por
+        lotes y devuelve las facturas registradas y los pedidos rechazados (por su número, desde 1)."""
+        if isinstance(datos, list):
+            registradas, rechazados = self.ventas.ingresar_pedidos(datos)
+            return 200, {
+                "registradas": [factura.a_dict() for factura in registradas],
+                "rechazados": [{"pedido": numero, "motivo": motivo} for numero, motivo in rechazados],
+            }
+        registradas, rechazados = self.ventas.ingresar_pedidos([objeto(datos)])
+        if rechazados:
+            raise ErrorHTTP(400, rechazados[0][1])
+        return 201, registradas[0].a_dict()
+
+    def eliminar_venta(self, id_venta, consulta, datos):
+        factura = self.ventas.quitar_venta(int(id_venta))
+        if factura is None:
+            raise ErrorHTTP(404, f"Venta no encontrada: {id_venta}")
+        return 200, factura.a_dict()
+
+    # Pagos
+
+    def listar_pagos(self, consulta, datos):
+        cliente = None
+        if "cedula_rif" in consulta:
+            # Los pagos pueden ser de clientes que ya no están registrados
+            cliente = self.clientes.buscar_cliente(consulta["cedula_rif"]) or self.clientes.externos.get(consulta["cedula_rif"])
+            if cliente is None:
+                return 200, paginar([], consulta, self.pagos.serializar_pago)
+        with self.pagos.bloqueo:
+            pagos = self.pagos.buscar_pagos(cliente=cliente, fecha=fecha(consulta, "fecha"), desde=fecha(consulta, "desde"),
+                                            hasta=fecha(consulta, "hasta"), tipo_pago=consulta.get("tipo_pago"),
+                                            moneda=consulta.get("moneda"))
+        return 200, paginar(pagos, consulta, self.pagos.serializar_pago)
+
+    def pago(self, id_pago):
+        pago = self.pagos.pagos.get(int(id_pago))
+        if pago is None:
+            raise ErrorHTTP(404, f"Pago no encontrado: {id_pago}")
+        return pago
+
+    def ver_pago(self, id_pago, consulta, datos):
+        return 200, self.pagos.serializar_pago(self.pago(id_pago))
+
+    def crear_pago(self, consulta, datos):
+        datos = objeto(datos)
+        cedula_rif = valor(datos, "cedula_rif", str)
+        cliente = self.clientes.buscar_cliente(cedula_rif)
+        if cliente is None:
+            raise ErrorHTTP(400, f"Cliente no encontrado: {cedula_rif}")
+        dia = fecha(datos, "fecha") or date.today().isoformat()
+        pago = Pago(cliente, valor(datos, "monto", float), valor(datos, "moneda", str), valor(datos, "tipo_pago", str),
+                    datetime.strptime(dia, "%Y-%m-%d"))
+        return 201, self.pagos.serializar_pago(self.pagos.agregar_pago(pago))
+
+    def eliminar_pago(self, id_pago, consulta, datos):
+        pago = self.pagos.quitar_pago(int(id_pago))
+        if pago is None:
+            raise ErrorHTTP(404, f"Pago no encontrado: {id_pago}")
+        return 200, self.pagos.serializar_pago(pago)
+
+    # Envíos
+
+    def listar_envios(self, consulta, datos):
+        with self.envios.bloqueo:
+            envios = self.envios.buscar_envios(orden_compra=consulta.get("orden_compra"), fecha=fecha(consulta, "fecha"),
+                                               desde=fecha(consulta, "desde"), hasta=fecha(consulta, "hasta"),
+                                               servicio=consulta.get("servicio"), motorizado=consulta.get("motorizado"))
+        return 200, paginar(envios, consulta, Envio.a_dict)
+
+    def envio(self, id_envio):
+        envio = self.envios.envios.get(int(id_envio))
+        if envio is None:
+            raise ErrorHTTP(404, f"Envío no encontrado: {id_envio}")
+        return envio
+
+    def ver_envio(self, id_envio, consulta, datos):
+        return 200, self.envio(id_envio).a_dict()
+
+    def crear_envio(self, consulta, datos):
+        datos = objeto(datos)
+        motorizado = valor(datos, "motorizado", dict) if datos.get("motorizado") is not None else None
+        envio = Envio(valor(datos, "orden_compra", str), valor(datos, "servicio_envio", str), motorizado,
+                      valor(datos, "costo", float), fecha(datos, "fecha") or date.today().isoformat())
+        return 201, self.envios.agregar_envio(envio).a_dict()
+
+    def eliminar_envio(self, id_envio, consulta, datos):
+        envio = self.envios.quitar_envio(int(id_envio))
+        if envio is None:
+            raise ErrorHTTP(404, f"Envío no encontrado: {id_envio}")
+        return 200, envio.a_dict()
+
+    # Estadísticas
+
+    def agregados(self, tipo):
+        """Bloqueo del gestor de ese tipo, con los agregados ya actualizados (se consultan con el bloqueo tomado)."""
+        bloqueo = self.gestores_agregados[tipo].bloqueo
+        with bloqueo:
+            self.estadisticas.cargar_agregados(tipo)
+        return bloqueo
+
+    def totales(self, tipo, consulta, datos):
+        with self.agregados(tipo):
+            totales = self.estadisticas.agregados[tipo].por_periodo(consulta.get("periodo", "dia"))
+        return 200, {str(clave): total for clave, total in sorted(totales.items())}
+
+    def productos_mas_vendidos(self, consulta, datos):
+        with self.agregados("ventas"):
+            productos = self.estadisticas.productos_mas_vendidos(
+                entero(consulta, "k", 10), fecha(consulta, "desde"), fecha(consulta, "hasta"),
+                consulta.get("categoria"), entero(consulta, "dias", None),
+            )
+        return 200, [{"producto": nombre, "cantidad": cantidad} for nombre, cantidad in productos]
+
+    def clientes_mas_frecuentes(self, consulta, datos):
+        with self.agregados("ventas"):
+            clientes = self.estadisticas.clientes_mas_frecuentes(
+                entero(consulta, "k", 10), fecha(consulta, "desde"), fecha(consulta, "hasta"), entero(consulta, "dias", None),
+            )
+        return 200, [{"cedula_rif": cedula_rif, "compras": compras} for cedula_rif, compras in clientes]
+
+    def grafico(self, tipo, consulta, datos):
+        with self.agregados(tipo):
+            futuro = self.estadisticas.renderizar_grafico(tipo, consulta.get("periodo", "dia"))
+        return 200, futuro.result(), "image/png"  # Lo dibuja el hilo de los gráficos; este solo espera la imagen
+
+    async def servir(self, host=HOST, puerto=PUERTO):
+        servidor = await asyncio.start_server(self.atender, host, puerto)
+        host, puerto = servidor.sockets[0].getsockname()[:2]
+        print(f"Tienda escuchando en http://{host}:{puerto}", flush=True)  # Con puerto 0, aquí se ve el elegido
+        async with servidor:
+            await servidor.serve_forever()
+
+
+if __name__ == "__main__":
+    puerto = int(sys.argv[1]) if len(sys.argv) > 1 else PUERTO
+    host = sys.argv[2] if len(sys.argv) > 2 else HOST
+    servidor = Servidor()
+    try:
+        asyncio.run(servidor.servir(host, puerto))
+    except KeyboardInterrupt:
+        print("Servidor detenido.")
+    finally:
+        servidor.ejecutor.shutdown(wait=True)
@@ -1,62 +1,176 @@
-from datetime import datetime
+import sys
+import threading
+from datetime import date, datetime
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 import json
-from Cliente import ClienteJuridico, Cliente, GestionClientes
+from Cliente import ClienteJuridico, Cliente, GestionClientes, cliente_desde_dict
 from Producto import GestionProductos
-from Envio import GestionEnvios
+from Envio import Envio, GestionEnvios
+from Almacenamiento import confirmar_transaccion, crear_almacenamiento, leer_registros, reintentar, vigilar
+from Agregados import firma_actual, registrar_cambio, registrar_cambios
+from Indices import IndiceHash, IndiceOrdenado, aplicar_cambios, consultar
 
-class Venta:
-    def __init__(self, cliente, productos, cantidades, metodo_pago, tipo_moneda, tipo_credito=None, fecha=None):
-        self.cliente = cliente
-        self.productos = productos
-        self.cantidades = cantidades
-        self.metodo_pago = metodo_pago
-        self.tipo_moneda = tipo_moneda
-        self.tipo_credito = tipo_credito  # Puede ser 'contado' o 'credito'
-        self.fecha = fecha if fecha else datetime.now().strftime("%Y-%m-%d")  # Usar la fecha proporcionada o la actual
-        self.factura = self.generar_factura()
+TOLERANCIA = 1e-6  # Diferencia máxima aceptada al comparar totales guardados y recalculados
+CAMPOS_TOTALES = ('subtotal', 'descuentos', 'iva', 'igtf', 'total')
+TAMANO_LOTE_PEDIDOS = 1000  # Pedidos que se guardan juntos al ingresarlos por lotes
+METODOS_PAGO = {  # Moneda -> métodos de pago aceptados
+    'divisas': ('efectivo', 'zelle', 'paypal'),
+    'bolivares': ('punto de venta', 'pago móvil', 'transferencia'),
+}
 
-    def calcular_totales(self):
-        subtotal = sum(p.price * c for p, c in zip(self.productos, self.cantidades))
-        descuento = 0
+def calcular_totales(precios, cantidades, es_juridico, metodo_pago, tipo_moneda, tipo_credito):
+    subtotal = sum(p * c for p, c in zip(precios, cantidades))
+    descuento = 0
 
-        # Aplicar descuento del 5% si es cliente jurídico y paga de contado
-        if isinstance(self.cliente, ClienteJuridico) and self.tipo_credito == 'contado':
-            descuento = subtotal * 0.05
+    # Aplicar descuento del 5% si es cliente jurídico y paga de contado
+    if es_juridico and tipo_credito == 'contado':
+        descuento = subtotal * 0.05
 
-        subtotal -= descuento
-        iva = subtotal * 0.16
+    subtotal -= descuento
+    iva = subtotal * 0.16
 
-        # Aplicar IGTF solo si el método de pago es en divisas
-        if self.tipo_moneda == 'divisas' and self.metodo_pago in ['zelle', 'paypal', 'efectivo']:
-            igtf = subtotal * 0.03
-        else:
-            igtf = 0
+    # Aplicar IGTF solo si el método de pago es en divisas
+    if tipo_moneda == 'divisas' and metodo_pago in ['zelle', 'paypal', 'efectivo']:
+        igtf = subtotal * 0.03
+    else:
+        igtf = 0
 
-        total = subtotal + iva + igtf
+    total = subtotal + iva + igtf
 
-        return {
-            'subtotal': subtotal,
-            'descuentos': descuento,
-            'iva': iva,
-            'igtf': igtf,
-            'total': total
-        }
+    return {
+        'subtotal': subtotal,
+        'descuentos': descuento,
+        'iva': iva,
+        'igtf': igtf,
+        'total': total
+    }
 
-    def generar_factura(self):
-        totales = self.calcular_totales()
-        factura = {
+class Factura:
+    """Factura de una venta con los mismos datos que se guardan en ventas.json, sin un diccionario por factura."""
+    __slots__ = ('id', 'cliente', 'productos', 'ids_productos', 'metodo_pago', 'tipo_moneda', 'tipo_credito', 'fecha', 'totales')
+
+    def __init__(self, cliente, productos, metodo_pago, tipo_moneda, tipo_credito, fecha, totales, id=None, ids_productos=None):
+        self.id = id  # Lo asigna SistemaVentas al registrar la venta
+        self.cliente = cliente  # Referencia al cliente, compartida por todas sus facturas
+        self.productos = productos  # Pares (nombre del producto, cantidad)
+        self.ids_productos = ids_productos  # Id de cada producto, en el mismo orden (None en facturas guardadas antes de tenerlos)
+        self.metodo_pago = metodo_pago
+        self.tipo_moneda = tipo_moneda
+        self.tipo_credito = tipo_credito
+        self.fecha = fecha
+        self.totales = totales  # Tupla en el orden de CAMPOS_TOTALES
+
+    @property
+    def cedula_rif(self):
+        return self.cliente.cedula_rif
+
+    def a_dict(self):
+        juridico = isinstance(self.cliente, ClienteJuridico)
+        return {
+            'id': self.id,
             'cliente': {
-                'razon_social' if isinstance(self.cliente, ClienteJuridico) else 'nombre': self.cliente.razon_social if isinstance(self.cliente, ClienteJuridico) else self.cliente.nombre,
+                'razon_social' if juridico else 'nombre': self.cliente.razon_social if juridico else self.cliente.nombre,
                 'cedula_rif': self.cliente.cedula_rif,
                 'tipo': self.cliente.__class__.__name__
             },
-            'productos': [(p.name, c) for p, c in zip(self.productos, self.cantidades)],
+            'productos': self.productos,
+            'ids_productos': self.ids_productos,
             'metodo_pago': self.metodo_pago,
             'tipo_moneda': self.tipo_moneda,
             'tipo_credito': self.tipo_credito,
             'fecha': self.fecha,
-            'totales': totales  #ESTO DE LOS TOTALES ES LA SUMA DEL IVA, IGTF, DESCUENTO, ETC.... QUE TERMINA DANTO EL PRECIO TOTAL.
+            'totales': dict(zip(CAMPOS_TOTALES, self.totales))
         }
+
+    @classmethod
+    def desde_dict(cls, datos, resolver_cliente=cliente_desde_dict):
+        """resolver_cliente recibe los datos del cliente guardados en la factura y devuelve el objeto Cliente."""
+        totales = datos.get('totales', {})
+        return cls(
+            resolver_cliente(datos['cliente']),
+            datos['productos'],
+            datos['metodo_pago'],
+            datos['tipo_moneda'],
+            datos.get('tipo_credito'),
+            datos['fecha'],
+            tuple(totales.get(campo) for campo in CAMPOS_TOTALES),
+            datos.get('id'),
+            datos.get('ids_productos')
+        )
+
+_precios_verificacion = {}
+
+def iniciar_verificacion(precios):
+    global _precios_verificacion
+    _precios_verificacion = precios
+
+def verificar_lote(lote):
+    """Recalcula los totales de un lote de (id de la venta, factura) con los precios actuales y devuelve las diferencias."""
+    precios = _precios_verificacion
+    discrepancias = []
+    for numero, factura in lote:
+        faltantes = [nombre for nombre, _ in factura.productos if nombre.lower() not in precios]
+        if faltantes:
+            discrepancias.append((numero, f"Productos no encontrados: {', '.join(faltantes)}"))
+            continue
+        totales = calcular_totales(
+            [precios[nombre.lower()] for nombre, _ in factura.productos],
+            [cantidad for _, cantidad in factura.productos],
+            isinstance(factura.cliente, ClienteJuridico),
+            factura.metodo_pago,
+            factura.tipo_moneda,
+            factura.tipo_credito
+        )
+        guardados = dict(zip(CAMPOS_TOTALES, factura.totales))
+        diferencias = [
+            f"{campo}: guardado {guardados.get(campo)}, calculado {valor}"
+            for campo, valor in totales.items()
+            if not isinstance(guardados.get(campo), (int, float)) or abs(guardados[campo] - valor) > TOLERANCIA
+        ]
+        if diferencias:
+            discrepancias.append((numero, "; ".join(diferencias)))
+    return discrepancias
+
+def leer_pedidos(origen):
+    """Pedidos de un archivo JSON (un arreglo) o JSON Lines, de a uno; con '-' se leen de la entrada estándar en JSON Lines."""
+    if origen == '-':
+        return (json.loads(linea) for linea in sys.stdin if linea.strip())
+    return leer_registros(origen)
+
+class Venta:
+    def __init__(self, cliente, productos, cantidades, metodo_pago, tipo_moneda, tipo_credito=None, fecha=None):
+        self.cliente = cliente
+        self.productos = productos
+        self.cantidades = cantidades
+        self.metodo_pago = metodo_pago
+        self.tipo_moneda = tipo_moneda
+        self.tipo_credito = tipo_credito  # Puede ser 'contado' o 'credito'
+        self.fecha = fecha if fecha else datetime.now().strftime("%Y-%m-%d")  # Usar la fecha proporcionada o la actual
+        self.factura = self.generar_factura()
+
+    def calcular_totales(self):
+        return calcular_totales(
+            [p.price for p in self.productos],
+            self.cantidades,
+            isinstance(self.cliente, ClienteJuridico),
+            self.metodo_pago,
+            self.tipo_moneda,
+            self.tipo_credito
+        )
+
+    def generar_factura(self):
+        totales = self.calcular_totales()
+        factura = Factura(
+            self.cliente,
+            [(p.name, c) for p, c in zip(self.productos, self.cantidades)],
+            self.metodo_pago,
+            self.tipo_moneda,
+            self.tipo_credito,
+            self.fecha,
+            tuple(totales[campo] for campo in CAMPOS_TOTALES),  #ESTO DE LOS TOTALES ES LA SUMA DEL IVA, IGTF, DESCUENTO, ETC.... QUE TERMINA DANTO EL PRECIO TOTAL.
+            ids_productos=[p.id for p in self.productos]
+        )
         return factura
 
 class SistemaVentas:
@@ -64,77 +178,102 @@ class SistemaVentas:
         self.gestion_clientes = gestion_clientes
         self.gestion_productos = gestion_productos
         self.gestion_envios = gestion_envios
-        self.ventas = []
+        self.ventas = {}  # id -> factura, en el orden en que se registraron
+        self.bloqueo = threading.RLock()  # Protege las ventas y sus índices si se usan desde varios hilos
+        # Índices de las facturas; se mantienen al registrar y eliminar ventas
+        self.indice_cliente = IndiceHash(lambda factura: factura.cedula_rif)
+        self.indice_fecha = IndiceOrdenado(lambda factura: factura.fecha)
+        self.indice_metodo_pago = IndiceHash(lambda factura: (factura.metodo_pago or '').lower())
+        self.indice_moneda = IndiceHash(lambda factura: (factura.tipo_moneda or '').lower())
         self.archivo_ventas = 'ventas.json'
+        self.almacen = crear_almacenamiento(self.archivo_ventas, campo_clave='id', ensure_ascii=False)
         self.cargar_ventas()
+        vigilar(self)
 
     def cargar_ventas(self):
+        ventas = []
         try:
-            with open(self.archivo_ventas, 'r', encoding='utf-8') as f:
-                ventas_data = json.load(f)
-                for venta_data in ventas_data:
-                    if venta_data['cliente']['tipo'] == 'ClienteJuridico':
-                        cliente = ClienteJuridico(
-                            razon_social=venta_data['cliente']['razon_social'],
-                            cedula_rif=venta_data['cliente']['cedula_rif'],
-                            correo_electronico=venta_data['cliente'].get('correo_electronico', None),
-                            direccion_envio=venta_data['cliente'].get('direccion_envio', None),
-                            telefono=venta_data['cliente'].get('telefono', None),
-                            nombre_contacto=venta_data['cliente'].get('nombre_contacto', None),
-                            telefono_contacto=venta_data['cliente'].get('telefono_contacto', None),
-                            correo_contacto=venta_data['cliente'].get('correo_contacto', None)
-                        )
-                    else:
-                        cliente = Cliente(
-                            nombre=venta_data['cliente']['nombre'],
-                            apellido=venta_data['cliente']['apellido'],
-                            cedula_rif=venta_data['cliente']['cedula_rif'],
-                            correo_electronico=venta_data['cliente'].get('correo_electronico', None),
-                            direccion_envio=venta_data['cliente'].get('direccion_envio', None),
-                            telefono=venta_data['cliente'].get('telefono', None)
-                        )
-                
-                    # Crear la venta
-                    productos = []
-                    cantidades = []
-                
-                    for producto_data in venta_data['productos']:
-                        nombre_producto = producto_data[0]
-                        cantidad = producto_data[1]
-                    
-                        # Buscar el objeto del producto en el sistema
-                        producto = self.gestion_productos.buscar_producto(nombre_producto)
-                        if producto is not None:
-                            productos.append(producto)  # Agregar el objeto del producto
-                            cantidades.append(cantidad)  # Agregar la cantidad
-                        else:
-                            print(f"Producto no encontrado: {nombre_producto}")
-
-                    # Crear la venta solo si se encontraron todos los productos
-                    if len(productos) == len(venta_data['productos']):
-                        venta = Venta(
-                            cliente,
-                            productos,
-                            cantidades,
-                            venta_data['metodo_pago'],
-                            venta_data['tipo_moneda'],
-                            venta_data.get('tipo_credito', None),
-                            fecha=venta_data['fecha']
-                        )
-                        self.ventas.append(venta.factura)
-                    else:
-                        print(f"Venta no registrada debido a productos no encontrados para el cliente: {cliente.cedula_rif}")
+            # Las facturas guardadas ya tienen sus totales; no se recalculan al cargar (ver verificar_ventas)
+            for datos in self.almacen.iterar():
+                try:
+                    # Todas las facturas de un cliente comparten el mismo objeto Cliente
+                    ventas.append(Factura.desde_dict(datos, self.gestion_clientes.resolver_cliente))
+                except (KeyError, TypeError, AttributeError):
+                    print("Datos de la venta incompletos. Se omitirá esta venta.")
+                    self.almacen.requiere_compactar = True
         except FileNotFoundError:
             print("No se encontró el archivo de ventas. Se creará uno nuevo.")
         except json.JSONDecodeError:
             print("Error al decodificar el archivo de ventas. Asegúrese de que el formato sea correcto.")
         except Exception as e:
             print(f"Error al cargar ventas: {e}")
+            self.almacen.requiere_compactar = True
+        self.ventas, asignados = self.almacen.numerar(ventas)
+        for indice in self.indices():
+            indice.reconstruir(self.ventas.values())
+        if asignados:  # Ventas guardadas antes de que tuvieran id
+            self.guardar_ventas()
+
+    def refrescar(self):
+        """Aplica las ventas que registraron o eliminaron otras instancias (modo multiproceso), sin recargar todo."""
+        with self.bloqueo:
+            pendientes = self.almacen.cambios_pendientes()
+            if pendientes is None:
+                return self.cargar_ventas()
+            cambios, generacion = pendientes
+            aplicar_cambios(self.ventas, self.indices(), cambios,
+                            lambda datos: Factura.desde_dict(datos, self.gestion_clientes.resolver_cliente))
+            self.almacen.al_dia(generacion)
+
+    def indices(self):
+        return (self.indice_cliente, self.indice_fecha, self.indice_metodo_pago, self.indice_moneda)
+
+    def consultar_ventas(self, cedula_rif=None, desde=None, hasta=None, metodo_pago=None, tipo_moneda=None):
+        """Facturas que cumplen todos los filtros indicados, usando los índices.
+
+        desde y hasta ('YYYY-MM-DD' o date) son inclusivos y pueden usarse por separado;
+        metodo_pago y tipo_moneda no distinguen mayúsculas.
+        """
+        filtros = []
+        if cedula_rif is not None:
+            filtros.append((self.indice_cliente.buscar(cedula_rif), lambda factura: factura.cedula_rif == cedula_rif))
+        if desde is not None or hasta is not None:
+            desde = desde.isoformat() if isinstance(desde, date) else desde
+            hasta = hasta.isoformat() if isinstance(hasta, date) else hasta
+            filtros.append((self.indice_fecha.rango(desde, hasta),
+                            lambda factura: (desde is None or factura.fecha >= desde) and (hasta is None or factura.fecha <= hasta)))
+        if metodo_pago is not None:
+            metodo_pago = metodo_pago.lower()
+            filtros.append((self.indice_metodo_pago.buscar(metodo_pago), lambda factura: (factura.metodo_pago or '').lower() == metodo_pago))
+        if tipo_moneda is not None:
+            tipo_moneda = tipo_moneda.lower()
+            filtros.append((self.indice_moneda.buscar(tipo_moneda), lambda factura: (factura.tipo_moneda or '').lower() == tipo_moneda))
+        return consultar(self.ventas.values(), filtros)
+
+    def verificar_ventas(self, procesos=None, tamano_lote=1000):
+        """Recalcula en paralelo los totales de todas las ventas y devuelve las que no coinciden con lo guardado."""
+        precios = {nombre: productos[0].price for nombre, productos in self.gestion_productos.indice_nombre.items()}
+        numeradas = list(self.ventas.items())
+        lotes = [numeradas[i:i + tamano_lote] for i in range(0, len(numeradas), tamano_lote)]
+
+        if len(lotes) <= 1:
+            iniciar_verificacion(precios)
+            resultados = [verificar_lote(lote) for lote in lotes]
+        else:
+            with ProcessPoolExecutor(max_workers=procesos, initializer=iniciar_verificacion, initargs=(precios,)) as ejecutor:
+                resultados = list(ejecutor.map(verificar_lote, lotes))
+
+        return [discrepancia for resultado in resultados for discrepancia in resultado]
+
+    def serializar_ventas(self):
+        return [factura.a_dict() for factura in self.ventas.values()]
 
     def guardar_ventas(self):
+        def guardar():
+            with self.bloqueo:
+                self.almacen.guardar(self.serializar_ventas())
         try:
-            with open(self.archivo_ventas, 'w', encoding='utf-8') as f:
-                json.dump(self.ventas, f, indent=4, ensure_ascii=False)
+            reintentar(guardar, self)
         except Exception as e:
             print(f"Error al guardar ventas: {e}")
 
@@ -157,7 +296,13 @@ class SistemaVentas:
             if not producto:
                 print("Producto no encontrado.")
                 continue
-            cantidad = int(input(f"Ingrese la cantidad de {producto.name}: "))
+            try:
+                cantidad = int(input(f"Ingrese la cantidad de {producto.name}: "))
+            except ValueError:
+                cantidad = 0
+            if cantidad <= 0:
+                print("La cantidad debe ser un número entero mayor que cero.")
+                continue
             productos.append(producto)
             cantidades.append(cantidad)
 
@@ -189,17 +334,245 @@ class SistemaVentas:
 
         # Crear la venta
         venta = Venta(cliente, productos, cantidades, metodo_pago, tipo_moneda, tipo_credito)
-        self.ventas.append(venta.factura)  # Agregar la factura de la venta a la lista de ventas
 
-        # Guardar las ventas en el archivo JSON
-        self.guardar_ventas()
+        # Datos del envío: se guarda en la misma transacción que la venta
+        try:
+            envio = self.gestion_envios.pedir_envio()
+        except ValueError as e:
+            print(f"Datos del envío no válidos: {e}")
+            return
 
-        # Registrar el envío
-        self.gestion_envios.registrar_envio()
+        try:
+            self.confirmar_ventas([venta], [envio])
+        except ValueError as e:  # No alcanzó el inventario; no se guardó nada
+            print(f"No se pudo registrar la venta: {e}")
+            return
+        except Exception as e:
+            print(f"Error al guardar ventas: {e}")
+            return
+        registro = venta.factura.a_dict()
+        print(f"Envío registrado exitosamente con ID {envio.id}.")
 
         # Mostrar la factura generada
         print("Factura generada:")
-        print(json.dumps(venta.factura, indent=4, ensure_ascii=False))
+        print(json.dumps(registro, indent=4, ensure_ascii=False))
+
+    def confirmar_ventas(self, ventas, envios=()):
+        """Registra las ventas descontando su inventario, y sus envíos, en una sola transacción: queda todo o nada.
+
+        Solo se bloquean los productos de estas ventas (ver GestionProductos.reservar), así que ventas de
+        productos distintos no se esperan entre sí mientras se reserva. Si no alcanza el inventario de algún
+        producto lanza ValueError sin guardar nada. Devuelve las facturas, ya con su id.
+
+        En modo multiproceso, si otra instancia guardó antes cambios que chocan (vendió los mismos productos,
+        por ejemplo), se aplican en memoria y las ventas se vuelven a intentar con el inventario actualizado.
+        """
+        return reintentar(lambda: self.intentar_confirmar(ventas, envios), self.gestion_productos, self, self.gestion_envios)
+
+    def intentar_confirmar(self, ventas, envios):
+        cantidades = {}
+        for venta in ventas:
+            for producto, cantidad in zip(venta.productos, venta.cantidades):
+                cantidades[producto.id] = cantidades.get(producto.id, 0) + cantidad
+        facturas = [venta.factura for venta in ventas]
+        gestion_productos = self.gestion_productos
+        gestion_envios = self.gestion_envios
+
+        with gestion_productos.reservar(cantidades) as cambios_productos:
+            with self.bloqueo, gestion_envios.bloqueo, gestion_productos.bloqueo:
+                for factura in facturas:
+                    factura.id = self.almacen.siguiente_id()
+                    self.ventas[factura.id] = factura
+                    for indice in self.indices():
+                        indice.agregar(factura)
+                gestion_envios.incorporar_envios(envios)
+                registros_ventas = [factura.a_dict() for factura in facturas]
+                registros_envios = [envio.a_dict() for envio in envios]
+                firma_ventas = firma_actual(self.almacen)
+                firma_envios = firma_actual(gestion_envios.almacen)
+                try:
+                    confirmar_transaccion([
+                        (self.almacen, [{"op": "agregar", "registro": registro} for registro in registros_ventas], self.serializar_ventas),
+                        (gestion_envios.almacen, [{"op": "agregar", "registro": registro} for registro in registros_envios], gestion_envios.serializar_envios),
+                        (gestion_productos.almacen, cambios_productos, gestion_productos.serializar_productos),
+                    ])
+                except BaseException:
+                    for factura in facturas:
+                        self.ventas.pop(factura.id, None)
+                        for indice in self.indices():
+                            indice.quitar(factura)
+                    gestion_envios.retirar_envios(envios)
+                    raise
+                # Actualizar las estadísticas
+                registrar_cambios(self.almacen, 'ventas', registros_ventas, 1, firma_ventas)
+                if registros_envios:
+                    registrar_cambios(gestion_envios.almacen, 'envios', registros_envios, 1, firma_envios)
+        return facturas
+
+    def preparar_pedido(self, pedido, reservado):
+        """Valida un pedido y devuelve su venta y su envío (None si no trae envío).
+
+        reservado (id del producto -> cantidad) lleva lo que tomaron los pedidos anteriores del lote;
+        si el pedido es válido se le suma lo que toma este. Si no es válido lanza ValueError con el motivo.
+        """
+        if not isinstance(pedido, dict):
+            raise ValueError("El pedido no es un objeto JSON")
+        cliente = self.gestion_clientes.buscar_cliente(str(pedido.get('cedula_rif', '')))
+        if not cliente:
+            raise ValueError(f"Cliente no encontrado: {pedido.get('cedula_rif')}")
+
+        tipo_moneda = str(pedido.get('tipo_moneda', '')).lower()
+        metodo_pago = str(pedido.get('metodo_pago', '')).lower()
+        if tipo_moneda not in METODOS_PAGO:
+            raise ValueError(f"Moneda no válida: {pedido.get('tipo_moneda')}")
+        if metodo_pago not in METODOS_PAGO[tipo_moneda]:
+            raise ValueError(f"Método de pago no válido para {tipo_moneda}: {pedido.get('metodo_pago')}")
+
+        tipo_credito = 'contado'  # Un cliente natural solo puede pagar al contado
+        if isinstance(cliente, ClienteJuridico):
+            tipo_credito = str(pedido.get('tipo_credito', 'contado')).lower()
+            if tipo_credito not in ('contado', 'credito'):
+                raise ValueError(f"Tipo de crédito no válido: {pedido.get('tipo_credito')}")
+
+        fecha = pedido.get('fecha') or datetime.now().strftime("%Y-%m-%d")
+        try:
+            date.fromisoformat(fecha)
+        except (TypeError, ValueError):
+            raise ValueError(f"Fecha no válida: {fecha}")
+
+        productos = []
+        cantidades = []
+        tomado = {}  # id del producto -> cantidad que pide este pedido
+        for item in pedido.get('productos') or []:
+            if not isinstance(item, dict):
+                raise ValueError(f"Producto no válido: {item}")
+            if 'id' in item:
+                producto = self.gestion_productos.buscar_producto_por_id(item['id'])
+            else:
+                producto = self.gestion_productos.buscar_producto(str(item.get('nombre', '')))
+            if producto is None:
+                raise ValueError(f"Producto no encontrado: {item.get('id', item.get('nombre'))}")
+            cantidad = item.get('cantidad')
+            if not isinstance(cantidad, int) or isinstance(cantidad, bool) or cantidad <= 0:
+                raise ValueError(f"Cantidad no válida de {producto.name}: {cantidad}")
+            productos.append(producto)
+            cantidades.append(cantidad)
+            tomado[producto.id] = tomado.get(producto.id, 0) + cantidad
+        if not productos:
+            raise ValueError("El pedido no tiene productos")
+        for id_producto, cantidad in tomado.items():
+            producto = self.gestion_productos.buscar_producto_por_id(id_producto)
+            disponible = producto.inventory - reservado.get(id_producto, 0)
+            if cantidad > disponible:
+                raise ValueError(f"Inventario insuficiente de {producto.name}: se piden {cantidad} y hay {disponible}")
+
+        envio = None
+        datos_envio = pedido.get('envio')
+        if datos_envio:
+            try:
+                envio = Envio(datos_envio.get('orden_compra', cliente.cedula_rif), datos_envio['servicio_envio'],
+                              datos_envio.get('motorizado'), float(datos_envio.get('costo', 0)), datos_envio.get('fecha') or fecha)
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"Envío no válido: {e!r}")
+
+        for id_producto, cantidad in tomado.items():
+            reservado[id_producto] = reservado.get(id_producto, 0) + cantidad
+        return Venta(cliente, productos, cantidades, metodo_pago, tipo_moneda, tipo_credito, fecha), envio
+
+    def ingresar_pedidos(self, pedidos, tamano_lote=TAMANO_LOTE_PEDIDOS):
+        """Registra pedidos sin preguntar nada, por ejemplo los que llegan de la tienda web o de un marketplace.
+
+        Cada pedido es un diccionario como:
+            {"cedula_rif": "V-123", "productos": [{"nombre": "Filtro de aire 5", "cantidad": 2}, {"id": 7, "cantidad": 1}],
+             "metodo_pago": "zelle", "tipo_moneda": "divisas", "tipo_credito": "contado", "fecha": "2024-12-01",
+             "envio": {"servicio_envio": "Zoom", "motorizado": null, "costo": 3.5}}
+        tipo_credito, fecha (hoy) y envio son opcionales. Los pedidos se procesan por lotes: se validan, se
+        facturan con calcular_totales, se descuenta el inventario y las ventas, los envíos y los productos de
+        cada lote se guardan juntos con confirmar_ventas (una escritura por colección). Un pedido no válido
+        no detiene el lote.
+
+        Devuelve (facturas registradas, [(número del pedido, motivo del rechazo)]).
+        """
+        registradas = []
+        rechazados = []
+        numerados = enumerate(pedidos, start=1)
+        while True:
+            lote = list(islice(numerados, tamano_lote))
+            if not lote:
+                return registradas, rechazados
+            registradas.extend(self.ingresar_lote(lote, rechazados))
+
+    def ingresar_lote(self, lote, rechazados):
+        reservado = {}
+        aceptados = []  # (número del pedido, venta, envío)
+        for numero, pedido in lote:
+            try:
+                venta, envio = self.preparar_pedido(pedido, reservado)
+            except ValueError as e:
+                rechazados.append((numero, str(e)))
+                continue
+            aceptados.append((numero, venta, envio))
+        if not aceptados:
+            return []
+
+        try:
+            return self.confirmar_ventas([venta for _, venta, _ in aceptados], [envio for _, _, envio in aceptados if envio is not None])
+        except ValueError:
+            # Otra venta tomó inventario mientras se validaba el lote: se confirma pedido por pedido
+            facturas = []
+            for numero, venta, envio in aceptados:
+                try:
+                    facturas += self.confirmar_ventas([venta], [envio] if envio is not None else [])
+                except ValueError as e:
+                    rechazados.append((numero, str(e)))
+            return facturas
+
+    def quitar_venta(self, id_venta):
+        """Elimina la venta con ese id y devuelve al inventario lo que se vendió, en una sola transacción;
+        devuelve la factura eliminada, o None si no existía.
+
+        Las cantidades vuelven a los productos por su id en la factura (en las facturas guardadas antes de tener
+        los ids, por su nombre); los productos que ya no existen se omiten.
+        """
+        gestion_productos = self.gestion_productos
+
+        def quitar():
+            while True:
+                with self.bloqueo:
+                    factura = self.ventas.get(id_venta)
+                if factura is None:
+                    return None
+                ids_productos = factura.ids_productos
+                if ids_productos is None:
+                    ids_productos = [getattr(gestion_productos.buscar_producto(nombre), 'id', None) for nombre, _ in factura.productos]
+                cantidades = {}  # id del producto -> cantidad vendida
+                for id_producto, (_, cantidad) in zip(ids_productos, factura.productos):
+                    if id_producto is not None:
+                        cantidades[id_producto] = cantidades.get(id_producto, 0) + cantidad
+
+                # Como al registrar: primero los bloqueos de los productos, después los de las colecciones
+                with gestion_productos.bloquear_productos(cantidades), self.bloqueo, gestion_productos.bloqueo:
+                    if self.ventas.get(id_venta) is not factura:
+                        continue  # Otro hilo la eliminó o la cambió mientras se esperaban los bloqueos
+                    del self.ventas[id_venta]
+                    for indice in self.indices():
+                        indice.quitar(factura)
+                    try:
+                        firma = firma_actual(self.almacen)
+                        with gestion_productos.ajustar_inventario(cantidades) as cambios_productos:
+                            confirmar_transaccion([
+                                (self.almacen, [{"op": "eliminar", "clave": factura.id}], self.serializar_ventas),
+                                (gestion_productos.almacen, cambios_productos, gestion_productos.serializar_productos),
+                            ])
+                    except BaseException:
+                        # No se guardó nada: la venta vuelve a memoria (ajustar_inventario ya restituyó el inventario)
+                        self.ventas[factura.id] = factura
+                        for indice in self.indices():
+                            indice.agregar(factura)
+                        raise
+                    registrar_cambio(self.almacen, 'ventas', factura.a_dict(), -1, firma)
+                    return factura
+        return reintentar(quitar, self)
 
     def ver_ventas(self):
         if not self.ventas:
@@ -207,42 +580,59 @@ class SistemaVentas:
             return
         
         print("Ventas registradas:")
-        for i, venta in enumerate(self.ventas, start=1):
-            print(f"\nVenta {i}:")
-            print(json.dumps(venta, indent=4, ensure_ascii=False))
+        for id_venta, venta in self.ventas.items():
+            print(f"\nVenta {id_venta}:")
+            print(json.dumps(venta.a_dict(), indent=4, ensure_ascii=False))
 
     def buscar_ventas(self):
-        criterio = input("Buscar por (1) Cliente o (2) Fecha: ")
+        criterio = input("Buscar por (1) Cliente, (2) Fecha, (3) Rango de fechas, (4) Método de pago o (5) Moneda: ")
         if criterio == '1':
             cedula_rif = input("Ingrese la cédula o RIF del cliente: ")
-            ventas_encontradas = [venta for venta in self.ventas if venta['cliente']['cedula_rif'] == cedula_rif]
-            if not ventas_encontradas:
-                print("No se encontraron ventas para el cliente especificado.")
-            else:
-                for venta in ventas_encontradas:
-                    print(json.dumps(venta, indent=4, ensure_ascii=False))
-        
+            ventas_encontradas = self.consultar_ventas(cedula_rif=cedula_rif)
+            mensaje = "No se encontraron ventas para el cliente especificado."
         elif criterio == '2':
             fecha_str = input("Ingrese la fecha de la venta (YYYY-MM-DD): ")
-            ventas_encontradas = [venta for venta in self.ventas if venta['fecha'] == fecha_str]
-            if not ventas_encontradas:
-                print("No se encontraron ventas para la fecha especificada.")
-            else:
-                for venta in ventas_encontradas:
-                    print(json.dumps(venta, indent=4, ensure_ascii=False))
+            ventas_encontradas = self.consultar_ventas(desde=fecha_str, hasta=fecha_str)
+            mensaje = "No se encontraron ventas para la fecha especificada."
+        elif criterio == '3':
+            desde = input("Ingrese la fecha inicial (YYYY-MM-DD, deje vacío para omitir): ") or None
+            hasta = input("Ingrese la fecha final (YYYY-MM-DD, deje vacío para omitir): ") or None
+            ventas_encontradas = self.consultar_ventas(desde=desde, hasta=hasta)
+            mensaje = "No se encontraron ventas en el rango de fechas especificado."
+        elif criterio == '4':
+            metodo_pago = input("Ingrese el método de pago: ")
+            ventas_encontradas = self.consultar_ventas(metodo_pago=metodo_pago)
+            mensaje = "No se encontraron ventas con el método de pago especificado."
+        elif criterio == '5':
+            tipo_moneda = input("Ingrese la moneda (divisas/bolivares): ")
+            ventas_encontradas = self.consultar_ventas(tipo_moneda=tipo_moneda)
+            mensaje = "No se encontraron ventas con la moneda especificada."
         else:
             print("Opción no válida.")
+            return
+
+        if not ventas_encontradas:
+            print(mensaje)
+        for venta in ventas_encontradas:
+            print(json.dumps(venta.a_dict(), indent=4, ensure_ascii=False))
 
     def eliminar_venta(self):
-        self.ver_ventas()
-        indice = int(input("Ingrese el número de la venta que desea eliminar: ")) - 1
-        if 0 <= indice < len(self.ventas):
-            venta_eliminada = self.ventas.pop(indice)
-            self.guardar_ventas()  
+        try:
+            id_venta = int(input("Ingrese el ID de la venta que desea eliminar: "))
+        except ValueError:
+            print("Entrada no válida. Debe ingresar un número.")
+            return
+
+        try:
+            factura = self.quitar_venta(id_venta)
+        except Exception as e:
+            print(f"Error al guardar ventas: {e}")
+            return
+        if factura is not None:
             print("Venta eliminada exitosamente.")
-            print(f"Venta eliminada: {json.dumps(venta_eliminada, indent=4, ensure_ascii=False)}")
+            print(f"Venta eliminada: {json.dumps(factura.a_dict(), indent=4, ensure_ascii=False)}")
         else:
-            print("Número de venta no válido.")
+            print("No se encontró una venta con ese ID.")
 
 #Menu de ventas
 def menu_sistema_ventas(sistema_ventas):
@@ -252,7 +642,8 @@ def menu_sistema_ventas(sistema_ventas):
         print("2. Ver Ventas")
         print("3. Buscar Ventas")
         print("4. Eliminar Venta") 
-        print("5. Salir")
+        print("5. Verificar Totales de Ventas")
+        print("6. Salir")
         
         opcion = input("Seleccione una opción: ")
         
@@ -265,6 +656,12 @@ def menu_sistema_ventas(sistema_ventas):
         elif opcion == "4":
             sistema_ventas.eliminar_venta() 
         elif opcion == "5":
+            discrepancias = sistema_ventas.verificar_ventas()
+            if not discrepancias:
+                print("Los totales de todas las ventas coinciden con los precios actuales.")
+            for numero, detalle in discrepancias:
+                print(f"Venta {numero}: {detalle}")
+        elif opcion == "6":
             print("Gracias por usar el sistema de ventas.")
             break
         else:
@@ -277,4 +674,12 @@ if __name__ == "__main__":
     
     sistema_ventas = SistemaVentas(gestion_clientes, gestion_productos, gestion_envios)
 
+    if len(sys.argv) >= 3 and sys.argv[1] == "ingresar":
+        # python Venta.py ingresar <pedidos.json | pedidos.jsonl | -> [tamaño del lote]
+        tamano_lote = int(sys.argv[3]) if len(sys.argv) > 3 else TAMANO_LOTE_PEDIDOS
+        registradas, rechazados = sistema_ventas.ingresar_pedidos(leer_pedidos(sys.argv[2]), tamano_lote)
+        for numero, motivo in rechazados:
+            print(f"Pedido {numero} rechazado: {motivo}")
+        print(f"{len(registradas)} ventas registradas, {len(rechazados)} pedidos rechazados.")
+        sys.exit(1 if rechazados else 0)
     menu_sistema_ventas(sistema_ventas)
\ No newline at end of file